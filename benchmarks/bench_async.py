@@ -0,0 +1,111 @@
+# benchmarks/bench_async.py
+#
+# Load test for todo_app.async_storage: N concurrent coroutines each run a mix
+# of reads and writes against a synthetic database, and the per-call latency
+# percentiles are reported as JSON. Run from the repository root:
+#
+#     python benchmarks/bench_async.py --concurrency 1000 --rows 10000
+#
+# "writes"/"commits" show how much group commit batched the concurrent writes.
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import DatasetSpec, load  # noqa: E402
+from todo_app import storage  # noqa: E402
+from todo_app.encoding import decode_id  # noqa: E402
+from todo_app.async_storage import AsyncStorage  # noqa: E402
+from todo_app.models import TodoCreate, TodoUpdate  # noqa: E402
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "mean_ms": statistics.mean(ordered) * 1000,
+    }
+
+
+async def _client(db: AsyncStorage, rng: random.Random, ids: List[str], ops: int, write_ratio: float,
+                  latencies: Dict[str, List[float]]):
+    for i in range(ops):
+        t0 = time.perf_counter()
+        if rng.random() < write_ratio:
+            if rng.random() < 0.5:
+                await db.insert_todo(TodoCreate(f"async load {i}", tags=["load"]))
+            else:
+                await db.update_todo(rng.choice(ids), TodoUpdate(priority=rng.randint(1, 5)))
+            kind = "write"
+        else:
+            if rng.random() < 0.8:
+                await db.get_by_id(rng.choice(ids))
+            else:
+                await db.get_page(status="TODO", limit=20)
+            kind = "read"
+        latencies[kind].append(time.perf_counter() - t0)
+
+
+async def _run(concurrency: int, ops: int, write_ratio: float, seed: int) -> Dict:
+    with storage._read() as conn:
+        ids = [decode_id(r[0]) for r in conn.execute("SELECT id FROM todos LIMIT 5000")]
+    db = AsyncStorage()
+    latencies: Dict[str, List[float]] = {"read": [], "write": []}
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        _client(db, random.Random(seed + n), ids, ops, write_ratio, latencies) for n in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - t0
+    stats = db.queue_stats()
+    await db.close()
+    return {
+        "concurrency": concurrency,
+        "ops_per_client": ops,
+        "seconds": elapsed,
+        "ops_per_second": concurrency * ops / elapsed,
+        "writes": stats["writes"],
+        "commits": stats["commits"],
+        "read": percentiles(latencies["read"]) if latencies["read"] else None,
+        "write": percentiles(latencies["write"]) if latencies["write"] else None,
+        "all": percentiles(latencies["read"] + latencies["write"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="async_storage load test")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=10, help="Calls per coroutine")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows loaded before the test")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    old_path = storage.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "bench.db")
+        storage.init_db()
+        load(DatasetSpec(rows=args.rows, seed=args.seed))
+        result = asyncio.run(_run(args.concurrency, args.ops, args.write_ratio, args.seed))
+        storage.close_pool()
+    storage.DB_PATH = old_path
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
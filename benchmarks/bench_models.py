@@ -0,0 +1,106 @@
+# benchmarks/bench_models.py
+#
+# Compare the eager, __dict__-based row conversion the app used to do with the
+# slotted, lazily decoded TodoItem. Run from the repository root:
+#
+#     python benchmarks/bench_models.py --rows 100000
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from todo_app import storage  # noqa: E402
+from todo_app.encoding import decode_id, decode_time, encode_id, encode_time  # noqa: E402
+
+
+# The pre-slots model and conversion, kept here as the baseline
+class EagerTodoItem:
+    def __init__(self, id, title, description, tags, status, priority, created_at, updated_at):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.tags = tags
+        self.status = status
+        self.priority = int(priority)
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+def eager_row_to_item(row):
+    return EagerTodoItem(
+        id=decode_id(row["id"]),
+        title=row["title"],
+        description=row["description"],
+        tags=json.loads(row["tags"]) if row["tags"] else [],
+        status=row["status"],
+        priority=int(row["priority"]) if "priority" in row.keys() else 3,
+        created_at=decode_time(row["created_at"]),
+        updated_at=decode_time(row["updated_at"]),
+    )
+
+
+def eager_get_all():
+    conn = sqlite3.connect(storage.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT * FROM todos ORDER BY created_at DESC").fetchall()
+    conn.close()
+    return [eager_row_to_item(r) for r in rows]
+
+
+def seed(n):
+    with storage.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO todos (id,title,description,tags,status,priority,created_at,updated_at) VALUES (?,?,?,?,?,?,?,?)",
+            ((encode_id(f"id-{i:08d}"), f"Todo {i}", "Some description", json.dumps(["work", f"t{i % 50}"]), "TODO",
+              i % 5 + 1, encode_time(f"2024-01-01T00:00:00.{i % 1000000:06d}"), encode_time("2024-01-01T00:00:00"))
+             for i in range(n)),
+        )
+
+
+def measure(fn, touch=None):
+    start = time.perf_counter()
+    items = fn()
+    if touch:
+        for item in items:
+            touch(item)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    items = fn()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, size / max(len(items), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TodoItem conversion benchmark")
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_PATH = os.path.join(tmp, "bench.db")
+        storage.init_db()
+        seed(args.rows)
+
+        def read_all(item):
+            item.tags, item.created_at, item.updated_at
+
+        results = [
+            ("eager (before)", measure(eager_get_all)),
+            ("lazy get_all, ids only", measure(storage.get_all)),
+            ("lazy get_all, all fields read", measure(storage.get_all, read_all)),
+        ]
+        storage.close_pool()
+
+    print(f"{args.rows} rows")
+    for name, (seconds, per_item) in results:
+        print(f"  {name:<32} {seconds * 1000:9.1f} ms  {per_item:7.0f} bytes/item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_startup.py
+#
+# Time CLI startup: each case runs the CLI in a fresh interpreter and the
+# median wall time is reported, together with the modules each command
+# imports. Run from the repository root:
+#
+#     python benchmarks/bench_startup.py --output startup.json
+#     python benchmarks/bench_startup.py --compare startup.json
+#
+# Results use the same layout as bench_storage.py, whose compare() flags
+# cases that got slower than the baseline (exit status 1).
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import compare  # noqa: E402
+
+# (name, CLI arguments); "python" is bare interpreter startup, for reference
+CASES = [
+    ("python", None),
+    ("help", ["--help"]),
+    ("add_help", ["add", "--help"]),
+    ("list_tags", ["list-tags"]),
+    ("add", ["add", "startup bench", "--tags", "bench"]),
+]
+
+# Modules that simple commands should not need to import
+HEAVY_MODULES = ("sqlite3", "csv", "uuid", "json", "base64", "concurrent.futures", "todo_app.storage")
+
+
+def _command(args):
+    if args is None:
+        return [sys.executable, "-c", "pass"]
+    return [sys.executable, "-m", "todo_app.main", *args]
+
+
+# Measure an installed app's usual case, with cached bytecode
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+# Names of the modules imported while running `args`, from -X importtime
+def imported_modules(args, cwd: str) -> List[str]:
+    cmd = _command(args)
+    proc = subprocess.run([cmd[0], "-X", "importtime", *cmd[1:]], cwd=cwd, env=_env(),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    names = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and not line.rstrip().endswith("imported package"):
+            names.append(line.rsplit("|", 1)[1].strip())
+    return names
+
+
+def time_case(args, cwd: str, repeat: int) -> Dict:
+    samples = []
+    # The first, untimed run writes the bytecode caches
+    subprocess.run(_command(args), cwd=cwd, env=_env(), stdout=subprocess.DEVNULL, check=True)
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(_command(args), cwd=cwd, env=_env(), stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - t0)
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples), "runs": repeat}
+
+
+def run(repeat: int) -> Dict:
+    cases = {}
+    heavy = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run(_command(["init-db"]), cwd=tmp, env=_env(), stdout=subprocess.DEVNULL, check=True)
+        for name, args in CASES:
+            cases[name] = time_case(args, tmp, repeat)
+            if args is not None:
+                modules = imported_modules(args, tmp)
+                heavy[name] = [m for m in HEAVY_MODULES if m in modules]
+            print(f"  {name:<12} {cases[name]['median'] * 1000:8.1f} ms  {' '.join(heavy.get(name, []))}", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {"startup": {"cases": cases, "heavy_imports": heavy}},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per case")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging, e.g. 0.2 = 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.min_delta_ms / 1000)
+        for _size, name, base, now, ratio in regressions:
+            print(f"REGRESSION {name}: {base * 1000:.1f} ms -> {now * 1000:.1f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+# benchmarks/bench_storage.py
+#
+# Time the public storage API against synthetic databases of several sizes and
+# write the results as JSON. Run from the repository root:
+#
+#     python benchmarks/bench_storage.py --sizes 1000,100000 --output results.json
+#     python benchmarks/bench_storage.py --sizes 1000,100000 --compare results.json
+#
+# With --compare, any case whose median is more than --threshold (default 20%)
+# and --min-delta-ms slower than in the baseline file is reported and the exit
+# status is 1. The default sizes include 1M rows, which takes a while to load.
+import argparse
+import csv
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import DatasetSpec, generate_rows, load  # noqa: E402
+from todo_app import storage  # noqa: E402
+from todo_app.encoding import decode_id  # noqa: E402
+from todo_app.models import TodoCreate, TodoUpdate  # noqa: E402
+
+DEFAULT_SIZES = "1000,100000,1000000"
+
+
+class Context:
+    # What the cases need to know about the loaded dataset
+    def __init__(self, spec: DatasetSpec, tmpdir: str):
+        self.spec = spec
+        self.tmpdir = tmpdir
+        with storage._read() as conn:
+            self.ids = [decode_id(r[0]) for r in conn.execute("SELECT id FROM todos ORDER BY id LIMIT 2000")]
+        self.common_tag = "tag0"
+        self.rare_tag = spec.tags()[-1]
+        self.sample_file = os.path.join(tmpdir, "sample")
+        self._write_samples()
+
+    # Small files for the import cases, so imports cost the same at every size
+    def _write_samples(self):
+        rows = list(generate_rows(DatasetSpec(rows=1000, seed=self.spec.seed + 1)))
+        records = [dict(zip(storage.COLUMNS, r)) for r in rows]
+        for r in records:
+            r["tags"] = json.loads(r["tags"])
+            del r["id"]
+        with open(self.sample_file + ".json", "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        with open(self.sample_file + ".ndjson", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+        with open(self.sample_file + ".csv", "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(storage.COLUMNS)
+            writer.writerows(rows)
+
+    def id(self, i: int) -> str:
+        return self.ids[i % len(self.ids)]
+
+
+class Case(NamedTuple):
+    name: str
+    # Called with (ctx, iteration); only the call itself is timed
+    op: Callable[[Context, int], object]
+    # Iterations per timed sample, for calls too fast to time individually
+    inner: int = 1
+
+
+def _insert(ctx, i):
+    storage.insert_todo(TodoCreate(f"bench insert {i}", "d", ["bench"], 3))
+
+def _get_by_id_uncached(ctx, i):
+    size = storage.CACHE_SIZE
+    storage.configure_cache(maxsize=0)
+    try:
+        for j in range(100):
+            storage.get_by_id(ctx.id(i * 100 + j))
+    finally:
+        storage.configure_cache(maxsize=size)
+
+def _get_by_id_cached(ctx, i):
+    for j in range(100):
+        storage.get_by_id(ctx.id(j))
+
+def _update(ctx, i):
+    storage.update_todo(ctx.id(i), TodoUpdate(title=f"bench update {i}", priority=i % 5 + 1))
+
+def _rename_tag(ctx, i):
+    old, new = (ctx.rare_tag, "bench-renamed") if i % 2 == 0 else ("bench-renamed", ctx.rare_tag)
+    storage.rename_tag(old, new)
+
+def _delete_tag(ctx, i):
+    tid = ctx.id(i)
+    storage.update_todo(tid, TodoUpdate(tags=["bench-delete"]))
+    storage.delete_tag_from_all("bench-delete")
+
+def _delete(ctx, i):
+    todo = storage.insert_todo(TodoCreate("bench delete"))
+    storage.delete_todo(todo.id)
+
+def _bulk_delete(ctx, i):
+    ids = [storage.insert_todo(TodoCreate("bench bulk delete")).id for _ in range(100)]
+    storage.bulk_delete(ids)
+
+def _export(fmt):
+    def op(ctx, i):
+        getattr(storage, f"export_todos_{fmt}")(os.path.join(ctx.tmpdir, f"export.{fmt}"))
+    return op
+
+def _import(fmt):
+    def op(ctx, i):
+        getattr(storage, f"import_todos_{fmt}")(f"{ctx.sample_file}.{fmt}")
+    return op
+
+
+# Read-only cases first; cases that change the data run last and keep the
+# table size roughly constant.
+CASES: List[Case] = [
+    Case("get_by_id_uncached_x100", _get_by_id_uncached),
+    Case("get_by_id_cached_x100", _get_by_id_cached),
+    Case("get_all", lambda ctx, i: storage.get_all()),
+    Case("get_by_status", lambda ctx, i: storage.get_by_status("IN_PROGRESS")),
+    Case("get_by_priority", lambda ctx, i: storage.get_by_priority(1)),
+    Case("get_all_sorted_by_priority", lambda ctx, i: storage.get_all_sorted_by_priority()),
+    Case("search_by_title", lambda ctx, i: storage.search_by_title("invoice")),
+    Case("search_by_tag_common", lambda ctx, i: storage.search_by_tag(ctx.common_tag)),
+    Case("search_by_tag_rare", lambda ctx, i: storage.search_by_tag(ctx.rare_tag)),
+    Case("search_text", lambda ctx, i: storage.search_text("deploy release", 50)),
+    Case("get_page_first", lambda ctx, i: storage.get_page(limit=50)),
+    Case("iter_todos_1000", lambda ctx, i: sum(1 for _ in storage.iter_todos(limit=1000))),
+    Case("list_tags", lambda ctx, i: storage.list_tags()),
+    Case("export_json", _export("json")),
+    Case("export_ndjson", _export("ndjson")),
+    Case("export_csv", _export("csv")),
+    Case("insert_todo", _insert, inner=20),
+    Case("update_todo", _update, inner=20),
+    Case("bulk_update_status", lambda ctx, i: storage.bulk_update_status(ctx.ids[:500], "DONE" if i % 2 else "TODO")),
+    Case("bulk_update_priority", lambda ctx, i: storage.bulk_update_priority(ctx.ids[:500], i % 5 + 1)),
+    Case("rename_tag", _rename_tag),
+    Case("delete_tag_from_all", _delete_tag),
+    Case("delete_todo", _delete, inner=20),
+    Case("bulk_delete_100", _bulk_delete),
+    Case("import_json_1000", _import("json")),
+    Case("import_ndjson_1000", _import("ndjson")),
+    Case("import_csv_1000", _import("csv")),
+]
+
+
+def time_case(case: Case, ctx: Context, repeat: int, budget: float) -> Dict:
+    samples = []
+    started = time.perf_counter()
+    iteration = 0
+    while len(samples) < repeat:
+        t0 = time.perf_counter()
+        for _ in range(case.inner):
+            case.op(ctx, iteration)
+            iteration += 1
+        samples.append((time.perf_counter() - t0) / case.inner)
+        if time.perf_counter() - started > budget:
+            break
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": len(samples) * case.inner,
+    }
+
+
+def run(sizes: List[int], seed: int, repeat: int, budget: float, only: List[str]) -> Dict:
+    results: Dict = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": seed,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    old_path = storage.DB_PATH
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage.DB_PATH = os.path.join(tmp, "bench.db")
+            storage.init_db()
+            spec = DatasetSpec(rows=size, seed=seed)
+            t0 = time.perf_counter()
+            load(spec)
+            print(f"{size} rows loaded in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+            ctx = Context(spec, tmp)
+            cases = {}
+            for case in CASES:
+                if only and case.name not in only:
+                    continue
+                cases[case.name] = time_case(case, ctx, repeat, budget)
+                print(f"  {case.name:<28} {cases[case.name]['median'] * 1000:10.3f} ms", file=sys.stderr)
+            results["results"][str(size)] = {"dataset": spec.to_dict(), "cases": cases}
+            storage.close_pool()
+    storage.DB_PATH = old_path
+    return results
+
+
+# Return (size, case, baseline, current, ratio) for every case that got slower
+# by more than `threshold` and by more than `min_delta` seconds; the latter
+# keeps timer noise on sub-millisecond cases from being reported
+def compare(baseline: Dict, current: Dict, threshold: float, min_delta: float = 0.0005) -> List:
+    regressions = []
+    for size, data in current["results"].items():
+        base_cases = baseline.get("results", {}).get(size, {}).get("cases", {})
+        for name, stats in data["cases"].items():
+            base = base_cases.get(name)
+            if not base:
+                continue
+            ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+            if ratio > 1 + threshold and stats["median"] - base["median"] > min_delta:
+                regressions.append((size, name, base["median"], stats["median"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage layer benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated row counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per case")
+    parser.add_argument("--budget", type=float, default=5.0, help="Max seconds per case before stopping early")
+    parser.add_argument("--case", action="append", default=[], help="Only run this case (repeatable)")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging, e.g. 0.2 = 20%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="Ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run(sizes, args.seed, args.repeat, args.budget, args.case)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.min_delta_ms / 1000)
+        for size, name, base, now, ratio in regressions:
+            print(f"REGRESSION {name} @ {size} rows: {base * 1000:.3f} ms -> {now * 1000:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print("No regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# benchmarks/datagen.py
+#
+# Deterministic synthetic todos for benchmarks. The same spec (including the
+# seed) always produces the same rows, so runs on different machines or
+# commits measure the same data.
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from todo_app import storage
+from todo_app.encoding import encode_row
+
+BASE_TIME = datetime(2024, 1, 1)
+WORDS = (
+    "review deploy fix write plan call email update test design refactor order buy read clean "
+    "prepare schedule report migrate backup invoice release draft sync audit"
+).split()
+
+
+class DatasetSpec:
+    def __init__(self, rows: int = 1000, seed: int = 42, tag_count: int = 200,
+                 tags_per_todo: Tuple[int, int] = (0, 4), tag_distribution: str = "zipf",
+                 zipf_s: float = 1.1,
+                 status_weights: Optional[Dict[str, float]] = None,
+                 priority_weights: Optional[Sequence[float]] = None):
+        self.rows = rows
+        self.seed = seed
+        self.tag_count = tag_count
+        self.tags_per_todo = tags_per_todo
+        self.tag_distribution = tag_distribution
+        self.zipf_s = zipf_s
+        self.status_weights = status_weights or {"TODO": 0.6, "IN_PROGRESS": 0.1, "DONE": 0.3}
+        self.priority_weights = priority_weights or (0.05, 0.15, 0.5, 0.2, 0.1)
+
+    def tags(self):
+        return [f"tag{i}" for i in range(self.tag_count)]
+
+    def to_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "seed": self.seed,
+            "tag_count": self.tag_count,
+            "tags_per_todo": list(self.tags_per_todo),
+            "tag_distribution": self.tag_distribution,
+            "zipf_s": self.zipf_s,
+            "status_weights": self.status_weights,
+            "priority_weights": list(self.priority_weights),
+        }
+
+
+def _cum_weights(weights):
+    return list(accumulate(weights))
+
+
+# Yield rows in storage.COLUMNS order, with public values (text ids, ISO-8601
+# timestamps)
+def generate_rows(spec: DatasetSpec) -> Iterator[Tuple]:
+    rng = random.Random(spec.seed)
+    tags = spec.tags()
+    if spec.tag_distribution == "zipf":
+        tag_cum = _cum_weights([1.0 / (k + 1) ** spec.zipf_s for k in range(len(tags))])
+    elif spec.tag_distribution == "uniform":
+        tag_cum = None
+    else:
+        raise ValueError(f"Unknown tag distribution: {spec.tag_distribution}")
+    statuses = list(spec.status_weights)
+    status_cum = _cum_weights(spec.status_weights.values())
+    priority_cum = _cum_weights(spec.priority_weights)
+    lo, hi = spec.tags_per_todo
+    for i in range(spec.rows):
+        k = rng.randint(lo, hi) if tags else 0
+        if tag_cum is None:
+            picked = rng.sample(tags, k)
+        else:
+            picked = list(dict.fromkeys(rng.choices(tags, cum_weights=tag_cum, k=k)))
+        created = BASE_TIME + timedelta(seconds=i, microseconds=rng.randrange(1000000))
+        updated = created + timedelta(seconds=rng.randrange(86400))
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        yield (
+            str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            f"{title} {i}",
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 20))) or None,
+            json.dumps(picked),
+            rng.choices(statuses, cum_weights=status_cum)[0],
+            rng.choices(range(1, len(priority_cum) + 1), cum_weights=priority_cum)[0],
+            created.isoformat(),
+            updated.isoformat(),
+        )
+
+
+# Bulk load a dataset into the current storage.DB_PATH
+def load(spec: DatasetSpec, batch_size: int = 5000) -> int:
+    rows = generate_rows(spec)
+    count = 0
+    with storage.pragma_override(synchronous="OFF", cache_size=-65536):
+        with storage.transaction() as conn:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                conn.executemany(storage.INSERT_SQL, map(encode_row, batch))
+                count += len(batch)
+    return count
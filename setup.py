@@ -14,6 +14,7 @@ setup(
     entry_points={
         'console_scripts': [
             'todo-app=todo_app.main:main',
+            'todo-client=todo_app.client:main',
         ],
     },
     include_package_data=True,
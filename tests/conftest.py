@@ -0,0 +1,13 @@
+import pytest
+from todo_app import storage
+
+
+# An empty, initialized database in tmp_path, used by storage for the test
+@pytest.fixture
+def fresh_db(tmp_path):
+    old_path = storage.DB_PATH
+    storage.DB_PATH = str(tmp_path / "fresh.db")
+    storage.init_db()
+    yield storage.DB_PATH
+    storage.close_pool()
+    storage.DB_PATH = old_path
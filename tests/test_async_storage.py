@@ -0,0 +1,83 @@
+import asyncio
+import inspect
+import sqlite3
+import pytest
+from todo_app import async_storage, storage
+from todo_app.async_storage import AsyncStorage
+from todo_app.models import TodoCreate, TodoUpdate
+
+
+def test_mirrors_public_storage_api():
+    public = {name for name, fn in vars(storage).items()
+              if inspect.isfunction(fn) and not name.startswith("_") and fn.__module__ == storage.__name__}
+    sync_only = {"transaction", "configure", "close_pool", "configure_cache", "cache_stats",
+                 "pragma_override", "remove_db", "encode_cursor", "decode_cursor", "normalize_timestamp",
+                 "iter_todo_rows", "enable_metrics", "disable_metrics", "reset_metrics", "metrics",
+                 "metrics_prometheus"}
+    mirrored = set(async_storage.READ_OPS + async_storage.WRITE_OPS + async_storage.SOLO_WRITE_OPS)
+    assert public - sync_only - {"iter_todos"} == mirrored
+    for name in mirrored | {"iter_todos"}:
+        assert hasattr(AsyncStorage, name) and hasattr(async_storage, name)
+
+def test_crud_through_module_api(fresh_db):
+    async def scenario():
+        todo = await async_storage.insert_todo(TodoCreate("Async", "d", ["a"], priority=2))
+        assert (await async_storage.get_by_id(todo.id)).title == "Async"
+        updated = await async_storage.update_todo(todo.id, TodoUpdate(title="Renamed"))
+        assert updated.title == "Renamed" and updated.priority == 2
+        assert [t.id for t in await async_storage.search_by_tag("a")] == [todo.id]
+        await async_storage.insert_many([TodoCreate(f"Page {i}") for i in range(7)])
+        titles = [t.title async for t in async_storage.iter_todos(page_size=3)]
+        assert len(titles) == 8
+        assert await async_storage.delete_todo(todo.id)
+        await async_storage.close()
+    asyncio.run(scenario())
+
+def test_concurrent_writes_are_group_committed(fresh_db):
+    async def scenario():
+        db = AsyncStorage(queue_size=100)
+        items = await asyncio.gather(*(db.insert_todo(TodoCreate(f"Load {i}")) for i in range(1000)))
+        stats = db.queue_stats()
+        await db.close()
+        return items, stats
+    items, stats = asyncio.run(scenario())
+    assert len({t.id for t in items}) == 1000
+    assert len(storage.get_all()) == 1000
+    assert stats["writes"] == 1000 and stats["commits"] < 100
+
+def test_failing_write_does_not_undo_its_batch(fresh_db):
+    def boom():
+        storage.insert_todo(TodoCreate("rolled back"))
+        raise sqlite3.IntegrityError("boom")
+
+    async def scenario():
+        db = AsyncStorage()
+        results = await asyncio.gather(
+            db.insert_todo(TodoCreate("kept 1")), db.write(boom), db.insert_todo(TodoCreate("kept 2")),
+            return_exceptions=True,
+        )
+        await db.close()
+        return results
+    results = asyncio.run(scenario())
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert sorted(t.title for t in storage.get_all()) == ["kept 1", "kept 2"]
+
+def test_backpressure_when_queue_is_full(fresh_db):
+    async def scenario():
+        db = AsyncStorage(queue_size=2, max_batch=2)
+        writes = [asyncio.ensure_future(db.insert_todo(TodoCreate(f"Q {i}"))) for i in range(10)]
+        await asyncio.sleep(0)
+        assert db.queue_stats()["queued"] <= 2
+        await asyncio.gather(*writes)
+        await db.close()
+    asyncio.run(scenario())
+    assert len(storage.get_all()) == 10
+
+def test_closed_storage_rejects_calls(fresh_db):
+    async def scenario():
+        db = AsyncStorage()
+        await db.list_tags()
+        await db.close()
+        with pytest.raises(RuntimeError):
+            await db.list_tags()
+    asyncio.run(scenario())
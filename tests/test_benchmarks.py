@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import bench_storage  # noqa: E402
+from datagen import DatasetSpec, generate_rows  # noqa: E402
+
+
+def test_datagen_is_deterministic():
+    spec = DatasetSpec(rows=50, seed=7, tag_count=10)
+    rows = list(generate_rows(spec))
+    assert rows == list(generate_rows(DatasetSpec(rows=50, seed=7, tag_count=10)))
+    assert rows != list(generate_rows(DatasetSpec(rows=50, seed=8, tag_count=10)))
+    assert {r[4] for r in rows} <= {"TODO", "IN_PROGRESS", "DONE"}
+    uniform = list(generate_rows(DatasetSpec(rows=50, tag_distribution="uniform")))
+    assert all(len(json.loads(r[3])) == len(set(json.loads(r[3]))) for r in uniform)
+
+def test_harness_runs_and_compares(tmp_path):
+    out = tmp_path / "results.json"
+    assert bench_storage.main(["--sizes", "200", "--repeat", "1", "--output", str(out)]) == 0
+    results = json.loads(out.read_text())
+    cases = results["results"]["200"]["cases"]
+    assert {c.name for c in bench_storage.CASES} == set(cases)
+    slower = json.loads(out.read_text())
+    for stats in slower["results"]["200"]["cases"].values():
+        stats["median"] = stats["median"] * 3 + 0.01
+    flagged = bench_storage.compare(results, slower, threshold=0.2)
+    assert len(flagged) == len(cases)
+    assert bench_storage.compare(results, results, threshold=0.2) == []
+
+def test_async_load_test_reports_percentiles(capsys):
+    import bench_async
+    assert bench_async.main(["--concurrency", "50", "--ops", "2", "--rows", "100"]) == 0
+    result = json.loads(capsys.readouterr().out)
+    assert result["all"]["count"] == 100
+    assert result["all"]["p50_ms"] <= result["all"]["p99_ms"]
+    assert result["commits"] <= result["writes"]
+
+def test_startup_does_not_import_storage_for_help(tmp_path):
+    import bench_startup
+    assert set(bench_startup.imported_modules(["--help"], str(tmp_path))) & set(bench_startup.HEAVY_MODULES) == set()
+    assert "todo_app.storage" in bench_startup.imported_modules(["init-db"], str(tmp_path))
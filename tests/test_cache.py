@@ -0,0 +1,27 @@
+import time
+from todo_app.cache import LRUCache
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1, cache.epoch)
+    cache.put("b", 2, cache.epoch)
+    assert cache.get("a") == 1
+    cache.put("c", 3, cache.epoch)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["size"]) == (3, 1, 1, 2)
+
+def test_put_after_invalidation_is_dropped():
+    cache = LRUCache()
+    epoch = cache.epoch
+    cache.invalidate(["a"])
+    cache.put("a", "stale", epoch)
+    assert cache.get("a") is None
+
+def test_ttl_expires_entries():
+    cache = LRUCache(ttl=0.01)
+    cache.put("a", 1, cache.epoch)
+    time.sleep(0.02)
+    assert cache.get("a") is None
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from todo_app.connection import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    p = ConnectionPool(str(tmp_path / "pool.db"), readers=2, pragmas={"cache_size": -4000})
+    with p.write() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+    yield p
+    p.close()
+
+def test_pragmas_applied(pool):
+    with pool.read() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4000
+
+def test_nested_write_is_savepoint(pool):
+    with pool.write() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+        with pytest.raises(ValueError):
+            with pool.write() as inner:
+                inner.execute("INSERT INTO t VALUES (2)")
+                raise ValueError
+    with pool.read() as conn:
+        assert [r[0] for r in conn.execute("SELECT x FROM t")] == [1]
+
+def test_writer_thread_reads_own_changes(pool):
+    with pool.write() as conn:
+        conn.execute("INSERT INTO t VALUES (7)")
+        with pool.read() as reader:
+            assert reader is conn
+            assert reader.execute("SELECT count(*) FROM t").fetchone()[0] == 1
+
+def test_readers_are_bounded(pool):
+    barrier = threading.Barrier(6)
+    def work():
+        barrier.wait()
+        for _ in range(20):
+            with pool.read() as conn:
+                conn.execute("SELECT count(*) FROM t").fetchone()
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # one writer + at most two readers
+    assert pool.opened <= 3
+
+def test_memory_database_shares_writer():
+    p = ConnectionPool(":memory:", readers=4)
+    with p.write() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with p.read() as conn:
+        assert conn.execute("SELECT x FROM t").fetchone()[0] == 1
+    p.close()
@@ -0,0 +1,79 @@
+import sqlite3
+import pytest
+from todo_app import instrument, storage
+from todo_app.main import main
+from todo_app.models import TodoCreate
+
+
+# The shared fresh_db (conftest.py), with metrics starting from zero
+@pytest.fixture
+def fresh_db(fresh_db):
+    storage.reset_metrics()
+    yield fresh_db
+    storage.disable_metrics()
+
+def test_histogram_quantiles():
+    h = instrument.Histogram()
+    for ms in range(1, 101):
+        h.observe(ms / 1000)
+    assert h.count == 100 and h.quantile(0.0) >= 0.001
+    assert 0.03 < h.quantile(0.5) < 0.07
+    assert h.quantile(0.5) <= h.quantile(0.95) <= h.quantile(0.99) <= 0.1
+    single = instrument.Histogram()
+    single.observe(0.3)
+    assert single.quantile(0.5) == 0.3
+
+def test_disabled_by_default(fresh_db):
+    assert storage.CONNECTION_FACTORY is sqlite3.Connection
+    assert not hasattr(storage.get_page, "__wrapped__")
+    storage.get_all()
+    assert storage.metrics()["functions"] == {}
+
+def test_records_calls_queries_and_connections(fresh_db):
+    storage.enable_metrics()
+    todos = storage.insert_many([TodoCreate(f"M{i}") for i in range(5)])
+    storage.get_page(limit=3)
+    list(storage.iter_todos(page_size=2))
+    storage.bulk_delete([t.id for t in todos[:2]])
+    storage.bulk_delete([t.id for t in todos[2:]])
+    with pytest.raises(ValueError):
+        storage.get_page(after="not a cursor")
+    snap = storage.metrics()
+    assert snap["enabled"]
+    functions = snap["functions"]
+    assert functions["insert_many"]["calls"] == 1 and functions["insert_many"]["rows"] == 5
+    assert functions["get_page"]["calls"] == 2 and functions["get_page"]["errors"] == 1
+    assert functions["get_page"]["rows"] == 3
+    assert functions["iter_todos"]["rows"] == 5
+    assert functions["bulk_delete"]["rows"] == 5
+    assert functions["insert_many"]["p50_ms"] <= functions["insert_many"]["max_ms"]
+    # IN lists of different lengths are one statement shape
+    deletes = [sql for sql in snap["queries"] if sql.startswith("DELETE FROM todos WHERE id IN")]
+    assert deletes == ["DELETE FROM todos WHERE id IN (?, ...)"]
+    assert snap["queries"][deletes[0]]["calls"] == 2 and snap["queries"][deletes[0]]["rows"] == 5
+    assert snap["connections"]["opened"] >= 1
+    storage.disable_metrics()
+    assert storage.metrics()["connections"]["open"] == 0
+    assert storage.CONNECTION_FACTORY is sqlite3.Connection
+    assert not hasattr(storage.get_page, "__wrapped__")
+
+def test_slow_queries_capture_plan_and_prometheus(fresh_db, caplog):
+    storage.enable_metrics(slow_query_ms=0)
+    storage.insert_todo(TodoCreate("Slow", tags=["s"]))
+    storage.search_by_tag("s")
+    slow = [q for q in storage.metrics()["slow_queries"] if "todo_tags" in q["sql"] and q["sql"].startswith("SELECT")]
+    assert slow and slow[0]["rows"] == 1 and slow[0]["plan"]
+    assert any("slow query" in r.getMessage() for r in caplog.records)
+    text = storage.metrics_prometheus()
+    assert "# TYPE todo_storage_call_seconds histogram" in text
+    assert 'todo_storage_call_seconds_count{function="search_by_tag"} 1' in text
+    assert 'todo_storage_call_seconds_bucket{function="search_by_tag",le="+Inf"} 1' in text
+    assert "todo_storage_connections_opened_total " in text
+
+def test_profile_flag_prints_breakdown(fresh_db, capsys):
+    storage.insert_todo(TodoCreate("Profiled", tags=["p"]))
+    main(["--profile", "search-tag", "p", "--format", "ids"])
+    captured = capsys.readouterr()
+    assert len(captured.out.split()) == 1
+    assert "Profile:" in captured.err and "search_by_tag" in captured.err and "Connections:" in captured.err
+    assert not hasattr(storage.search_by_tag, "__wrapped__")
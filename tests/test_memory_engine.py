@@ -0,0 +1,143 @@
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import textwrap
+import time
+import pytest
+from todo_app import storage
+from todo_app.models import TodoCreate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def memory_db(tmp_path):
+    old_path = storage.DB_PATH
+    storage.DB_PATH = str(tmp_path / "memory.db")
+    storage.configure(engine="memory", flush_interval=0, flush_rows=0)
+    yield storage.DB_PATH
+    storage.configure(engine="disk", flush_interval=storage.DEFAULT_FLUSH_INTERVAL,
+                      flush_rows=storage.DEFAULT_FLUSH_ROWS)
+    storage.DB_PATH = old_path
+
+def _count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+    finally:
+        conn.close()
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+# Run `code` in a fresh interpreter using the memory engine on `path`
+def _run(path, code, wait=True):
+    script = textwrap.dedent(f"""
+        import os, sys
+        from todo_app import storage
+        from todo_app.models import TodoCreate
+        storage.DB_PATH = {path!r}
+        storage.configure(engine="memory", flush_interval=0, flush_rows=0)
+        storage.init_db()
+    """) + textwrap.dedent(code)
+    proc = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT, stdout=subprocess.PIPE,
+                            env=dict(os.environ, PYTHONPATH=ROOT))
+    if wait:
+        assert proc.wait(timeout=30) in (0, 3)
+    return proc
+
+def test_loads_the_file_and_writes_back_on_close(memory_db):
+    storage.configure(engine="disk")
+    storage.init_db()
+    storage.insert_todo(TodoCreate("On disk"))
+    storage.configure(engine="memory", flush_interval=0, flush_rows=0)
+    assert [t.title for t in storage.get_all()] == ["On disk"]
+    storage.insert_many([TodoCreate(f"Scratch {i}") for i in range(100)])
+    assert _count(memory_db) == 1
+    storage.close_pool()
+    assert _count(memory_db) == 101
+
+def test_flushes_on_row_threshold_and_interval(memory_db):
+    storage.configure(flush_rows=50)
+    storage.init_db()
+    storage.flush()
+    storage.insert_todo(TodoCreate("First"))
+    time.sleep(0.2)
+    assert _count(memory_db) == 0
+    storage.insert_many([TodoCreate(f"T{i}") for i in range(60)])
+    assert _wait_for(lambda: _count(memory_db) == 61)
+    storage.configure(flush_interval=0.1, flush_rows=0)
+    storage.insert_todo(TodoCreate("Later"))
+    assert _wait_for(lambda: _count(memory_db) == 62)
+
+def test_flush_outside_transactions_only(memory_db):
+    storage.init_db()
+    assert storage.flush() is True
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.flush()
+    assert storage.flush() is False
+
+def test_crash_loses_only_unflushed_changes(tmp_path):
+    path = str(tmp_path / "crash.db")
+    _run(path, """
+        storage.insert_many([TodoCreate(f"Kept {i}") for i in range(20)])
+        storage.flush()
+        storage.insert_many([TodoCreate(f"Lost {i}") for i in range(20)])
+        os._exit(3)
+    """)
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert {r[0][:4] for r in conn.execute("SELECT title FROM todos")} == {"Kept"}
+    assert conn.execute("SELECT count FROM todo_counters WHERE kind = 'total'").fetchone()[0] == 20
+    conn.close()
+
+def test_clean_exit_flushes(tmp_path):
+    path = str(tmp_path / "exit.db")
+    _run(path, """
+        storage.insert_many([TodoCreate(f"Todo {i}") for i in range(30)])
+    """)
+    assert _count(path) == 30
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+def test_kill_during_flushes_leaves_a_consistent_snapshot(tmp_path):
+    path = str(tmp_path / "kill.db")
+    # Every flush happens between batches of 50, so any snapshot holds whole batches
+    proc = _run(path, """
+        print("ready", flush=True)
+        while True:
+            storage.insert_many([TodoCreate("x" * 200) for _ in range(50)])
+            storage.flush()
+    """, wait=False)
+    assert proc.stdout.readline().strip() == b"ready"
+
+    def flushed_some():
+        try:
+            return _count(path) >= 500
+        except sqlite3.Error:
+            return False
+    assert _wait_for(flushed_some)
+    proc.send_signal(signal.SIGKILL)
+    proc.wait(timeout=30)
+    proc.stdout.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    count = conn.execute("SELECT COUNT(*) FROM todos").fetchone()[0]
+    assert count > 0 and count % 50 == 0
+    assert conn.execute("SELECT count FROM todo_counters WHERE kind = 'total'").fetchone()[0] == count
+    conn.close()
+    old_path = storage.DB_PATH
+    storage.DB_PATH = path
+    try:
+        storage.configure(engine="memory")
+        assert len(storage.get_all()) == count
+    finally:
+        storage.configure(engine="disk")
+        storage.DB_PATH = old_path
@@ -0,0 +1,147 @@
+import json
+import re
+import sqlite3
+import pytest
+from todo_app import storage, migrations
+from todo_app.connection import ConnectionPool
+from todo_app.encoding import encode_time
+from todo_app.models import TodoCreate, TodoFilter, TodoUpdate, TodoStatus
+
+
+@pytest.fixture
+def db(tmp_path):
+    old_path = storage.DB_PATH
+    storage.DB_PATH = str(tmp_path / "migrations.db")
+    yield storage.DB_PATH
+    storage.close_pool()
+    storage.DB_PATH = old_path
+
+# A database left at schema `version` by an older release
+def _old_database(path, version):
+    conn = sqlite3.connect(path)
+    with conn:
+        assert migrations.migrate(conn, target=version) == version
+    return conn
+
+def test_init_db_sets_latest_version(db):
+    storage.init_db()
+    with storage._read() as conn:
+        assert migrations.get_version(conn) == migrations.LATEST_VERSION
+    # Running again is a no-op
+    storage.init_db()
+
+def test_migrates_from_intermediate_version(db):
+    conn = _old_database(db, 1)
+    with conn:
+        conn.execute(
+            "INSERT INTO todos VALUES ('t1','Old',NULL,'[\"a\"]','TODO',3,'2024-01-01T00:00:00','2024-01-01T00:00:00')"
+        )
+    conn.close()
+    storage.init_db()
+    with storage._read() as conn:
+        names = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {"idx_todos_created_id", "idx_todos_status_created_id", "idx_todos_priority_created_id"} <= names
+    assert [t.id for t in storage.search_by_tag("a")] == ["t1"]
+
+def test_refuses_newer_schema(db):
+    storage.init_db()
+    with storage.transaction() as conn:
+        conn.execute(f"PRAGMA user_version = {migrations.LATEST_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        storage.init_db()
+
+def test_storage_queries_use_indexes(db, tmp_path, monkeypatch):
+    statements = []
+    original_open = ConnectionPool._open
+
+    def traced_open(self):
+        conn = original_open(self)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(ConnectionPool, "_open", traced_open)
+    storage.close_pool()
+    storage.init_db()
+    todo = storage.insert_todo(TodoCreate("Plan", tags=["x"]))
+    del statements[:]
+
+    storage.get_all()
+    storage.get_by_id(todo.id)
+    storage.get_by_status(TodoStatus.TODO)
+    storage.get_by_priority(1)
+    storage.get_all_sorted_by_priority()
+    storage.search_by_title("Plan")
+    storage.search_by_tag("x")
+    storage.search_text("plan")
+    storage.list_tags()
+    start = encode_time("2024-01-01T00:00:00")
+    cursor = storage.encode_cursor((start, "x"))
+    storage.get_page(after=cursor, limit=5)
+    storage.get_page(status=TodoStatus.TODO, after=cursor, limit=5)
+    storage.get_page(priority=1, after=cursor, limit=5)
+    storage.get_page(order="priority", after=storage.encode_cursor((1, start, "x")), limit=5)
+    storage.query(status=[TodoStatus.TODO, TodoStatus.DONE], priority_max=2, tag="x", limit=5)
+    storage.query(tags_any=["x", "z"], created_after="2024-01-01", order="priority", limit=5)
+    storage.query(tags_all=["x", "z"], text="plan", limit=5)
+    storage.update_todo(todo.id, TodoUpdate(title="Plan2"))
+    records = tmp_path / "dups.ndjson"
+    records.write_text('{"title": "plan2", "tags": ["x"]}\n{"title": "Other"}\n')
+    storage.import_todos_ndjson(str(records), on_duplicate="update")
+    storage.rename_tag("x", "y")
+    storage.delete_tag_from_all("y")
+    storage.bulk_update_status([todo.id], TodoStatus.DONE)
+    storage.bulk_update_priority([todo.id], 2)
+    storage.bulk_update_priority_where(TodoFilter(tag="x", status=TodoStatus.DONE), 3)
+    storage.bulk_delete([todo.id])
+    storage.delete_todo(todo.id)
+
+    queries = []
+    for sql in statements:
+        sql = sql.strip()
+        if sql.split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE") and sql not in queries:
+            queries.append(sql)
+    assert len(queries) >= 12
+
+    conn = sqlite3.connect(db)
+    listings = 0
+    for sql in queries:
+        details = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        for detail in details:
+            # A scan of todos is only acceptable when it walks an index
+            assert not re.match(r"SCAN (todos|t)$", detail), (sql, details)
+        # Plain listings sort by walking an index; filters with subqueries
+        # (IN lists, tag sets) may pick another index and sort the matches
+        if re.match(r"SELECT [^()]+ FROM todos\b", sql) and sql.count("SELECT") == 1:
+            listings += 1
+            assert not any("TEMP B-TREE" in d for d in details), (sql, details)
+    conn.close()
+    assert listings >= 10
+
+def test_compact_encoding_preserves_data(db, tmp_path):
+    uid = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    conn = _old_database(db, 8)
+    with conn:
+        conn.executemany("INSERT INTO todos (id,title,description,tags,status,priority,created_at,updated_at) "
+                         "VALUES (?,?,NULL,?,'TODO',3,?,?)", [
+                             (uid, "Uuid", '["a", "b"]', "2024-01-02T03:04:05.123456", "2024-01-03T00:00:00"),
+                             ("legacy-1", "Legacy", '["a"]', "2024-01-01T00:00:00", "2024-01-01T00:00:00"),
+                         ])
+        conn.execute("INSERT INTO todo_tombstones VALUES ('1b4e28ba-2fa1-11d2-883f-0016d3cca427', '2024-02-01T00:00:00')")
+    conn.close()
+    # No init_db: the first use migrates
+    with storage._read() as conn:
+        assert dict(conn.execute("SELECT title, typeof(id) FROM todos").fetchall()) == {"Uuid": "blob", "Legacy": "text"}
+        assert conn.execute("SELECT typeof(created_at) FROM todos").fetchone()[0] == "integer"
+    todo = storage.get_by_id(uid)
+    assert (todo.title, todo.tags) == ("Uuid", ["a", "b"])
+    assert todo.created_at.isoformat() == "2024-01-02T03:04:05.123456"
+    assert [t.id for t in storage.search_by_tag("a")] == [uid, "legacy-1"]
+    assert storage.get_by_id("legacy-1").updated_at.isoformat() == "2024-01-01T00:00:00"
+    assert storage.stats()["tags"] == {"a": 2, "b": 1}
+    out = tmp_path / "changes.ndjson"
+    storage.export_todos_changes(str(out), since="2024-01-02T12:00:00")
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [(r["id"], r.get("updated_at"), r.get("deleted_at")) for r in lines] == [
+        (uid, "2024-01-03T00:00:00", None),
+        ("1b4e28ba-2fa1-11d2-883f-0016d3cca427", None, "2024-02-01T00:00:00"),
+    ]
@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import pytest
+from todo_app import storage
+from todo_app.main import main
+from todo_app.models import TodoCreate
+from todo_app.output import FORMATS, write_rows, write_todos
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _render(fmt, pages):
+    out = io.StringIO()
+    count = write_rows(out, fmt, pages)
+    return count, out.getvalue()
+
+def test_formats_agree_with_export(fresh_db, tmp_path):
+    storage.insert_many([TodoCreate(f"T{i}", 'say "hi", then\ttab' if i % 2 else None, ["a,b", "ü"], i % 5 + 1)
+                         for i in range(7)])
+    pages = list(storage.iter_todo_rows(page_size=3))
+    assert [len(p) for p in pages] == [3, 3, 1]
+    storage.export_todos_json(str(tmp_path / "all.json"))
+    with open(tmp_path / "all.json", encoding="utf-8") as f:
+        expected = json.load(f)
+    counts = {}
+    for fmt in FORMATS:
+        counts[fmt], text = _render(fmt, pages)
+        if fmt == "json":
+            assert json.loads(text) == expected
+        elif fmt == "ndjson":
+            assert [json.loads(line) for line in text.splitlines()] == expected
+        elif fmt in ("csv", "tsv"):
+            rows = list(csv.DictReader(io.StringIO(text), dialect="excel" if fmt == "csv" else "excel-tab"))
+            assert [r["description"] or None for r in rows] == [e["description"] for e in expected]
+            assert [json.loads(r["tags"]) for r in rows] == [e["tags"] for e in expected]
+        elif fmt == "ids":
+            assert text.split() == [e["id"] for e in expected]
+    assert set(counts.values()) == {7}
+    assert _render("json", []) == (0, "[]\n")
+    for fmt in ("text", "ndjson", "ids"):
+        assert _render(fmt, [[], []]) == (0, "")
+    assert _render("ids", [pages[2], []]) == (1, expected[-1]["id"] + "\n")
+
+def test_text_matches_item_fields(fresh_db):
+    todo = storage.insert_todo(TodoCreate("Text", None, ["x"], 2))
+    out = io.StringIO()
+    write_todos(out, "text", [todo])
+    assert out.getvalue() == (
+        f"ID: {todo.id}\nTitle: Text\nDescription: None\nTags: ['x']\nStatus: TODO\nPriority: 2\n"
+        f"Created: {todo.created_at}\nUpdated: {todo.updated_at}\n\n"
+    )
+    with pytest.raises(ValueError):
+        write_rows(io.StringIO(), "xml", [])
+
+def test_list_format_and_paging_cursor(fresh_db, capsys):
+    storage.insert_many([TodoCreate(f"T{i}") for i in range(3)])
+    main(["list", "--format", "ids", "--limit", "2"])
+    captured = capsys.readouterr()
+    assert len(captured.out.split()) == 2
+    assert captured.err.startswith("Next page: --after ")
+    main(["search-tag", "none", "--format", "json"])
+    assert json.loads(capsys.readouterr().out) == []
+    main(["search-tag", "none", "--format", "ids"])
+    assert capsys.readouterr().out == ""
+
+def test_broken_pipe_exits_quietly(fresh_db, tmp_path):
+    # The CLI uses ./todos.db
+    storage.close_pool()
+    storage.DB_PATH = str(tmp_path / "todos.db")
+    storage.init_db()
+    storage.insert_many([TodoCreate(f"Todo {i}", "x" * 100) for i in range(3000)])
+    storage.close_pool()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.Popen([sys.executable, "-m", "todo_app.main", "list"], cwd=str(tmp_path),
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert proc.stdout.readline().startswith(b"ID: ")
+    proc.stdout.close()
+    err = proc.stderr.read()
+    proc.stderr.close()
+    assert proc.wait() == 1
+    assert err == b""
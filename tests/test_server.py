@@ -0,0 +1,74 @@
+import io
+import json
+import os
+import threading
+import time
+import pytest
+from todo_app import storage
+from todo_app.client import TodoClient
+from todo_app.main import build_parser, main
+from todo_app.server import make_server, parse_batch_line, run_batch
+
+
+def _batch(lines, **kwargs):
+    out, err = io.StringIO(), io.StringIO()
+    status = run_batch(build_parser(), lines, out=out, err=err, **kwargs)
+    return status, out.getvalue(), err.getvalue()
+
+def test_parse_batch_line_formats():
+    assert parse_batch_line("add 'Buy milk' --priority 1  # note") == ["add", "Buy milk", "--priority", "1"]
+    assert parse_batch_line('["add", "x"]') == ["add", "x"]
+    assert parse_batch_line('{"argv": ["list-tags"]}') == ["list-tags"]
+    assert parse_batch_line("   # only a comment") is None
+
+def test_batch_runs_commands_in_one_transaction(fresh_db):
+    status, out, _ = _batch(["add First --tags a", '["add", "Second", "--tags", "a"]', "", "search-tag a"])
+    assert status == 0
+    assert out.count("Added todo:") == 2 and "Title: First" in out
+    assert len(storage.search_by_tag("a")) == 2
+
+def test_batch_command_reads_stdin(fresh_db, monkeypatch, capsys):
+    monkeypatch.setattr("sys.stdin", io.StringIO("add First --tags a\nadd Second --tags a\n"))
+    with pytest.raises(SystemExit) as exc:
+        main(["batch"])
+    assert exc.value.code == 0
+    assert capsys.readouterr().out.count("Added todo:") == 2
+    assert len(storage.search_by_tag("a")) == 2
+
+def test_batch_failure_rolls_back_everything(fresh_db):
+    status, _, err = _batch(["add One", "add Two --priority 9", "add Three"])
+    assert status == 1 and "line 2" in err
+    assert storage.get_all() == []
+
+def test_batch_keep_going_drops_only_failures(fresh_db):
+    status, out, _ = _batch(["add One", "add Two --priority 9", "add Three", "import-new csv x.csv"],
+                            keep_going=True, output="json")
+    results = [json.loads(line) for line in out.splitlines()]
+    assert [r["exit"] for r in results] == [0, 2, 0, 2]
+    assert status == 1
+    assert sorted(t.title for t in storage.get_all()) == ["One", "Three"]
+
+def test_server_round_trip(fresh_db, tmp_path):
+    path = str(tmp_path / "todo.sock")
+    server = make_server(path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with TodoClient(path) as client:
+            out, err = io.StringIO(), io.StringIO()
+            assert client.run(["add", "Served", "--tags", "s"], out, err) == 0
+            assert "Title: Served" in out.getvalue()
+            assert client.run(["export", "ndjson", "served.ndjson"], io.StringIO(), err) == 0
+            assert os.path.exists(os.path.join(os.getcwd(), "served.ndjson"))
+            os.remove("served.ndjson")
+            assert client.run(["add", "x", "--priority", "9"], io.StringIO(), err) == 2
+            assert "invalid choice" in err.getvalue()
+            assert client.run(["serve"], io.StringIO(), io.StringIO()) == 2
+            started = time.perf_counter()
+            for _ in range(200):
+                client.run(["list-tags"], io.StringIO(), io.StringIO())
+            assert (time.perf_counter() - started) / 200 < 0.05
+        assert [t.title for t in storage.search_by_tag("s")] == ["Served"]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,152 @@
+import json
+import os
+import pytest
+from todo_app.main import main
+from todo_app.models import TodoCreate, TodoFilter, TodoUpdate, TodoStatus
+from todo_app.sharding import ShardedStore, shard_of
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ShardedStore(str(tmp_path / "shards"), shards=3)
+    store.init_db()
+    yield store
+    store.close()
+
+def _fill(store, n=40, **kwargs):
+    return store.insert_many([TodoCreate(f"Todo {i}", tags=["odd"] if i % 2 else ["even"], priority=i % 5 + 1)
+                              for i in range(n)], **kwargs)
+
+# Storage order; todos inserted in the same microsecond go by id
+def _newest_first(items):
+    return sorted(items, key=lambda t: (t.created_at, t.id), reverse=True)
+
+def test_routes_by_id_and_merges_in_order(store):
+    items = _fill(store)
+    assert sum(store.shard_counts()) == 40 and all(store.shard_counts())
+    newest_first = [t.id for t in _newest_first(items)]
+    assert [t.id for t in store.get_all()] == newest_first
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.get_page(limit=7, after=cursor)
+        seen.extend(t.id for t in page)
+        if cursor is None:
+            break
+    assert seen == newest_first
+    assert [t.id for t in store.iter_todos(page_size=4)] == newest_first
+    assert [t.id for t in store.iter_todos(page_size=4, limit=9)] == newest_first[:9]
+    by_priority = store.get_all_sorted_by_priority()
+    assert [t.priority for t in by_priority] == sorted(t.priority for t in items)
+    assert [t.id for t in store.iter_todos(order="priority", page_size=3)] == [t.id for t in by_priority]
+    assert [t.id for t in store.query(tag="odd", priority_max=2)] == [
+        t.id for t in _newest_first(items) if "odd" in t.tags and t.priority <= 2]
+    assert store.stats()["tags"] == {"even": 20, "odd": 20}
+    assert store.list_tags() == ["even", "odd"]
+
+def test_writes_go_to_the_owning_shard(store):
+    todo = store.insert_todo(TodoCreate("One"))
+    assert store.shard_counts()[shard_of(todo.id, 3)] == 1
+    assert store.update_todo(todo.id, TodoUpdate(status=TodoStatus.DONE)).status == "DONE"
+    assert store.get_by_status("DONE")[0].id == todo.id
+    assert store.delete_todo(todo.id)
+    assert store.get_by_id(todo.id) is None
+    assert not store.delete_todo(todo.id)
+    with pytest.raises(ValueError):
+        store.insert_todo(TodoCreate("x"), tenant="acme")
+    with pytest.raises(ValueError):
+        store.get_page(limit=0)
+
+def test_tenants_are_isolated(tmp_path):
+    store = ShardedStore(str(tmp_path / "tenants"), shards=2, by="tenant")
+    store.init_db()
+    try:
+        acme = _fill(store, 5, tenant="acme")
+        _fill(store, 5, tenant="globex")
+        assert [t.id for t in store.get_all(tenant="acme")] == [t.id for t in _newest_first(acme)]
+        assert len(store.get_all()) == 10
+        assert store.get_by_id(acme[0].id, tenant="globex") is None
+        assert store.update_todo(acme[0].id, TodoUpdate(title="x"), tenant="globex") is None
+        assert not store.delete_todo(acme[0].id, tenant="globex")
+        assert store.delete_todo(acme[0].id, tenant="acme")
+        assert len(store.search_by_tag("odd", tenant="acme")) == 2
+        with pytest.raises(ValueError):
+            store.insert_todo(TodoCreate("x"))
+        store.rebalance(3)
+        assert [t.id for t in store.get_all(tenant="acme")] == [t.id for t in _newest_first(acme[1:])]
+        assert store.list_tags(tenant="globex") == ["even", "odd"]
+    finally:
+        store.close()
+
+def test_rebalance_moves_everything(store, tmp_path):
+    items = _fill(store)
+    store.delete_todo(items[0].id)
+    before = [t.id for t in store.get_all()]
+    assert store.rebalance(5) == 39
+    assert store.shards == 5 and sum(store.shard_counts()) == 39
+    assert [t.id for t in store.get_all()] == before
+    assert [t.id for t in store.query(where=TodoFilter(tag="odd"))] == [t.id for t in _newest_first(items) if "odd" in t.tags]
+    assert all(name.endswith(("-of-005.db", "-of-005.db-wal", "-of-005.db-shm", "shards.json"))
+               for name in os.listdir(store.directory))
+    assert store.get_by_id(items[1].id).title == "Todo 1"
+    reopened = ShardedStore(store.directory)
+    assert reopened.shards == 5 and [t.id for t in reopened.get_all()] == before
+    reopened.close()
+
+def test_failed_rebalance_keeps_the_store(store, monkeypatch):
+    _fill(store, 10)
+
+    def fail(*args):
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(ShardedStore, "_copy_shard", fail)
+    with pytest.raises(RuntimeError):
+        store.rebalance(4)
+    assert store.shards == 3 and len(store.get_all()) == 10
+    assert not any("-of-004" in name for name in os.listdir(store.directory))
+    assert ShardedStore(store.directory).shards == 3
+
+def test_rebalance_command(tmp_path, capsys):
+    directory = str(tmp_path / "cli")
+    main(["rebalance", directory, "--shards", "2"])
+    store = ShardedStore(directory)
+    _fill(store, 6)
+    store.close()
+    main(["rebalance", directory, "--shards", "3"])
+    out = capsys.readouterr().out
+    assert "2 -> 3 shards, 6 todos moved" in out
+
+def test_import_finds_duplicates_in_every_shard(store, tmp_path):
+    path = tmp_path / "in.ndjson"
+    path.write_text("".join(json.dumps({"title": f"Todo {i}", "tags": ["x"]}) + "\n" for i in range(30)))
+    assert store.import_file(str(path), "ndjson").inserted == 30
+    assert all(store.shard_counts())
+    path.write_text(path.read_text() + json.dumps({"title": "New"}) + "\n")
+    result = store.import_file(str(path), "ndjson", on_duplicate="update")
+    assert (result.inserted, result.updated, result.duplicates) == (1, 30, 30)
+    out = str(tmp_path / "out.json")
+    assert store.export_todos(out, "json") == 31
+    assert [r["id"] for r in json.load(open(out))] == [t.id for t in store.get_all()]
+
+def test_commands_on_a_sharded_store(tmp_path, capsys):
+    directory = str(tmp_path / "cli")
+    main(["rebalance", directory, "--shards", "2", "--by", "tenant"])
+    main(["add", "Invoice", "--tags", "billing", "--sharded", directory, "--tenant", "acme"])
+    main(["add", "Other", "--sharded", directory, "--tenant", "globex"])
+    capsys.readouterr()
+    main(["list", "--sharded", directory, "--tenant", "acme", "--format", "ids"])
+    (tid,) = capsys.readouterr().out.split()
+    main(["find", "--tag", "billing", "--sharded", directory, "--format", "ids"])
+    assert capsys.readouterr().out.split() == [tid]
+    out = str(tmp_path / "acme.ndjson")
+    main(["export", "ndjson", out, "--sharded", directory, "--tenant", "acme"])
+    main(["import", "ndjson", out, "--sharded", directory, "--tenant", "globex"])
+    main(["stats", "--sharded", directory])
+    assert "Total: 3" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["add", "No tenant", "--sharded", directory])
+    with pytest.raises(SystemExit):
+        main(["list", "--sharded", str(tmp_path / "missing")])
+    main(["delete", tid, "--sharded", directory, "--tenant", "acme"])
+    assert "Todo deleted." in capsys.readouterr().out
+    store = ShardedStore(directory)
+    assert [t.title for t in store.get_all(tenant="globex")] == ["Invoice", "Other"]
+    store.close()
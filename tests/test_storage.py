@@ -3,6 +3,7 @@ import tempfile
 import pytest
 import sqlite3
 from todo_app import storage
+from todo_app.encoding import encode_id, encode_row, encode_time
 from todo_app.models import TodoCreate, TodoUpdate, TodoStatus
 
 TEST_DB = "test_todos.db"
@@ -13,8 +14,10 @@ def setup_module(module):
     storage.init_db()
 
 def teardown_module(module):
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+    storage.close_pool()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB + suffix):
+            os.remove(TEST_DB + suffix)
 
 def test_insert_and_get_all():
     storage.init_db()
@@ -142,4 +145,659 @@ def test_delete_todo():
     assert deleted
     # Should not find it anymore
     todos = storage.get_all()
-    assert not any(t.id == todo.id for t in todos)
\ No newline at end of file
+    assert not any(t.id == todo.id for t in todos)
+
+def test_pool_reuses_connections():
+    storage.init_db()
+    todo = storage.insert_todo(TodoCreate("PoolTest"))
+    pool = storage._pool()
+    opened = pool.opened
+    for _ in range(50):
+        assert storage.get_by_id(todo.id).title == "PoolTest"
+    assert pool.opened == opened
+
+def test_transaction_rolls_back_grouped_writes():
+    storage.init_db()
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.insert_todo(TodoCreate("RolledBack"))
+            raise RuntimeError("abort")
+    assert not any(t.title == "RolledBack" for t in storage.get_all())
+
+def test_search_by_tag_breaks_ties_by_id(fresh_db):
+    storage.insert_many([TodoCreate(f"T{i}", tags=["same"]) for i in range(6)])
+    with storage.transaction() as conn:
+        conn.execute("UPDATE todos SET created_at = 1")
+    assert [t.id for t in storage.search_by_tag("same")] == [t.id for t in storage.get_all()]
+
+def test_tag_index_kept_in_sync(fresh_db):
+    t1 = storage.insert_todo(TodoCreate("A", tags=["x", "y"]))
+    t2 = storage.insert_todo(TodoCreate("B", tags=["y"]))
+    assert {t.id for t in storage.search_by_tag("y")} == {t1.id, t2.id}
+    storage.update_todo(t1.id, TodoUpdate(tags=["z"]))
+    assert [t.id for t in storage.search_by_tag("y")] == [t2.id]
+    assert storage.list_tags() == ["y", "z"]
+    storage.bulk_delete([t2.id])
+    assert storage.search_by_tag("y") == []
+    assert storage.list_tags() == ["z"]
+
+def test_rename_tag_onto_existing_tag(fresh_db):
+    todo = storage.insert_todo(TodoCreate("Both", tags=["old", "new"]))
+    assert storage.rename_tag("old", "new") == 1
+    assert storage.get_by_id(todo.id).tags == ["new", "new"]
+    assert storage.list_tags() == ["new"]
+    assert storage.delete_tag_from_all("new") == 1
+    assert storage.get_by_id(todo.id).tags == []
+
+def test_search_by_tag_uses_index(fresh_db):
+    with storage._read() as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT t.* FROM todo_tags g JOIN todos t ON t.pk = g.todo_id WHERE g.tag = ?",
+            ("x",)
+        ).fetchall()
+    details = " ".join(r["detail"] for r in plan)
+    assert "SEARCH g USING PRIMARY KEY (tag=?)" in details
+
+def test_tag_index_backfilled_for_legacy_db(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE todos (id TEXT PRIMARY KEY, title TEXT NOT NULL, description TEXT, tags TEXT, "
+        "status TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 3, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO todos VALUES ('legacy-1','Old',NULL,'[\"keep\"]','TODO',3,'2024-01-01T00:00:00','2024-01-01T00:00:00')"
+    )
+    conn.commit()
+    conn.close()
+    old_path = storage.DB_PATH
+    storage.DB_PATH = path
+    try:
+        storage.init_db()
+        assert [t.id for t in storage.search_by_tag("keep")] == ["legacy-1"]
+    finally:
+        storage.close_pool()
+        storage.DB_PATH = old_path
+
+def _seed(n, tags='["bulk"]'):
+    with storage.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO todos (id,title,description,tags,status,priority,created_at,updated_at) VALUES (?,?,?,?,?,?,?,?)",
+            (encode_row((f"seed-{i}", f"Seed {i}", "d" * 50, tags, "TODO", i % 5 + 1,
+                         f"2024-01-01T00:00:{i % 60:02d}.{i:06d}", "2024-01-01T00:00:00")) for i in range(n))
+        )
+
+def test_export_formats_stream_raw_rows(fresh_db, tmp_path, monkeypatch):
+    import csv
+    import json
+    _seed(25)
+    monkeypatch.setattr(storage, "_row_to_item", lambda row: pytest.fail("export built a TodoItem"))
+    assert storage.export_todos_json(str(tmp_path / "a.json"), batch_size=7) == 25
+    assert storage.export_todos_ndjson(str(tmp_path / "a.ndjson"), batch_size=7) == 25
+    assert storage.export_todos_csv(str(tmp_path / "a.csv"), batch_size=7) == 25
+    data = json.loads((tmp_path / "a.json").read_text())
+    lines = [json.loads(l) for l in (tmp_path / "a.ndjson").read_text().splitlines()]
+    with open(tmp_path / "a.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert data == lines
+    assert len(rows) == 25
+    assert data[0]["tags"] == ["bulk"] and json.loads(rows[0]["tags"]) == ["bulk"]
+    assert [d["id"] for d in data] == [r["id"] for r in rows]
+
+def test_export_empty_json_is_valid(fresh_db, tmp_path):
+    import json
+    out = tmp_path / "empty.json"
+    assert storage.export_todos_json(str(out)) == 0
+    assert json.loads(out.read_text()) == []
+
+def test_export_memory_is_flat(fresh_db, tmp_path):
+    import tracemalloc
+    def peak(n):
+        storage.init_db()
+        with storage.transaction() as conn:
+            conn.execute("DELETE FROM todos")
+        _seed(n)
+        tracemalloc.start()
+        storage.export_todos_ndjson(str(tmp_path / "m.ndjson"), batch_size=500)
+        _, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return top
+    small, large = peak(2000), peak(20000)
+    assert large < small * 2
+
+def test_import_json_streams_and_dedups(fresh_db, tmp_path):
+    import json
+    existing = storage.insert_todo(TodoCreate("Existing"))
+    records = [{"id": existing.id, "title": "Dup"}]
+    records += [{"id": f"new-{i}", "title": f"Item {i}", "tags": ["imp"], "priority": 2} for i in range(40)]
+    path = tmp_path / "in.json"
+    path.write_text(json.dumps(records, indent=2))
+    from todo_app.importer import import_file
+    result = import_file(str(path), "json", batch_size=7)
+    assert (result.inserted, result.skipped) == (40, 1)
+    assert result.rows_per_second > 0
+    assert len(storage.search_by_tag("imp")) == 40
+    assert not any(t.title == "Dup" for t in storage.get_all())
+
+def test_import_dedups_by_content(fresh_db, tmp_path):
+    import csv
+    from todo_app.importer import fingerprint, import_file
+    assert fingerprint(" Buy  MILK", None, ["b", "a", "a"]) == fingerprint("buy milk", "", ["a", "b"])
+    assert fingerprint("Buy milk", None, ["a"]) != fingerprint("Buy milk", None, ["b"])
+    existing = storage.insert_todo(TodoCreate("Buy milk", tags=["a", "b"]))
+    path = tmp_path / "in.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "description", "tags", "priority"])
+        writer.writerow(["", "buy  MILK", "", '["b", "a"]', "1"])
+        writer.writerow(["", "New", "", "[]", "2"])
+        writer.writerow(["", "new", "", "[]", "4"])
+    result = import_file(str(path), "csv")
+    assert (result.inserted, result.skipped, result.duplicates) == (1, 2, 2)
+    # Re-running the same import adds nothing
+    result = import_file(str(path), "csv", batch_size=1)
+    assert (result.inserted, result.duplicates) == (0, 3)
+    result = import_file(str(path), "csv", on_duplicate="update")
+    assert (result.inserted, result.updated, result.duplicates) == (0, 3, 3)
+    assert storage.get_by_id(existing.id).priority == 1
+    assert [t.priority for t in storage.get_all() if t.title == "new"] == [4]
+    # A todo edited after its import no longer matches its old content
+    storage.update_todo(existing.id, TodoUpdate(title="Buy oat milk"))
+    assert import_file(str(path), "csv").inserted == 1
+    assert import_file(str(path), "csv", on_duplicate="keep").inserted == 3
+    assert len(storage.get_all()) == 6
+    with pytest.raises(ValueError):
+        import_file(str(path), "csv", on_duplicate="merge")
+
+def test_iter_json_records_across_chunks():
+    import io
+    import json
+    from todo_app.importer import iter_json_records
+    records = [{"title": "x" * i, "tags": ["a,]b"]} for i in range(30)]
+    text = json.dumps(records)
+    assert list(iter_json_records(io.StringIO(text), chunk_size=5)) == records
+    assert list(iter_json_records(io.StringIO(" [ ] "))) == []
+    with pytest.raises(ValueError):
+        list(iter_json_records(io.StringIO('[{"title": "cut')))
+
+def test_import_ndjson_roundtrip_and_rollback(fresh_db, tmp_path):
+    _seed(10)
+    out = tmp_path / "out.ndjson"
+    storage.export_todos_ndjson(str(out))
+    with storage.transaction() as conn:
+        conn.execute("DELETE FROM todos")
+    assert storage.import_todos_ndjson(str(out), fast=True).inserted == 10
+    bad = tmp_path / "bad.ndjson"
+    bad.write_text('{"title": "ok"}\n{"no_title": true}\n{not json\n')
+    with pytest.raises(ValueError):
+        storage.import_todos_ndjson(str(bad))
+    # the whole import is one transaction
+    assert len(storage.get_all()) == 10
+    # an invalid record is only counted
+    bad.write_text('{"title": "ok"}\n{"no_title": true}\n')
+    result = storage.import_todos_ndjson(str(bad))
+    assert (result.inserted, result.errors) == (1, 1)
+
+def test_keyset_pages_cover_every_row_once(fresh_db):
+    _seed(53)
+    for order, expected in (("created", storage.get_all()), ("priority", storage.get_all_sorted_by_priority())):
+        seen, cursor = [], None
+        while True:
+            page, cursor = storage.get_page(order=order, after=cursor, limit=10)
+            seen.extend(t.id for t in page)
+            if cursor is None:
+                break
+        assert seen == [t.id for t in expected]
+        assert [t.id for t in storage.iter_todos(order=order, page_size=7)] == seen
+
+def test_iter_todos_filters_and_limit(fresh_db):
+    _seed(30)
+    by_priority = [t.id for t in storage.get_by_priority(2)]
+    assert [t.id for t in storage.iter_todos(priority=2, page_size=2)] == by_priority
+    assert [t.id for t in storage.iter_todos(priority=2, limit=3, page_size=2)] == by_priority[:3]
+    page, cursor = storage.get_page(priority=2, limit=3)
+    assert [t.id for t in storage.iter_todos(priority=2, after=cursor)] == by_priority[3:]
+    assert len(list(storage.iter_todos(title="Seed 1"))) == len(storage.search_by_title("Seed 1"))
+
+def test_invalid_cursor_and_limit_rejected(fresh_db):
+    from todo_app.main import main
+    with pytest.raises(ValueError):
+        storage.get_page(after="not-a-cursor")
+    with pytest.raises(ValueError):
+        storage.get_page(order="priority", after=storage.encode_cursor(("a", "b")))
+    for limit in (0, -1):
+        with pytest.raises(ValueError):
+            storage.get_page(limit=limit)
+        for command in (["list"], ["search", "x"]):
+            with pytest.raises(SystemExit):
+                main(command + ["--limit", str(limit)])
+
+def test_search_text_ranks_and_tracks_changes(fresh_db):
+    milk = storage.insert_todo(TodoCreate("Buy milk", "from the corner store"))
+    store = storage.insert_todo(TodoCreate("Inventory", "milk, bread and eggs"))
+    storage.insert_todo(TodoCreate("Unrelated", "nothing here"))
+    assert [t.id for t in storage.search_text("milk")] == [milk.id, store.id]
+    assert [t.id for t in storage.search_text("corn*")] == [milk.id]
+    assert [t.id for t in storage.search_text('"bread and eggs"')] == [store.id]
+    assert {t.id for t in storage.search_text("corner OR bread")} == {milk.id, store.id}
+    assert storage.search_text('odd: "syntax -') == []
+    storage.update_todo(milk.id, TodoUpdate(title="Buy oat drink", description="store"))
+    assert [t.id for t in storage.search_text("milk")] == [store.id]
+    storage.bulk_delete([store.id])
+    assert storage.search_text("milk") == []
+
+def test_search_text_without_fts5(fresh_db):
+    storage.insert_todo(TodoCreate("Buy milk", "from the corner store"))
+    with storage.transaction() as conn:
+        conn.execute("DROP TABLE todos_fts")
+    assert [t.title for t in storage.search_text("corner milk")] == ["Buy milk"]
+    assert storage.search_text("corner eggs") == []
+    assert storage.rebuild_search_index()
+    assert [t.title for t in storage.search_text("milk")] == ["Buy milk"]
+
+def test_todo_item_decodes_lazily():
+    from datetime import datetime
+    from todo_app.models import TodoItem
+    item = TodoItem.from_row(("id1", "T", None, '["a", "b"]', "TODO", 2, "2024-01-02T03:04:05", "2024-01-02T03:04:06"))
+    assert not hasattr(item, "__dict__")
+    assert item._tags == '["a", "b"]'
+    assert item.tags == ["a", "b"]
+    assert item.tags is item.tags
+    assert item.created_at == datetime(2024, 1, 2, 3, 4, 5)
+    item.tags = ["c"]
+    assert item.to_dict()["tags"] == ["c"]
+    assert TodoItem.from_row(("id2", "T", None, None, "TODO", 3, "2024-01-01", "2024-01-01")).tags == []
+
+def test_get_by_id_cache_hits_and_invalidation(fresh_db):
+    storage.configure_cache(maxsize=100, safe=False)
+    try:
+        t1 = storage.insert_todo(TodoCreate("Cached", tags=["c"]))
+        t2 = storage.insert_todo(TodoCreate("Other"))
+        before = storage.cache_stats()
+        storage.get_by_id(t1.id)
+        first = storage.get_by_id(t1.id)
+        stats = storage.cache_stats()
+        assert stats["hits"] - before["hits"] == 1 and stats["misses"] - before["misses"] == 1
+        # callers get their own copy
+        first.tags.append("mutated")
+        assert storage.get_by_id(t1.id).tags == ["c"]
+
+        storage.update_todo(t1.id, TodoUpdate(title="Changed"))
+        assert storage.get_by_id(t1.id).title == "Changed"
+        storage.bulk_update_status([t1.id], TodoStatus.DONE)
+        assert storage.get_by_id(t1.id).status == TodoStatus.DONE
+        storage.bulk_update_priority([t1.id], 1)
+        assert storage.get_by_id(t1.id).priority == 1
+        storage.rename_tag("c", "d")
+        assert storage.get_by_id(t1.id).tags == ["d"]
+        storage.delete_tag_from_all("d")
+        assert storage.get_by_id(t1.id).tags == []
+        storage.get_by_id(t2.id)
+        storage.bulk_delete([t2.id])
+        assert storage.get_by_id(t2.id) is None
+        storage.delete_todo(t1.id)
+        assert storage.get_by_id(t1.id) is None
+    finally:
+        storage.configure_cache(maxsize=storage.CACHE_SIZE, safe=True)
+
+def test_get_by_id_cache_ignores_rolled_back_writes(fresh_db):
+    todo = storage.insert_todo(TodoCreate("Stable"))
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.update_todo(todo.id, TodoUpdate(title="Uncommitted"))
+            assert storage.get_by_id(todo.id).title == "Uncommitted"
+            raise RuntimeError
+    assert storage.get_by_id(todo.id).title == "Stable"
+
+def test_safe_cache_detects_external_writer(fresh_db):
+    todo = storage.insert_todo(TodoCreate("Before"))
+    assert storage.get_by_id(todo.id).title == "Before"
+    other = sqlite3.connect(fresh_db)
+    other.execute("UPDATE todos SET title = 'After' WHERE id = ?", (encode_id(todo.id),))
+    other.commit()
+    other.close()
+    assert storage.get_by_id(todo.id).title == "After"
+
+def test_writes_do_not_reread(fresh_db, monkeypatch):
+    todo = storage.insert_todo(TodoCreate("NoReread", "d", ["a"], priority=2))
+    monkeypatch.setattr(storage, "_fetch", lambda *a, **k: pytest.fail("insert re-read the row"))
+    created = storage.insert_todo(TodoCreate("Second", tags=["b"]))
+    assert (created.status, created.priority, created.tags) == ("TODO", 3, ["b"])
+    monkeypatch.undo()
+    assert storage.get_by_id(created.id).created_at == created.created_at
+    assert storage.get_by_id(todo.id).title == "NoReread"
+
+def test_partial_updates_do_not_clobber_each_other(fresh_db):
+    todo = storage.insert_todo(TodoCreate("Orig", "desc", ["t"], priority=3))
+    storage.update_todo(todo.id, TodoUpdate(title="A"))
+    updated = storage.update_todo(todo.id, TodoUpdate(priority=1))
+    assert (updated.title, updated.description, updated.tags, updated.priority) == ("A", "desc", ["t"], 1)
+    assert storage.update_todo("missing", TodoUpdate(title="x")) is None
+
+def test_update_without_returning(fresh_db, monkeypatch):
+    monkeypatch.setattr(storage, "HAS_RETURNING", False)
+    todo = storage.insert_todo(TodoCreate("Old"))
+    assert storage.update_todo(todo.id, TodoUpdate(status=TodoStatus.DONE)).status == "DONE"
+    assert storage.update_todo("missing", TodoUpdate(title="x")) is None
+
+def test_insert_many_and_update_many(fresh_db):
+    items = storage.insert_many(TodoCreate(f"Many {i}", tags=["many"]) for i in range(5))
+    assert len(storage.search_by_tag("many")) == 5
+    results = storage.update_many([(items[0].id, TodoUpdate(priority=1)), ("missing", TodoUpdate(title="x")),
+                                   (items[1].id, TodoUpdate(tags=[]))])
+    assert results[0].priority == 1 and results[1] is None and results[2].tags == []
+    assert len(storage.search_by_tag("many")) == 4
+
+def test_concurrent_updates_keep_every_field(fresh_db):
+    import threading
+    todo = storage.insert_todo(TodoCreate("Race"))
+    def bump(field, value):
+        for _ in range(20):
+            storage.update_todo(todo.id, TodoUpdate(**{field: value}))
+    threads = [threading.Thread(target=bump, args=("title", "T")),
+               threading.Thread(target=bump, args=("priority", 5)),
+               threading.Thread(target=bump, args=("description", "D"))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    final = storage.get_by_id(todo.id)
+    assert (final.title, final.priority, final.description) == ("T", 5, "D")
+
+def test_split_chunks_align_to_lines(tmp_path):
+    from todo_app.importer import split_chunks
+    path = tmp_path / "lines.csv"
+    path.write_text("h1,h2\n" + "".join(f"row{i},x\n" for i in range(100)))
+    chunks = split_chunks(str(path), chunk_bytes=37, skip_header=True)
+    data = path.read_bytes()
+    assert chunks[0][0] == len("h1,h2\n") and chunks[-1][1] == len(data)
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert all(data[end - 1:end] == b"\n" for _, end in chunks)
+
+def test_parallel_import_matches_sequential(fresh_db, tmp_path):
+    import json
+    from todo_app.importer import import_file_parallel
+    existing = storage.insert_todo(TodoCreate("Existing"))
+    lines = [json.dumps({"title": f"Par {i}", "tags": [f"t{i % 3}"], "priority": i % 5 + 1}) for i in range(300)]
+    lines[10] = json.dumps({"title": "", "tags": []})
+    lines[20] = "{not json"
+    lines[30] = json.dumps({"id": existing.id, "title": "dup"})
+    path = tmp_path / "big.ndjson"
+    path.write_text("\n".join(lines) + "\n")
+    seen = []
+    result = import_file_parallel(str(path), "ndjson", workers=2, chunk_bytes=512,
+                                  error_path=str(tmp_path / "errors.ndjson"),
+                                  progress=lambda r, done, total: seen.append((done, total)))
+    assert (result.inserted, result.skipped, result.errors) == (297, 1, 2)
+    assert seen[-1][0] == seen[-1][1] == path.stat().st_size
+    errors = [json.loads(line) for line in (tmp_path / "errors.ndjson").read_text().splitlines()]
+    assert [e["line"] for e in errors] == [lines[10], lines[20]]
+    assert path.read_bytes()[errors[1]["offset"]:].startswith(b"{not json")
+    assert len(storage.search_by_tag("t1")) == 100 - (10 % 3 == 1) - (20 % 3 == 1)
+
+def test_parallel_csv_import_reports_bad_rows(fresh_db, tmp_path):
+    from todo_app.importer import import_file_parallel
+    path = tmp_path / "in.csv"
+    path.write_text('id,title,description,tags,status,priority,created_at,updated_at\n'
+                    '1,Good,d,"[""a""]",TODO,2,,\n'
+                    '2,Bad tags,d,[oops,TODO,2,,\n'
+                    '3,Bad priority,d,[],TODO,9,,\n')
+    result = import_file_parallel(str(path), "csv", workers=2)
+    assert (result.inserted, result.errors) == (1, 2)
+    assert [t.title for t in storage.search_by_tag("a")] == ["Good"]
+    with pytest.raises(ValueError):
+        import_file_parallel(str(path), "json", workers=2)
+
+def test_serial_and_parallel_imports_reject_the_same_records(fresh_db, tmp_path):
+    import json
+    from todo_app.importer import import_file, import_file_parallel
+    from todo_app.models import TodoFilter
+    records = [{"title": f"P{p}", "tags": ["p"], "priority": p} for p in (-1, 1, 5, 6, 9, "x")]
+    records += [{"tags": ["p"]}, {"title": "Bad tags", "tags": "p"}, {"title": 3, "tags": ["p"]}, ["p"]]
+    path = tmp_path / "in.ndjson"
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    serial = import_file(str(path), "ndjson")
+    assert (serial.inserted, serial.errors) == (2, 8)
+    assert sorted(t.priority for t in storage.search_by_tag("p")) == [1, 5]
+    storage.bulk_delete_where(TodoFilter(tag="p"))
+    parallel = import_file_parallel(str(path), "ndjson", workers=2)
+    assert (parallel.inserted, parallel.errors) == (serial.inserted, serial.errors)
+
+def test_delta_export_and_merge_sync(tmp_path):
+    import json
+    from todo_app.importer import import_file
+    old_path = storage.DB_PATH
+    a, b = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    try:
+        storage.DB_PATH = a
+        storage.init_db()
+        keep = storage.insert_todo(TodoCreate("Keep", tags=["x"]))
+        gone = storage.insert_todo(TodoCreate("Gone"))
+        out = str(tmp_path / "full.ndjson")
+        rows, tombs, checkpoint = storage.export_todos_changes(out)
+        assert (rows, tombs) == (2, 0)
+
+        storage.DB_PATH = b
+        storage.init_db()
+        result = import_file(out, "ndjson", merge=True)
+        assert result.inserted == 2
+        assert storage.get_by_id(keep.id).created_at == keep.created_at
+
+        storage.DB_PATH = a
+        storage.update_todo(keep.id, TodoUpdate(title="Kept"))
+        storage.delete_todo(gone.id)
+        delta = str(tmp_path / "delta.json")
+        rows, tombs, next_checkpoint = storage.export_todos_changes(delta, checkpoint, "json")
+        assert (rows, tombs) == (1, 1) and next_checkpoint > checkpoint
+        assert [r.get("title") for r in json.load(open(delta))] == ["Kept", None]
+
+        storage.DB_PATH = b
+        result = import_file(delta, "json", merge=True)
+        assert (result.updated, result.deleted) == (1, 1)
+        assert storage.get_by_id(keep.id).title == "Kept" and storage.get_by_id(gone.id) is None
+        assert storage.search_by_tag("x")[0].title == "Kept"
+        # Re-applying the same delta changes nothing
+        result = import_file(delta, "json", merge=True)
+        assert (result.inserted, result.updated, result.deleted, result.skipped) == (0, 0, 0, 2)
+        # The older full export loses to both the update and the delete
+        result = import_file(out, "ndjson", merge=True)
+        assert result.skipped == 2 and storage.get_by_id(gone.id) is None
+        assert storage.get_by_id(keep.id).title == "Kept"
+    finally:
+        storage.close_pool()
+        storage.DB_PATH = old_path
+
+def test_merge_counts_invalid_records_as_errors(fresh_db, tmp_path):
+    import json, uuid
+    from todo_app.importer import import_file
+    stamp = "2024-05-01T10:00:00+00:00"
+    base = {"created_at": stamp, "updated_at": stamp}
+    records = [dict(base, id=str(uuid.uuid4()), title="Good", status="DONE", priority=5),
+               dict(base, id=str(uuid.uuid4()), title="Bad status", status="lost"),
+               dict(base, id=str(uuid.uuid4()), title="Bad priority", priority=9),
+               dict(base, id=str(uuid.uuid4()), title="Bad tags", tags="x"),
+               dict(base, id=str(uuid.uuid4())),
+               dict(base, id=str(uuid.uuid4()), title="Default")]
+    path = tmp_path / "merge.json"
+    path.write_text(json.dumps(records))
+    result = import_file(str(path), "json", merge=True)
+    assert (result.inserted, result.errors) == (2, 4)
+    merged = {t.title: t for t in storage.get_all()}
+    assert set(merged) == {"Good", "Default"}
+    assert (merged["Good"].status, merged["Good"].priority) == ("DONE", 5)
+    assert (merged["Default"].status, merged["Default"].priority) == ("TODO", 3)
+
+def test_tag_changes_are_exported_as_changes(fresh_db, tmp_path):
+    import json
+    storage.insert_todo(TodoCreate("Tagged", tags=["old", "gone"]))
+    storage.insert_todo(TodoCreate("Untagged"))
+    _, _, checkpoint = storage.export_todos_changes(str(tmp_path / "full.ndjson"))
+    assert storage.rename_tag("old", "new") == 1
+    assert storage.delete_tag_from_all("gone") == 1
+    delta = str(tmp_path / "delta.json")
+    assert storage.export_todos_changes(delta, checkpoint, "json")[:2] == (1, 0)
+    assert [r["tags"] for r in json.load(open(delta))] == [["new"]]
+
+def test_bulk_delete_leaves_tombstones_and_purge(fresh_db, tmp_path):
+    ids = [t.id for t in storage.insert_many(TodoCreate(f"T{i}") for i in range(3))]
+    assert storage.bulk_delete(ids[:2] + ["missing"]) == 2
+    rows, tombs, _ = storage.export_todos_changes(str(tmp_path / "d.ndjson"), "2000-01-01T00:00:00+00:00")
+    assert (rows, tombs) == (1, 2)
+    assert storage.purge_tombstones("2999-01-01") == 2
+    with pytest.raises(ValueError):
+        storage.export_todos_changes(str(tmp_path / "d.csv"), None, "csv")
+
+def test_export_since_timestamp_or_checkpoint(fresh_db, tmp_path, capsys):
+    from todo_app import main
+    path = tmp_path / "sync.checkpoint"
+    assert main.read_checkpoint(str(path)) is None
+    path.write_text("2024-05-01T10:00:00.500000\n")
+    assert main.read_checkpoint(str(path)) == "2024-05-01T09:59:00.500000"
+    path.unlink()
+    storage.insert_todo(TodoCreate("Synced"))
+    out = str(tmp_path / "d.ndjson")
+    main.main(["export", "ndjson", out, "--checkpoint", str(path)])
+    assert "Exported 1 changed" in capsys.readouterr().out and path.read_text().strip()
+    main.main(["export", "ndjson", out, "--since", "2999-01-01T00:00:00Z"])
+    assert "Exported 0 changed" in capsys.readouterr().out
+    # A mistyped timestamp is an error, not a checkpoint file
+    with pytest.raises(SystemExit):
+        main.main(["export", "ndjson", out, "--since", "2024-13-45"])
+    assert not os.path.exists("2024-13-45")
+
+def _counted_from_rows():
+    todos = storage.get_all()
+    counts = {"total": len(todos), "status": {}, "priority": {}, "tags": {}}
+    for t in todos:
+        counts["status"][t.status] = counts["status"].get(t.status, 0) + 1
+        counts["priority"][t.priority] = counts["priority"].get(t.priority, 0) + 1
+        for tag in set(t.tags):
+            counts["tags"][tag] = counts["tags"].get(tag, 0) + 1
+    return counts
+
+def test_stats_follow_every_write_path(fresh_db, tmp_path):
+    items = storage.insert_many(TodoCreate(f"S{i}", tags=["a", "b"][: i % 3], priority=i % 5 + 1) for i in range(12))
+    ids = [t.id for t in items]
+    storage.update_todo(ids[0], TodoUpdate(status=TodoStatus.DONE, priority=1, tags=["c"]))
+    storage.bulk_update_status(ids[1:4], "IN_PROGRESS")
+    storage.bulk_update_priority(ids[4:6], 5)
+    storage.rename_tag("a", "b")
+    storage.delete_tag_from_all("c")
+    storage.delete_todo(ids[6])
+    storage.bulk_delete(ids[7:9])
+    path = tmp_path / "more.ndjson"
+    path.write_text('{"title": "Imported", "tags": ["imp"], "priority": 2}\n')
+    storage.import_todos_ndjson(str(path))
+    assert storage.stats() == _counted_from_rows()
+    assert storage.stats()["tags"]["b"] == len(storage.search_by_tag("b"))
+
+def test_recompute_stats_repairs_drift(fresh_db):
+    storage.insert_many(TodoCreate(f"R{i}", tags=["x"]) for i in range(3))
+    with storage.transaction() as conn:
+        conn.execute("UPDATE todo_counters SET count = 99")
+    assert storage.stats()["total"] == 99
+    assert storage.recompute_stats() == _counted_from_rows()
+
+def test_bulk_ops_stream_ids_past_in_limit(fresh_db):
+    ids = [t.id for t in storage.insert_many(TodoCreate(f"T{i}") for i in range(1200))]
+    assert storage.bulk_update_status((tid for tid in ids[:1100]), TodoStatus.DONE) == 1100
+    assert storage.get_by_id(ids[1099]).status == TodoStatus.DONE
+    assert storage.get_by_id(ids[1100]).status == TodoStatus.TODO
+    assert storage.bulk_update_priority(iter(ids[100:]), 1) == 1100
+    assert storage.bulk_delete(ids[:1050] + ids[:10]) == 1050
+    assert storage.stats()["total"] == 150
+    rows, tombs, _ = storage.export_todos_changes(str(fresh_db) + ".ndjson", "2000-01-01T00:00:00+00:00")
+    assert tombs == 1050
+
+def test_bulk_ops_where(fresh_db, tmp_path):
+    from todo_app.models import TodoFilter
+    old = storage.insert_many([TodoCreate(f"Old{i}", tags=["sprint-12"] if i % 2 else []) for i in range(6)])
+    storage.bulk_update_status([t.id for t in old[:4]], TodoStatus.IN_PROGRESS)
+    with storage.transaction() as conn:
+        conn.execute("UPDATE todos SET created_at = ?", (encode_time("2020-01-01T00:00:00"),))
+    new = storage.insert_todo(TodoCreate("New", tags=["sprint-12"]))
+    storage.update_todo(new.id, TodoUpdate(status=TodoStatus.IN_PROGRESS))
+    where = TodoFilter(status=TodoStatus.IN_PROGRESS, tag="sprint-12", created_before="2024-01-01T00:00:00")
+    assert storage.bulk_update_status_where(where, TodoStatus.DONE) == 2
+    assert {t.id for t in storage.get_all() if t.status == TodoStatus.DONE} == {old[1].id, old[3].id}
+    # Already DONE: nothing left to change
+    assert storage.bulk_update_status_where(TodoFilter(tag="sprint-12", status="DONE"), "DONE") == 0
+    assert storage.bulk_update_priority_where(TodoFilter(tag="sprint-12"), 5) == 4
+    assert storage.get_by_id(new.id).priority == 5
+    assert storage.bulk_delete_where(TodoFilter(created_before="2024-01-01", title="Old")) == 6
+    assert [t.id for t in storage.get_all()] == [new.id]
+    _, tombs, _ = storage.export_todos_changes(str(tmp_path / "d.ndjson"), "2000-01-01T00:00:00+00:00")
+    assert tombs == 6
+    with pytest.raises(ValueError):
+        storage.bulk_delete_where(TodoFilter())
+
+def test_bulk_cli_ids_from_and_where(fresh_db, tmp_path, capsys):
+    from todo_app.main import main, parse_age
+    todos = storage.insert_many([TodoCreate(f"C{i}", tags=["cli"] if i < 3 else []) for i in range(5)])
+    path = tmp_path / "ids.txt"
+    path.write_text("\n".join(t.id for t in todos[:2]) + "\n\n")
+    main(["bulk-update-priority", "1", "--ids-from", str(path)])
+    assert capsys.readouterr().out == "Updated priority for 2 todos.\n"
+    main(["bulk-update-status", "DONE", "--where-tag", "cli", "--older-than", "0s"])
+    assert capsys.readouterr().out == "Updated status for 3 todos.\n"
+    main(["bulk-delete", "--where-status", "DONE", "--where-priority", "1"])
+    assert capsys.readouterr().out == "Deleted 2 todos.\n"
+    assert storage.stats()["total"] == 3
+    for argv in (["bulk-delete"], ["bulk-delete", todos[4].id, "--where-tag", "cli"],
+                 ["bulk-delete", "--older-than", "3x"]):
+        with pytest.raises(SystemExit):
+            main(argv)
+    assert parse_age("2w") < parse_age("1d") < parse_age("90m")
+
+def test_query_combines_filters(fresh_db):
+    from todo_app.models import TodoFilter
+    creates = [TodoCreate(f"Task {i}" + (" report" if i % 4 == 0 else ""), None,
+                          [f"t{i % 3}", f"u{i % 5}"] + (["common"] if i % 2 else []), i % 5 + 1) for i in range(60)]
+    todos = storage.insert_many(creates)
+    storage.bulk_update_status([t.id for t in todos[::3]], TodoStatus.DONE)
+    everything = storage.get_all()
+    checks = [
+        (dict(status=["TODO", "IN_PROGRESS"], priority_max=2),
+         lambda t: t.status != "DONE" and t.priority <= 2),
+        (dict(priority=[1, 5], tags_any=["t1", "u2"]),
+         lambda t: t.priority in (1, 5) and ("t1" in t.tags or "u2" in t.tags)),
+        (dict(tag="common", tags_all=["t2", "u1"]),
+         lambda t: {"common", "t2", "u1"} <= set(t.tags)),
+        (dict(text="report", status="DONE"), lambda t: "report" in t.title and t.status == "DONE"),
+        (dict(title="Task 1", priority_min=3), lambda t: "Task 1" in t.title and t.priority >= 3),
+        (dict(created_after="2000-01-01", updated_before="2999-01-01", tags_any=["nope"]), lambda t: False),
+    ]
+    for filters, keep in checks:
+        expected = [t.id for t in everything if keep(t)]
+        assert [t.id for t in storage.query(**filters)] == expected, filters
+        # Small limits probe todo_tags while walking the index instead
+        assert [t.id for t in storage.query(limit=2, **filters)] == expected[:2], filters
+        page, cursor = storage.get_page(where=TodoFilter(**filters), limit=3)
+        assert [t.id for t in page] == expected[:3]
+        assert [t.id for t in storage.query(after=cursor, **filters)] == expected[3:] if cursor else True
+    by_priority = storage.query(order="priority", tag="common")
+    assert [t.priority for t in by_priority] == sorted(t.priority for t in by_priority)
+    with pytest.raises(ValueError):
+        storage.query(order="title")
+
+def test_query_shapes_share_one_statement(fresh_db):
+    storage.insert_many([TodoCreate(f"S{i}", tags=["a", "b"]) for i in range(3)])
+    first = storage.explain_query(status=["TODO", "DONE"], priority=[1, 2, 3], tags_any=["a", "z"], limit=10)
+    second = storage.explain_query(status=["TODO", "IN_PROGRESS"], priority=[4, 5], tags_any=["c", "d", "e"], limit=10)
+    assert first["sql"] == second["sql"] and second["cached"]
+    assert first["params"] != second["params"] and first["plan"]
+    # One value or a list of one compiles like a single value
+    assert storage.explain_query(status=["TODO"])["sql"] == storage.explain_query(status="TODO")["sql"]
+
+def test_find_cli(fresh_db, capsys):
+    from todo_app.main import main
+    todos = storage.insert_many([TodoCreate(f"F{i}", tags=["x"] if i % 2 else ["y"], priority=i % 5 + 1)
+                                 for i in range(10)])
+    main(["find", "--tag", "x", "--priority-max", "3", "--created-after", "1h", "--format", "ids"])
+    expected = [t.id for t in reversed(todos) if "x" in t.tags and t.priority <= 3]
+    assert capsys.readouterr().out.split() == expected
+    main(["find", "--status", "TODO", "--any-tag", "x", "--any-tag", "y", "--explain"])
+    out = capsys.readouterr().out
+    assert out.startswith("SQL: SELECT") and "Plan:" in out and "Compiled:" in out
+    with pytest.raises(SystemExit):
+        main(["find", "--created-before", "yesterday"])
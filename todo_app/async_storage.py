@@ -0,0 +1,232 @@
+# todo_app/async_storage.py
+#
+# Coroutine versions of the todo_app.storage API for asyncio services.
+#
+#     from todo_app import async_storage
+#     todo = await async_storage.insert_todo(TodoCreate("Write report"))
+#     todos = await async_storage.get_by_status("TODO")
+#     await async_storage.close()
+#
+# Reads run on a bounded thread pool sized to the connection pool's readers,
+# so every worker thread always has a reader connection of its own. Writes go
+# through one queue drained by a single writer thread: whatever writes are
+# waiting when the writer becomes free are applied in one transaction (each in
+# its own savepoint, so a failing write does not undo the others) and
+# committed together. When the queue is full, callers wait in put() until
+# the writer catches up.
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Optional
+
+from . import storage
+from .models import TodoFilter, TodoItem
+
+WRITE_QUEUE_SIZE = 1000
+MAX_BATCH = 200
+
+READ_OPS = (
+    "get_all", "get_by_id", "get_by_status", "get_by_priority", "get_all_sorted_by_priority",
+    "search_by_title", "search_by_tag", "search_text", "get_page", "query", "explain_query",
+    "list_tags", "stats",
+    "export_todos_json", "export_todos_ndjson", "export_todos_csv", "export_todos_changes",
+)
+# Writes that can share a group-commit transaction with other writes
+WRITE_OPS = (
+    "insert_todo", "insert_many", "update_todo", "update_many", "delete_todo",
+    "bulk_update_status", "bulk_delete", "bulk_update_priority",
+    "bulk_update_status_where", "bulk_delete_where", "bulk_update_priority_where",
+    "rename_tag", "delete_tag_from_all", "purge_tombstones", "recompute_stats",
+)
+# Writes that manage their own transaction (and PRAGMAs), so they run alone
+SOLO_WRITE_OPS = (
+    "init_db", "rebuild_search_index", "flush",
+    "import_todos_json", "import_todos_ndjson", "import_todos_csv",
+)
+
+
+class AsyncStorage:
+    def __init__(self, workers: Optional[int] = None, queue_size: int = WRITE_QUEUE_SIZE,
+                 max_batch: int = MAX_BATCH):
+        self.workers = workers or max(1, storage.POOL_READERS)
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.writes = 0
+        self.commits = 0
+        self._readers = ThreadPoolExecutor(self.workers, thread_name_prefix="todo-read")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="todo-write")
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _start(self):
+        if self._closed:
+            raise RuntimeError("AsyncStorage is closed")
+        if self._task is None:
+            self.loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue(self.queue_size)
+            self._task = self.loop.create_task(self._write_loop())
+
+    async def read(self, fn, *args, **kwargs):
+        self._start()
+        return await self.loop.run_in_executor(self._readers, functools.partial(fn, *args, **kwargs))
+
+    # Queue a write and wait until it has been committed. Waits for room
+    # first when the queue is full.
+    async def write(self, fn, *args, solo: bool = False, **kwargs):
+        self._start()
+        future = self.loop.create_future()
+        await self._queue.put((functools.partial(fn, *args, **kwargs), future, solo))
+        return await future
+
+    async def _write_loop(self):
+        stopping = False
+        while not stopping:
+            jobs = [await self._queue.get()]
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            if None in jobs:
+                stopping = True
+                jobs = [job for job in jobs if job is not None]
+            # Consecutive batchable jobs share a transaction; solo jobs run alone
+            group = []
+            for job in jobs:
+                if job[2]:
+                    await self._commit(group)
+                    await self._commit([job], solo=True)
+                    group = []
+                else:
+                    group.append(job)
+            await self._commit(group)
+
+    async def _commit(self, jobs, solo: bool = False):
+        if not jobs:
+            return
+        run = _run_solo if solo else _run_group
+        try:
+            outcomes = await self.loop.run_in_executor(self._writer, run, [job[0] for job in jobs])
+        except Exception as exc:
+            outcomes = [(False, exc)] * len(jobs)
+        else:
+            self.commits += 1
+            self.writes += len(jobs)
+        for (_fn, future, _solo), (ok, value) in zip(jobs, outcomes):
+            if future.cancelled():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def queue_stats(self) -> Dict[str, int]:
+        return {
+            "writes": self.writes,
+            "commits": self.commits,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    # Finish the queued writes, then stop the writer and the worker threads
+    async def close(self):
+        if self._closed:
+            return
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+        self._closed = True
+        self._writer.shutdown(wait=False)
+        self._readers.shutdown(wait=False)
+
+    # Iterate todos page by page without blocking the loop; same arguments
+    # as storage.iter_todos
+    async def iter_todos(self, status: Optional[str] = None, priority: Optional[int] = None,
+                         title: Optional[str] = None, order: str = "created", after: Optional[str] = None,
+                         limit: Optional[int] = None, page_size: int = storage.PAGE_SIZE,
+                         where: Optional[TodoFilter] = None) -> AsyncIterator[TodoItem]:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            items, after = await self.get_page(status, priority, title, order, after, size, where)
+            for item in items:
+                yield item
+            if after is None:
+                return
+            if remaining is not None:
+                remaining -= len(items)
+
+
+def _run_group(fns):
+    outcomes = []
+    with storage.transaction():
+        for fn in fns:
+            try:
+                with storage.transaction():
+                    outcomes.append((True, fn()))
+            except Exception as exc:
+                outcomes.append((False, exc))
+    return outcomes
+
+def _run_solo(fns):
+    try:
+        return [(True, fns[0]())]
+    except Exception as exc:
+        return [(False, exc)]
+
+
+# The storage function is looked up on every call so that wrappers installed
+# on the storage module later still apply
+def _reader(name):
+    async def method(self, *args, **kwargs):
+        return await self.read(getattr(storage, name), *args, **kwargs)
+    method.__name__ = name
+    return method
+
+def _writer(name, solo=False):
+    async def method(self, *args, **kwargs):
+        return await self.write(getattr(storage, name), *args, solo=solo, **kwargs)
+    method.__name__ = name
+    return method
+
+for _name in READ_OPS:
+    setattr(AsyncStorage, _name, _reader(_name))
+for _name in WRITE_OPS:
+    setattr(AsyncStorage, _name, _writer(_name))
+for _name in SOLO_WRITE_OPS:
+    setattr(AsyncStorage, _name, _writer(_name, solo=True))
+
+
+# Module-level API backed by one AsyncStorage per event loop
+_default: Optional[AsyncStorage] = None
+
+def get_default() -> AsyncStorage:
+    global _default
+    loop = asyncio.get_running_loop()
+    if _default is None or _default._closed or (_default.loop is not None and _default.loop is not loop):
+        if _default is not None:
+            # Left over from an earlier loop (e.g. a previous asyncio.run)
+            _default._writer.shutdown(wait=False)
+            _default._readers.shutdown(wait=False)
+        _default = AsyncStorage()
+    return _default
+
+async def close():
+    global _default
+    if _default is not None:
+        default, _default = _default, None
+        await default.close()
+
+def iter_todos(*args, **kwargs) -> AsyncIterator[TodoItem]:
+    return get_default().iter_todos(*args, **kwargs)
+
+def _module_op(name):
+    async def op(*args, **kwargs):
+        return await getattr(get_default(), name)(*args, **kwargs)
+    op.__name__ = name
+    return op
+
+for _name in READ_OPS + WRITE_OPS + SOLO_WRITE_OPS:
+    globals()[_name] = _module_op(_name)
+del _name
@@ -0,0 +1,79 @@
+# todo_app/client.py
+#
+# Thin client for `todo-app serve`: forwards a command line to the warm
+# server process and streams its output back. It only imports what it needs
+# from the standard library, so it starts faster than the full CLI.
+#
+#     todo-client list --limit 5
+#
+# Scripts can keep one connection open and run many commands over it:
+#
+#     with TodoClient() as client:
+#         client.run(["add", "Buy milk"])
+import json
+import os
+import socket
+import sys
+from typing import List, Optional, TextIO
+
+DEFAULT_SOCKET = "todos.sock"
+
+
+def socket_path() -> str:
+    return os.environ.get("TODO_APP_SOCKET") or DEFAULT_SOCKET
+
+
+class TodoClient:
+    # Requests are JSON lines {"argv": [...], "cwd": "..."}; the server replies
+    # with {"out": text} / {"err": text} frames and a final {"exit": status}
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or socket_path()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(self.path)
+        self._rfile = self._sock.makefile("rb")
+
+    def run(self, argv: List[str], out: Optional[TextIO] = None, err: Optional[TextIO] = None) -> int:
+        out = out or sys.stdout
+        err = err or sys.stderr
+        request = {"argv": list(argv), "cwd": os.getcwd()}
+        self._sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for line in self._rfile:
+            frame = json.loads(line)
+            if "exit" in frame:
+                return frame["exit"]
+            if "out" in frame:
+                out.write(frame["out"])
+            else:
+                err.write(frame["err"])
+        raise ConnectionError("todo-app server closed the connection")
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        client = TodoClient()
+    except OSError:
+        print(f"No todo-app server at {socket_path()}; start one with `todo-app serve`.", file=sys.stderr)
+        sys.exit(2)
+    with client:
+        try:
+            status = client.run(argv)
+        except BrokenPipeError:
+            # Our reader went away (e.g. `| head`); see main.exit_on_broken_pipe
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            status = 1
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# todo_app/connection.py
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Type
+
+# PRAGMAs applied to every connection the pool opens. WAL lets the reader
+# connections keep working while the writer holds a transaction.
+DEFAULT_PRAGMAS: Dict[str, object] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+DEFAULT_READERS = 4
+
+logger = logging.getLogger(__name__)
+
+# Prepared statements kept per connection, keyed by SQL text. Statements that
+# differ only in their parameters (see storage.query) are prepared and
+# planned once and then reused.
+STATEMENT_CACHE_SIZE = 256
+
+
+def _is_memory(path: str) -> bool:
+    return path == ":memory:" or path.startswith("file::memory:")
+
+
+class ConnectionPool:
+    # One long-lived writer connection plus up to `readers` reader connections.
+    # The writer is serialized by a re-entrant lock; a thread that holds it also
+    # reads through it, so it sees its own uncommitted changes.
+    # factory is the sqlite3.Connection class connections are opened with
+    def __init__(self, path: str, readers: int = DEFAULT_READERS, pragmas: Optional[Dict[str, object]] = None,
+                 factory: Type[sqlite3.Connection] = sqlite3.Connection):
+        self.path = path
+        # What connections open; MemoryPool keeps `path` as the file it mirrors
+        self.database = path
+        self.factory = factory
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        # Every connection to ":memory:" is its own database, so everything
+        # has to go through the writer.
+        self.readers = 0 if _is_memory(path) else max(0, int(readers))
+        self.opened = 0
+        self._slots = threading.BoundedSemaphore(self.readers) if self.readers else None
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+        self._owner: Optional[int] = None
+        self._depth = 0
+        self._after_commit: List[Callable[[], None]] = []
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, check_same_thread=False, isolation_level=None, factory=self.factory,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._conns_lock:
+            self._conns.append(conn)
+            self.opened += 1
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = self._open()
+        return self._writer
+
+    # Set a PRAGMA on the writer connection and return its previous value.
+    # Must be called outside a transaction.
+    def set_pragma(self, name: str, value: object):
+        with self._write_lock:
+            conn = self._get_writer()
+            previous = conn.execute(f"PRAGMA {name}").fetchone()[0]
+            conn.execute(f"PRAGMA {name}={value}")
+            return previous
+
+    def in_transaction(self) -> bool:
+        return self._owner == threading.get_ident()
+
+    # Run fn once the current thread's transaction commits (dropped on
+    # rollback), or right away outside a transaction
+    def call_after_commit(self, fn: Callable[[], None]):
+        if self.in_transaction():
+            self._after_commit.append(fn)
+        else:
+            fn()
+
+    # PRAGMA data_version of the writer; it changes whenever another
+    # connection (e.g. another process) commits. Returns None instead of
+    # waiting when another thread holds the writer.
+    def data_version(self) -> Optional[int]:
+        if not self._write_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._get_writer().execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self._write_lock.release()
+
+    @contextmanager
+    def read(self):
+        if self._slots is None or self.in_transaction():
+            with self._write_lock:
+                yield self._get_writer()
+            return
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+
+    # Runs the block in a transaction on the writer connection. Nested calls
+    # from the same thread become savepoints of the outer transaction.
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            conn = self._get_writer()
+            depth = self._depth
+            if depth == 0:
+                conn.execute("BEGIN IMMEDIATE")
+                self._owner = threading.get_ident()
+            else:
+                conn.execute(f"SAVEPOINT sp{depth}")
+            self._depth = depth + 1
+            try:
+                yield conn
+            except BaseException:
+                self._depth = depth
+                if depth == 0:
+                    self._owner = None
+                    del self._after_commit[:]
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                else:
+                    conn.execute(f"ROLLBACK TO sp{depth}")
+                    conn.execute(f"RELEASE sp{depth}")
+                raise
+            self._depth = depth
+            if depth == 0:
+                self._owner = None
+                callbacks, self._after_commit = self._after_commit, []
+                try:
+                    conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+                for fn in callbacks:
+                    fn()
+            else:
+                conn.execute(f"RELEASE sp{depth}")
+
+    def close(self):
+        with self._write_lock:
+            with self._conns_lock:
+                conns, self._conns = self._conns, []
+            self._writer = None
+            self._idle = queue.LifoQueue()
+            for conn in conns:
+                if not _is_memory(self.path):
+                    _optimize(conn)
+                conn.close()
+
+# Before closing a connection, refresh the query planner's statistics for the
+# tables its queries would have planned better with them (SQLite's advice for
+# long-lived connections); analysis_limit keeps it quick on big tables
+def _optimize(conn: sqlite3.Connection):
+    try:
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("PRAGMA optimize")
+    except sqlite3.Error:
+        pass
+
+
+# Flush settings of MemoryPool: seconds between flushes (None: only on the
+# row threshold and on close) and changed rows that trigger an early one
+DEFAULT_FLUSH_INTERVAL: Optional[float] = 5.0
+DEFAULT_FLUSH_ROWS = 10000
+
+
+class MemoryPool(ConnectionPool):
+    # Write-behind pool: the database lives in one in-memory connection,
+    # loaded from `path` when it is opened, and is copied back to `path` with
+    # the SQLite backup API every flush_interval seconds, once flush_rows
+    # rows have changed since the last flush, and on close() (also run at
+    # interpreter exit). Each flush replaces the file with a consistent
+    # snapshot in one transaction, so the file always holds the state of the
+    # last completed flush; changes after it are lost on a crash. Writers
+    # wait while a flush runs. Nothing else may write to `path` meanwhile:
+    # the next flush would overwrite it.
+    def __init__(self, path: str, flush_interval: Optional[float] = DEFAULT_FLUSH_INTERVAL,
+                 flush_rows: Optional[int] = DEFAULT_FLUSH_ROWS, pragmas: Optional[Dict[str, object]] = None,
+                 factory: Type[sqlite3.Connection] = sqlite3.Connection):
+        super().__init__(path, readers=0, pragmas=pragmas, factory=factory)
+        self.database = ":memory:"
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.flushes = 0
+        self._flushed_changes = 0
+        self._disk: Optional[sqlite3.Connection] = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._flusher: Optional[threading.Thread] = None
+
+    def _open(self) -> sqlite3.Connection:
+        conn = super()._open()
+        if os.path.exists(self.path):
+            source = sqlite3.connect(self.path)
+            try:
+                source.backup(conn)
+            finally:
+                source.close()
+        self._flushed_changes = conn.total_changes
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="todo-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+        return conn
+
+    # Rows changed since the last flush, as SQLite counts them: including the
+    # rows triggers change (tag index, counters, search index)
+    def dirty(self) -> int:
+        writer = self._writer
+        return writer.total_changes - self._flushed_changes if writer is not None else 0
+
+    @contextmanager
+    def write(self):
+        with super().write() as conn:
+            yield conn
+        if self.flush_rows and not self.in_transaction() and self.dirty() >= self.flush_rows:
+            self._wake.set()
+
+    # Copy the database to `path` now; returns False when nothing changed
+    def flush(self) -> bool:
+        with self._write_lock:
+            if self._depth:
+                raise RuntimeError("Cannot flush inside a transaction")
+            writer = self._writer
+            if writer is None:
+                return False
+            changes = writer.total_changes
+            if changes == self._flushed_changes and os.path.exists(self.path):
+                return False
+            if self._disk is None:
+                self._disk = sqlite3.connect(self.path, check_same_thread=False)
+            writer.backup(self._disk)
+            self._flushed_changes = changes
+            self.flushes += 1
+            return True
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing %s failed", self.path)
+
+    def close(self):
+        self._stopping = True
+        self._wake.set()
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            atexit.unregister(self.close)
+            if flusher is not threading.current_thread():
+                flusher.join()
+        with self._write_lock:
+            try:
+                self.flush()
+            finally:
+                if self._disk is not None:
+                    self._disk.close()
+                    self._disk = None
+                super().close()
+        self._stopping = False
@@ -0,0 +1,60 @@
+# todo_app/encoding.py
+#
+# How todos are stored (schema version 9). Ids are 16-byte UUID BLOBs and
+# timestamps integer microseconds since the Unix epoch (naive UTC), so index
+# entries are small and comparisons are integer or memcmp compares. The public
+# forms are unchanged: ids are canonical UUID strings and timestamps datetimes
+# (ISO-8601 text in exports).
+#
+# An id that is not a canonical lowercase UUID (legacy or imported data) is
+# stored as TEXT in the same column, so every id round-trips exactly.
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_id(tid: str):
+    if len(tid) == 36:
+        try:
+            blob = bytes.fromhex(tid.replace("-", ""))
+        except ValueError:
+            return tid
+        if len(blob) == 16 and decode_id(blob) == tid:
+            return blob
+    return tid
+
+def decode_id(value) -> str:
+    if value.__class__ is bytes:
+        h = value.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+    return value
+
+# A datetime or ISO-8601 text (naive means UTC) as stored microseconds
+def encode_time(value) -> int:
+    if value.__class__ is str:
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // _MICROSECOND
+
+def decode_time(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+# The ISO-8601 text the stored timestamp stood for, as datetime.isoformat()
+def time_text(micros: int) -> str:
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+def now() -> int:
+    return encode_time(datetime.utcnow())
+
+# A row in storage.COLUMNS order with public values (id text, ISO-8601
+# timestamps) as stored, and back
+def encode_row(row) -> Tuple:
+    tid, title, description, tags, status, priority, created_at, updated_at = row
+    return (encode_id(tid), title, description, tags, status, priority, encode_time(created_at), encode_time(updated_at))
+
+def decode_row(row) -> Tuple:
+    tid, title, description, tags, status, priority, created_at, updated_at = row
+    return (decode_id(tid), title, description, tags, status, priority, time_text(created_at), time_text(updated_at))
@@ -0,0 +1,543 @@
+# todo_app/importer.py
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import storage
+from .encoding import decode_id, encode_id, now as _now
+from .models import TodoStatus, PRIORITY_MIN, PRIORITY_MAX
+
+IMPORT_BATCH_SIZE = 500
+READ_CHUNK_SIZE = 1 << 16
+# Page cache (in KiB, as a negative cache_size) used while importing; the
+# random UUID keys make index maintenance touch pages all over the file.
+IMPORT_CACHE_KIB = 65536
+# Parallel imports: bytes of input parsed per worker task, and the number of
+# parsed chunks committed per transaction
+PARALLEL_CHUNK_BYTES = 8 << 20
+PARALLEL_COMMIT_CHUNKS = 4
+
+# What an import does with a record whose content matches an existing todo
+ON_DUPLICATE = ("skip", "update", "keep")
+
+
+class ImportResult:
+    # updated counts merged rows and, with on_duplicate="update", updated
+    # duplicates; deleted is only used by merge imports. duplicates is how
+    # many of the skipped or updated records matched an existing todo's
+    # content.
+    def __init__(self, inserted: int = 0, skipped: int = 0, seconds: float = 0.0, errors: int = 0,
+                 updated: int = 0, deleted: int = 0, duplicates: int = 0):
+        self.inserted = inserted
+        self.skipped = skipped
+        self.seconds = seconds
+        self.errors = errors
+        self.updated = updated
+        self.deleted = deleted
+        self.duplicates = duplicates
+
+    @property
+    def rows_per_second(self) -> float:
+        total = self.inserted + self.skipped + self.updated + self.deleted
+        return total / self.seconds if self.seconds > 0 else float(total)
+
+    def __repr__(self):
+        return (f"<ImportResult inserted={self.inserted} updated={self.updated} deleted={self.deleted} "
+                f"skipped={self.skipped} duplicates={self.duplicates} errors={self.errors} "
+                f"{self.rows_per_second:.0f} rows/s>")
+
+
+# Yield the objects of a top-level JSON array without loading the whole file
+def iter_json_records(f, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict]:
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    def refill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of JSON input")
+            refill()
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array of todos")
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Most likely an object cut off at the end of the buffer
+            if eof:
+                raise
+            refill()
+            continue
+        yield obj
+        pos = end
+
+
+# Yield one object per non-empty line of a newline-delimited JSON file
+def iter_ndjson_records(f) -> Iterator[Dict]:
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+# Yield CSV rows with the tags column decoded from JSON
+def iter_csv_records(f) -> Iterator[Dict]:
+    for row in csv.DictReader(f):
+        row = dict(row)
+        row['tags'] = json.loads(row['tags']) if row.get('tags') else []
+        # The CSV id column is not used for de-duplication
+        row.pop('id', None)
+        yield row
+
+
+def _batches(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    it = iter(records)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _existing_ids(conn, ids: List[str]) -> set:
+    if not ids:
+        return set()
+    qmarks = ','.join('?' for _ in ids)
+    keys = [encode_id(tid) for tid in ids]
+    return {decode_id(r[0]) for r in conn.execute(f"SELECT id FROM todos WHERE id IN ({qmarks})", keys)}
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+# Hash of a todo's content: title, description and tags, ignoring case and
+# runs of whitespace, and tag order and repeats. Imports treat todos with the
+# same fingerprint as duplicates.
+def fingerprint(title: str, description: Optional[str], tags: Iterable[str]) -> str:
+    tag_text = "\x1e".join(sorted({_normalize(t) for t in tags}))
+    content = f"{_normalize(title)}\x1f{_normalize(description or '')}\x1f{tag_text}"
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+FINGERPRINT_FILL_BATCH = 5000
+
+# Hash the rows whose fingerprint is NULL (inserted outside an import, or
+# changed since; see migration 8). After the first import this is a single
+# index probe that finds nothing.
+def _fill_fingerprints(conn):
+    while True:
+        rows = conn.execute(
+            "SELECT id, title, description, tags FROM todos WHERE fingerprint IS NULL LIMIT ?",
+            (FINGERPRINT_FILL_BATCH,)
+        ).fetchall()
+        if not rows:
+            return
+        conn.executemany(
+            "UPDATE todos SET fingerprint = ? WHERE id = ?",
+            [(fingerprint(title, description, json.loads(tags) if tags else []), tid)
+             for tid, title, description, tags in rows]
+        )
+
+# {fingerprint: stored id} for the todos having one of `fingerprints`
+def _existing_fingerprints(conn, fingerprints: List[str]) -> Dict[str, str]:
+    unique = list(set(fingerprints))
+    if not unique:
+        return {}
+    qmarks = ','.join('?' for _ in unique)
+    return dict(storage._fetch(conn, f"SELECT fingerprint, id FROM todos WHERE fingerprint IN ({qmarks})", unique))
+
+
+IMPORT_INSERT_SQL = (
+    f"INSERT INTO todos ({storage.ITEM_SQL}, fingerprint) "
+    f"VALUES ({','.join('?' for _ in storage.COLUMNS)}, ?)"
+)
+DUPLICATE_UPDATE_SQL = "UPDATE todos SET title=?, description=?, tags=?, priority=?, updated_at=? WHERE id=?"
+
+# Write one batch of (record id, INSERT params, fingerprint) rows. A record
+# whose id already exists is skipped. A record with the fingerprint of an
+# existing todo, or of an earlier record of the import, is skipped, updates
+# that todo (title, description, tags and priority) or is inserted anyway,
+# for on_duplicate skip, update and keep. Each check is one IN query per batch.
+def _write_batch(conn, batch: List[Tuple], on_duplicate: str, result: ImportResult):
+    existing = _existing_ids(conn, [rid for rid, _, _ in batch if rid])
+    if existing:
+        result.skipped += sum(1 for rid, _, _ in batch if rid in existing)
+        batch = [row for row in batch if row[0] not in existing]
+    if on_duplicate == "keep":
+        conn.executemany(IMPORT_INSERT_SQL, [(*params, fp) for _, params, fp in batch])
+        result.inserted += len(batch)
+        return
+    matches = _existing_fingerprints(conn, [fp for _, _, fp in batch])
+    inserts, updates = [], []
+    for _rid, params, fp in batch:
+        tid = matches.get(fp)
+        if tid is None:
+            inserts.append((*params, fp))
+            matches[fp] = params[0]
+        elif on_duplicate == "update":
+            updates.append((params[1], params[2], params[3], params[5], params[7], tid))
+        else:
+            result.skipped += 1
+    conn.executemany(IMPORT_INSERT_SQL, inserts)
+    # After the inserts, so a duplicate within the batch updates the row just added
+    conn.executemany(DUPLICATE_UPDATE_SQL, updates)
+    if updates:
+        storage._invalidate([decode_id(u[-1]) for u in updates])
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+    result.duplicates += len(batch) - len(inserts)
+
+
+# A record's priority (3 if missing) as an int; raises ValueError unless it
+# is a number from PRIORITY_MIN to PRIORITY_MAX
+def _checked_priority(value) -> int:
+    try:
+        priority = int(value or 3)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid priority: {value!r}") from None
+    if not PRIORITY_MIN <= priority <= PRIORITY_MAX:
+        raise ValueError(f"priority must be between {PRIORITY_MIN} and {PRIORITY_MAX}")
+    return priority
+
+# Convert an import record to a storage.INSERT_SQL parameter tuple; raises
+# ValueError for a priority outside PRIORITY_MIN..PRIORITY_MAX. Both the
+# serial and the parallel import go through here.
+def _record_to_params(item: Dict):
+    priority = _checked_priority(item.get('priority'))
+    now = _now()
+    return (
+        uuid.uuid4().bytes,
+        item['title'],
+        item.get('description'),
+        json.dumps(item.get('tags') or []),
+        TodoStatus.TODO.value,
+        priority,
+        now,
+        now,
+    )
+
+
+def _check_on_duplicate(on_duplicate: str):
+    if on_duplicate not in ON_DUPLICATE:
+        raise ValueError(f"on_duplicate must be one of {', '.join(ON_DUPLICATE)}, not {on_duplicate!r}")
+
+# (record id, INSERT params, fingerprint) for an import record; raises
+# ValueError for an invalid record (see _validate_record)
+def _import_row(item: Dict) -> Tuple:
+    params = _validate_record(item)
+    return item.get('id'), params, fingerprint(params[1], params[2], item.get('tags') or [])
+
+# _import_row for a batch of records; the ones it rejects are counted in
+# result.errors and left out, as the parallel import does
+def _import_rows(batch: List[Dict], result: ImportResult) -> List[Tuple]:
+    rows = []
+    for item in batch:
+        try:
+            rows.append(_import_row(item))
+        except ValueError:
+            result.errors += 1
+    return rows
+
+# Insert records in batches inside one transaction, skipping records whose id
+# already exists and resolving content duplicates as on_duplicate says (see
+# _write_batch). With fast=True the writer also runs with synchronous=OFF for
+# the duration of the import (used by import-new, where a crash only loses
+# the freshly created database).
+def import_records(records: Iterable[Dict], batch_size: int = IMPORT_BATCH_SIZE, fast: bool = False,
+                   on_duplicate: str = "skip") -> ImportResult:
+    _check_on_duplicate(on_duplicate)
+    result = ImportResult()
+    started = time.perf_counter()
+    pragmas = {"cache_size": -IMPORT_CACHE_KIB}
+    if fast:
+        pragmas["synchronous"] = "OFF"
+    with storage.pragma_override(**pragmas):
+        with storage.transaction() as conn:
+            for batch in _batches(records, batch_size):
+                if on_duplicate != "keep":
+                    _fill_fingerprints(conn)
+                _write_batch(conn, _import_rows(batch, result), on_duplicate, result)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# Check an import record and convert it to storage.INSERT_SQL parameters;
+# raises ValueError describing the first problem found
+def _validate_record(item) -> Tuple:
+    title, description, tags = _checked_fields(item)
+    return _record_to_params({'title': title, 'description': description, 'tags': tags,
+                              'priority': item.get('priority')})
+
+# (title, description, tags) of a record; raises ValueError if one of them
+# has the wrong type or the title is empty
+def _checked_fields(item) -> Tuple:
+    if not isinstance(item, dict):
+        raise ValueError("record is not an object")
+    title = item.get('title')
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("title is required")
+    description = item.get('description')
+    if description is not None and not isinstance(description, str):
+        raise ValueError("description must be a string")
+    tags = item.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        raise ValueError("tags must be a list of strings")
+    return title, description, tags
+
+
+# Split a line-oriented file into byte ranges of about chunk_bytes, each
+# ending on a newline so no record straddles two ranges. CSV files must not
+# have newlines inside quoted fields.
+def split_chunks(filepath: str, chunk_bytes: int = PARALLEL_CHUNK_BYTES, skip_header: bool = False) -> List[Tuple[int, int]]:
+    size = os.path.getsize(filepath)
+    chunks = []
+    with open(filepath, 'rb') as f:
+        if skip_header:
+            f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+# Worker task: parse and validate the records in bytes [start, end).
+# Returns ([(record id or None, INSERT params, fingerprint)],
+# [(byte offset, line, error)]).
+def _parse_chunk(filepath: str, fmt: str, start: int, end: int, header: Optional[List[str]]):
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = io.BytesIO(f.read(end - start))
+    rows, errors = [], []
+    offset = start
+    for raw in iter(data.readline, b""):
+        line_offset = offset
+        offset += len(raw)
+        line = raw.decode('utf-8').rstrip("\r\n")
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if len(values) != len(header):
+                    raise ValueError(f"expected {len(header)} columns, got {len(values)}")
+                record = dict(zip(header, values))
+                record['tags'] = json.loads(record['tags']) if record.get('tags') else []
+                record.pop('id', None)
+            else:
+                record = json.loads(line)
+            rows.append(_import_row(record))
+        except (ValueError, csv.Error) as exc:
+            errors.append((line_offset, line, str(exc)))
+    return rows, errors
+
+
+# Import an NDJSON or CSV file using `workers` processes to parse and
+# validate it. The calling process is the only writer; it inserts the parsed
+# chunks in input order and commits every PARALLEL_COMMIT_CHUNKS chunks, so
+# an interrupted import keeps what it had committed. Invalid records are
+# counted in ImportResult.errors and, with error_path, written there as
+# NDJSON ({"offset", "line", "error"}). progress(result, bytes_done,
+# bytes_total) is called after every commit.
+def import_file_parallel(filepath: str, fmt: str, workers: int, batch_size: int = IMPORT_BATCH_SIZE,
+                         fast: bool = False, chunk_bytes: int = PARALLEL_CHUNK_BYTES,
+                         error_path: Optional[str] = None,
+                         progress: Optional[Callable[[ImportResult, int, int], None]] = None,
+                         on_duplicate: str = "skip") -> ImportResult:
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"Parallel import needs a line-oriented format (ndjson or csv), not {fmt}")
+    _check_on_duplicate(on_duplicate)
+    header = None
+    if fmt == "csv":
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            header = next(csv.reader([f.readline()]), [])
+    chunks = split_chunks(filepath, chunk_bytes, skip_header=fmt == "csv")
+    total = os.path.getsize(filepath)
+    result = ImportResult()
+    started = time.perf_counter()
+    pragmas = {"cache_size": -IMPORT_CACHE_KIB}
+    if fast:
+        pragmas["synchronous"] = "OFF"
+    error_file = None
+    try:
+        with ProcessPoolExecutor(workers) as pool, storage.pragma_override(**pragmas):
+            todo = iter(chunks)
+
+            def submit(start, end):
+                return end, pool.submit(_parse_chunk, filepath, fmt, start, end, header)
+
+            # Keep a bounded number of chunks in flight so parsed rows cannot
+            # pile up in memory when the writer is the bottleneck
+            pending = deque(submit(s, e) for s, e in islice(todo, workers * 2))
+            while pending:
+                group = []
+                while pending and len(group) < PARALLEL_COMMIT_CHUNKS:
+                    done, future = pending.popleft()
+                    group.append(future.result())
+                    pending.extend(submit(s, e) for s, e in islice(todo, 1))
+                with storage.transaction() as conn:
+                    for rows, _errors in group:
+                        for batch in _batches(rows, batch_size):
+                            if on_duplicate != "keep":
+                                _fill_fingerprints(conn)
+                            _write_batch(conn, batch, on_duplicate, result)
+                for _rows, errors in group:
+                    result.errors += len(errors)
+                    if errors and error_path:
+                        if error_file is None:
+                            error_file = open(error_path, 'w', encoding='utf-8')
+                        error_file.writelines(
+                            json.dumps({"offset": o, "line": line, "error": msg}) + "\n" for o, line, msg in errors
+                        )
+                if progress:
+                    result.seconds = time.perf_counter() - started
+                    progress(result, done, total)
+    finally:
+        if error_file is not None:
+            error_file.close()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+MERGE_UPSERT_SQL = (
+    f"{storage.INSERT_SQL} ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{c}=excluded.{c}" for c in storage.COLUMNS if c != "id")
+    + " WHERE excluded.updated_at > todos.updated_at"
+)
+
+
+MERGE_STATUSES = {s.value for s in TodoStatus}
+
+# Full stored row for a merge record; unlike a plain import, the id, status
+# and timestamps come from the record. Raises ValueError for the records a
+# plain import rejects, and for a missing id or timestamp or a bad status.
+def _merge_row(item: Dict) -> Tuple:
+    missing = [c for c in ("id", "title", "created_at", "updated_at") if not item.get(c)]
+    if missing:
+        raise ValueError(f"Merge record {item.get('id')!r} is missing {', '.join(missing)}")
+    title, description, tags = _checked_fields(item)
+    status = item.get('status') or TodoStatus.TODO.value
+    if status not in MERGE_STATUSES:
+        raise ValueError(f"invalid status: {status!r}")
+    return (
+        encode_id(item['id']),
+        title,
+        description,
+        json.dumps(tags),
+        status,
+        _checked_priority(item.get('priority')),
+        storage._timestamp_param(item['created_at']),
+        storage._timestamp_param(item['updated_at']),
+    )
+
+
+# Merge the output of storage.export_todos_changes (or a full export) into
+# the database, last writer wins: a row replaces the local one only if its
+# updated_at is newer, and a tombstone deletes the local row only if it was
+# not changed after the delete. A row older than a local tombstone stays
+# deleted. Applied tombstones are kept, so the delete propagates further.
+def merge_records(records: Iterable[Dict], batch_size: int = IMPORT_BATCH_SIZE) -> ImportResult:
+    result = ImportResult()
+    started = time.perf_counter()
+    with storage.pragma_override(cache_size=-IMPORT_CACHE_KIB):
+        with storage.transaction() as conn:
+            for batch in _batches(records, batch_size):
+                ids = [item['id'] for item in batch if isinstance(item, dict) and item.get('id')]
+                if not ids:
+                    result.skipped += len(batch)
+                    continue
+                qmarks = ','.join('?' for _ in ids)
+                keys = [encode_id(tid) for tid in ids]
+                local = {decode_id(k): v for k, v in storage._fetch(
+                    conn, f"SELECT id, updated_at FROM todos WHERE id IN ({qmarks})", keys)}
+                deleted = {decode_id(k): v for k, v in storage._fetch(
+                    conn, f"SELECT id, deleted_at FROM todo_tombstones WHERE id IN ({qmarks})", keys)}
+                for item in batch:
+                    tid = item.get('id') if isinstance(item, dict) else None
+                    if not tid:
+                        result.skipped += 1
+                    elif 'deleted_at' in item and 'title' not in item:
+                        deleted_at = storage._timestamp_param(item['deleted_at'])
+                        if tid in local and local[tid] > deleted_at:
+                            result.skipped += 1
+                            continue
+                        if tid not in deleted or deleted[tid] < deleted_at:
+                            conn.execute("INSERT OR REPLACE INTO todo_tombstones (id, deleted_at) VALUES (?, ?)",
+                                         (encode_id(tid), deleted_at))
+                            deleted[tid] = deleted_at
+                        if tid in local:
+                            conn.execute("DELETE FROM todos WHERE id = ?", (encode_id(tid),))
+                            del local[tid]
+                            result.deleted += 1
+                        else:
+                            result.skipped += 1
+                    else:
+                        try:
+                            row = _merge_row(item)
+                        except ValueError:
+                            result.errors += 1
+                            continue
+                        updated_at = row[7]
+                        if tid in deleted and deleted[tid] >= updated_at:
+                            result.skipped += 1
+                        elif tid not in local:
+                            conn.execute(storage.INSERT_SQL, row)
+                            conn.execute("DELETE FROM todo_tombstones WHERE id = ?", (row[0],))
+                            deleted.pop(tid, None)
+                            local[tid] = updated_at
+                            result.inserted += 1
+                        elif updated_at > local[tid]:
+                            conn.execute(MERGE_UPSERT_SQL, row)
+                            local[tid] = updated_at
+                            result.updated += 1
+                        else:
+                            result.skipped += 1
+                storage._invalidate(ids)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+READERS = {
+    "json": iter_json_records,
+    "ndjson": iter_ndjson_records,
+    "csv": iter_csv_records,
+}
+
+
+# merge=True applies the file with merge_records (json and ndjson only,
+# since the CSV reader drops ids)
+def import_file(filepath: str, fmt: str, merge: bool = False, **kwargs) -> ImportResult:
+    if merge and fmt == "csv":
+        raise ValueError("Merge import needs json or ndjson input")
+    newline = '' if fmt == "csv" else None
+    with open(filepath, 'r', encoding='utf-8', newline=newline) as f:
+        if merge:
+            return merge_records(READERS[fmt](f), **kwargs)
+        return import_records(READERS[fmt](f), **kwargs)
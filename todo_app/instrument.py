@@ -0,0 +1,411 @@
+# todo_app/instrument.py
+#
+# Opt-in instrumentation for the storage layer, turned on through
+# storage.enable_metrics():
+#
+# - every public storage function is replaced by a wrapper recording calls,
+#   errors, rows returned and a latency histogram;
+# - the connection pool opens InstrumentedConnection objects, whose cursors
+#   time each SQL statement from execute to its last fetched row, count the
+#   rows and log statements slower than the threshold together with their
+#   EXPLAIN QUERY PLAN.
+#
+# When it is off nothing is wrapped and the pool uses plain sqlite3
+# connections, so it costs nothing.
+import functools
+import inspect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("todo_app.storage")
+
+# Histogram bucket upper bounds in seconds: 10us doubling up to about 21s
+BUCKETS = tuple(0.00001 * 2 ** i for i in range(22))
+SLOW_QUERY_MS = 100.0
+SLOW_QUERY_LOG_SIZE = 100
+
+# Storage functions that are plumbing rather than operations
+NOT_INSTRUMENTED = {
+    "transaction", "pragma_override", "configure", "configure_cache", "close_pool", "cache_stats",
+    "enable_metrics", "disable_metrics", "metrics", "reset_metrics", "metrics_prometheus",
+}
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Estimated q-quantile in seconds, interpolated within its bucket and
+    # kept within the smallest and largest observations
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return max(self.min, min(lower + (upper - lower) * (rank - seen) / n, self.max))
+            seen += n
+        return self.max
+
+
+class _Stat:
+    __slots__ = ("calls", "errors", "rows", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency = Histogram()
+
+    def snapshot(self) -> Dict:
+        h = self.latency
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": h.sum * 1000,
+            "p50_ms": h.quantile(0.50) * 1000,
+            "p95_ms": h.quantile(0.95) * 1000,
+            "p99_ms": h.quantile(0.99) * 1000,
+            "max_ms": h.max * 1000,
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.functions: Dict[str, _Stat] = {}
+        self.queries: Dict[str, _Stat] = {}
+        self.opened = 0
+        self.closed = 0
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self.slow_total = 0
+
+    def record(self, table: Dict[str, _Stat], name: str, seconds: float, rows: int, error: bool = False):
+        with self.lock:
+            stat = table.get(name)
+            if stat is None:
+                stat = table[name] = _Stat()
+            stat.calls += 1
+            stat.rows += rows
+            if error:
+                stat.errors += 1
+            stat.latency.observe(seconds)
+
+
+registry = Registry()
+enabled = False
+slow_query_seconds = SLOW_QUERY_MS / 1000
+_originals: Dict[str, object] = {}
+
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+# One metrics key per statement shape: whitespace collapsed and IN (?, ?, ...)
+# lists of any length folded together
+def normalize_sql(sql: str) -> str:
+    return _IN_LIST.sub("(?, ...)", " ".join(sql.split()))
+
+
+# Rows in a storage function's result; get_page's (items, cursor) counts its items
+def _row_count(result) -> int:
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    if isinstance(result, (list, tuple, dict, set)):
+        return len(result)
+    if isinstance(result, bool) or result is None:
+        return 0
+    if isinstance(result, int):
+        return result
+    return 1
+
+
+def _wrap(name: str, fn):
+    record = registry.record
+    if inspect.isgeneratorfunction(fn):
+        # Time spent inside the generator, not in the caller's loop body
+        @functools.wraps(fn)
+        def generator(*args, **kwargs):
+            it = fn(*args, **kwargs)
+            elapsed, rows, error = 0.0, 0, False
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        item = next(it)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - started
+                    rows += len(item) if isinstance(item, list) else 1
+                    yield item
+            except Exception:
+                error = True
+                raise
+            finally:
+                record(registry.functions, name, elapsed, rows, error)
+        return generator
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            record(registry.functions, name, time.perf_counter() - started, 0, True)
+            raise
+        record(registry.functions, name, time.perf_counter() - started, _row_count(result))
+        return result
+    return wrapper
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # A statement is recorded once it is done: right after execute when it
+    # returns no rows, otherwise when its rows run out, the cursor is
+    # re-executed or closed, or the cursor is garbage collected
+    _sql = None
+
+    def _start(self, sql, params):
+        if self._sql is not None:
+            self._finish()
+        self._sql = sql
+        self._params = params
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self, error: bool = False):
+        sql, self._sql = self._sql, None
+        if sql is None:
+            return
+        rows = self._rows
+        if self.description is None and self.rowcount > 0:
+            rows = self.rowcount
+        registry.record(registry.queries, normalize_sql(sql), self._elapsed, rows, error)
+        if self._elapsed >= slow_query_seconds and not error:
+            _log_slow_query(self.connection, sql, self._params, self._elapsed, rows)
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        except Exception:
+            self._elapsed += time.perf_counter() - started
+            self._finish(error=True)
+            raise
+        finally:
+            if self._sql is not None:
+                self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        self._start(sql, params)
+        self._timed(sqlite3.Cursor.execute, sql, params)
+        if self.description is None:
+            self._finish()
+        return self
+
+    # The parameters are materialized so the first set can be kept for the
+    # query plan of a slow statement
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self._start(sql, seq_of_params[0] if seq_of_params else ())
+        self._timed(sqlite3.Cursor.executemany, sql, seq_of_params)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.arraysize
+        rows = self._timed(sqlite3.Cursor.fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with registry.lock:
+            registry.opened += 1
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def close(self):
+        with registry.lock:
+            registry.closed += 1
+        super().close()
+
+
+def _log_slow_query(conn, sql: str, params, seconds: float, rows: int):
+    plan = None
+    words = sql.split(None, 1)
+    if words and words[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        try:
+            # A plain cursor, so the EXPLAIN itself is not recorded
+            plan = [r[3] for r in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.Error:
+            pass
+    entry = {"sql": " ".join(sql.split()), "ms": seconds * 1000, "rows": rows, "plan": plan}
+    with registry.lock:
+        registry.slow_queries.append(entry)
+        registry.slow_total += 1
+    logger.warning("slow query (%.1f ms, %d rows): %s%s", entry["ms"], rows, entry["sql"],
+                   "".join(f"\n    {step}" for step in plan or ()))
+
+
+# Wrap the public functions of `module` (todo_app.storage) and switch its
+# pool to instrumented connections
+def enable(module, slow_query_ms: Optional[float] = None):
+    global enabled, slow_query_seconds
+    slow_query_seconds = (SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms) / 1000
+    if enabled:
+        return
+    for name, fn in list(vars(module).items()):
+        if (name.startswith("_") or name in NOT_INSTRUMENTED or not inspect.isfunction(fn)
+                or fn.__module__ != module.__name__):
+            continue
+        _originals[name] = fn
+        setattr(module, name, _wrap(name, fn))
+    module.close_pool()
+    module.CONNECTION_FACTORY = InstrumentedConnection
+    enabled = True
+
+def disable(module):
+    global enabled
+    if not enabled:
+        return
+    for name, fn in _originals.items():
+        setattr(module, name, fn)
+    _originals.clear()
+    module.close_pool()
+    module.CONNECTION_FACTORY = sqlite3.Connection
+    enabled = False
+
+def reset():
+    with registry.lock:
+        registry.clear()
+
+
+def snapshot() -> Dict:
+    reg = registry
+    with reg.lock:
+        return {
+            "enabled": enabled,
+            "functions": {name: stat.snapshot() for name, stat in sorted(reg.functions.items())},
+            "queries": {sql: stat.snapshot() for sql, stat in sorted(reg.queries.items())},
+            "connections": {"opened": reg.opened, "closed": reg.closed, "open": reg.opened - reg.closed},
+            "slow_queries": list(reg.slow_queries),
+            "slow_queries_total": reg.slow_total,
+        }
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram_lines(metric: str, label: str, value: str, h: Histogram) -> List[str]:
+    lines, cumulative = [], 0
+    labels = f'{label}="{_label(value)}"'
+    for bound, n in zip(BUCKETS, h.counts):
+        cumulative += n
+        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {h.count}')
+    lines.append(f"{metric}_sum{{{labels}}} {h.sum:.9g}")
+    lines.append(f"{metric}_count{{{labels}}} {h.count}")
+    return lines
+
+# The metrics in the Prometheus text exposition format
+def prometheus() -> str:
+    reg = registry
+    lines = []
+    with reg.lock:
+        for metric, label, table, what in (
+            ("todo_storage_call", "function", reg.functions, "storage function calls"),
+            ("todo_storage_query", "query", reg.queries, "SQL statements"),
+        ):
+            lines.append(f"# HELP {metric}_seconds Latency of {what}")
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            for name, stat in sorted(table.items()):
+                lines.extend(_histogram_lines(f"{metric}_seconds", label, name, stat.latency))
+            lines.append(f"# HELP {metric}_rows_total Rows returned or changed by {what}")
+            lines.append(f"# TYPE {metric}_rows_total counter")
+            for name, stat in sorted(table.items()):
+                lines.append(f'{metric}_rows_total{{{label}="{_label(name)}"}} {stat.rows}')
+        lines.append("# HELP todo_storage_call_errors_total Storage function calls that raised")
+        lines.append("# TYPE todo_storage_call_errors_total counter")
+        for name, stat in sorted(reg.functions.items()):
+            lines.append(f'todo_storage_call_errors_total{{function="{_label(name)}"}} {stat.errors}')
+        for metric, value, what in (
+            ("todo_storage_connections_opened_total", reg.opened, "SQLite connections opened"),
+            ("todo_storage_connections_closed_total", reg.closed, "SQLite connections closed"),
+            ("todo_storage_slow_queries_total", reg.slow_total, "Statements slower than the slow query threshold"),
+        ):
+            lines.append(f"# HELP {metric} {what}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
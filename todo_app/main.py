@@ -1,190 +1,759 @@
 import argparse
-from todo_app import storage
-from todo_app.models import TodoCreate, TodoUpdate, TodoStatus, PRIORITY_MIN, PRIORITY_MAX
 import sys
+from collections import namedtuple
+
+# Startup cost matters here: a simple command should not pay for importing
+# sqlite3, csv, json and the rest of the storage layer (or even typing), or
+# for building the parsers of every other command. Modules beyond argparse
+# and sys are imported inside the functions that use them, and main() only
+# builds the subparser of the command being run (see COMMANDS below).
+
 
 def print_todo(todo):
-    print(f"ID: {todo.id}\nTitle: {todo.title}\nDescription: {todo.description}\nTags: {todo.tags}\nStatus: {todo.status}\nPriority: {getattr(todo, 'priority', 3)}\nCreated: {todo.created_at}\nUpdated: {todo.updated_at}\n")
+    from todo_app.output import write_todos
+    write_todos(sys.stdout, "text", [todo])
 
-def main():
-    parser = argparse.ArgumentParser(description="ToDo List CLI App")
-    subparsers = parser.add_subparsers(dest="command")
+def status_choices():
+    from todo_app.models import TodoStatus
+    return [s.value for s in TodoStatus]
+
+def priority_choices():
+    from todo_app.models import PRIORITY_MIN, PRIORITY_MAX
+    return range(PRIORITY_MIN, PRIORITY_MAX + 1)
+
+# --sharded runs a command on a sharded store (see sharding.py) instead of
+# todos.db; --tenant names the tenant in a store sharded by tenant
+def add_store_args(parser, tenant=True):
+    parser.add_argument("--sharded", type=str, default=None, metavar="DIR",
+                        help="Use the sharded store in DIR (create it with rebalance) instead of todos.db")
+    if tenant:
+        parser.add_argument("--tenant", type=str, default=None,
+                            help="With --sharded, the tenant of a store sharded by tenant")
+
+# `with CommandStore(parser, args) as (store, tenant):` gives the store a
+# command runs on, storage or the ShardedStore of --sharded, and the keyword
+# arguments passing --tenant to it. A sharded store is closed afterwards and
+# its ValueErrors (such as a write without --tenant) become usage errors.
+class CommandStore:
+    def __init__(self, parser, args):
+        self.parser = parser
+        self.directory = getattr(args, "sharded", None)
+        self.tenant = getattr(args, "tenant", None)
+        self.store = None
+
+    def __enter__(self):
+        if self.directory is None:
+            if self.tenant is not None:
+                self.parser.error("--tenant needs --sharded")
+            from todo_app import storage
+            return storage, {}
+        import os
+        from todo_app.sharding import MANIFEST, ShardedStore
+        if not os.path.exists(os.path.join(self.directory, MANIFEST)):
+            self.parser.error(f"{self.directory} is not a sharded store (create it with rebalance)")
+        self.store = ShardedStore(self.directory)
+        try:
+            self.store.init_db()
+        except BaseException:
+            self.store.close()
+            raise
+        return self.store, {} if self.tenant is None else {"tenant": self.tenant}
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.store is None:
+            return False
+        self.store.close()
+        if exc_type is ValueError:
+            self.parser.error(str(exc))
+        return False
+
+# Listings: text (the default) or a machine-readable format (see output.py)
+def add_format_args(parser):
+    parser.add_argument("--format", choices=["text", "json", "ndjson", "csv", "tsv", "ids"], default="text",
+                        help="Output format (default: text)")
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+def add_paging_args(parser):
+    add_format_args(parser)
+    parser.add_argument("--limit", type=positive_int, default=None, help="Show at most this many todos")
+    parser.add_argument("--after", type=str, default=None, help="Continue after the cursor printed by a previous --limit page")
+    add_store_args(parser)
 
-    # Add todo
-    add_parser = subparsers.add_parser("add", help="Add a new todo")
-    add_parser.add_argument("title", type=str, help="Title of the todo")
-    add_parser.add_argument("--description", type=str, help="Description", default=None)
-    add_parser.add_argument("--tags", nargs="*", help="Tags", default=None)
-    add_parser.add_argument("--priority", type=int, choices=range(PRIORITY_MIN, PRIORITY_MAX+1), default=3, help="Priority (1=highest, 5=lowest)")
-
-    # Get all
-    subparsers.add_parser("list", help="List all todos")
-
-    # Get by status
-    status_parser = subparsers.add_parser("status", help="List todos by status")
-    status_parser.add_argument("status", type=str, choices=[s.value for s in TodoStatus], help="Status")
-
-    # Search by title
-    title_parser = subparsers.add_parser("search-title", help="Search todos by title substring")
-    title_parser.add_argument("substr", type=str, help="Substring to search in title")
-
-    # Search by tag
-    tag_parser = subparsers.add_parser("search-tag", help="Search todos by tag")
-    tag_parser.add_argument("tag", type=str, help="Tag to search for")
-
-    # Update todo
-    update_parser = subparsers.add_parser("update", help="Update a todo")
-    update_parser.add_argument("id", type=str, help="ID of the todo to update")
-    update_parser.add_argument("--title", type=str, help="New title", default=None)
-    update_parser.add_argument("--description", type=str, help="New description", default=None)
-    update_parser.add_argument("--tags", nargs="*", help="New tags", default=None)
-    update_parser.add_argument("--status", type=str, choices=[s.value for s in TodoStatus], help="New status", default=None)
-    update_parser.add_argument("--priority", type=int, choices=range(PRIORITY_MIN, PRIORITY_MAX+1), help="New priority (1-5)", default=None)
-
-    # Export/Import
-    export_parser = subparsers.add_parser("export", help="Export todos to file")
-    export_parser.add_argument("format", choices=["json", "csv"], help="Export format")
-    export_parser.add_argument("filepath", type=str, help="Output file path")
-
-    import_parser = subparsers.add_parser("import", help="Import todos from file")
-    import_parser.add_argument("format", choices=["json", "csv"], help="Import format")
-    import_parser.add_argument("filepath", type=str, help="Input file path")
-
-    # Import-new (create new DB and import)
-    import_new_parser = subparsers.add_parser("import-new", help="Create a new DB and import todos from file")
-    import_new_parser.add_argument("format", choices=["json", "csv"], help="Import format")
-    import_new_parser.add_argument("filepath", type=str, help="Input file path")
-
-    # Tag management
-    subparsers.add_parser("list-tags", help="List all tags")
-    rename_tag_parser = subparsers.add_parser("rename-tag", help="Rename a tag")
-    rename_tag_parser.add_argument("old_tag", type=str, help="Old tag name")
-    rename_tag_parser.add_argument("new_tag", type=str, help="New tag name")
-    delete_tag_parser = subparsers.add_parser("delete-tag", help="Delete a tag from all todos")
-    delete_tag_parser.add_argument("tag", type=str, help="Tag to delete")
-
-    # Bulk actions
-    bulk_status_parser = subparsers.add_parser("bulk-update-status", help="Bulk update status for todos")
-    bulk_status_parser.add_argument("status", type=str, choices=[s.value for s in TodoStatus], help="New status")
-    bulk_status_parser.add_argument("ids", nargs="+", help="IDs to update")
-
-    bulk_delete_parser = subparsers.add_parser("bulk-delete", help="Bulk delete todos")
-    bulk_delete_parser.add_argument("ids", nargs="+", help="IDs to delete")
-
-    bulk_priority_parser = subparsers.add_parser("bulk-update-priority", help="Bulk update priority for todos")
-    bulk_priority_parser.add_argument("priority", type=int, choices=range(PRIORITY_MIN, PRIORITY_MAX+1), help="New priority (1-5)")
-    bulk_priority_parser.add_argument("ids", nargs="+", help="IDs to update")
-
-    # Priority filtering/sorting
-    priority_parser = subparsers.add_parser("priority", help="List todos by priority")
-    priority_parser.add_argument("priority", type=int, choices=range(PRIORITY_MIN, PRIORITY_MAX+1), help="Priority (1-5)")
-
-    subparsers.add_parser("list-sorted-priority", help="List all todos sorted by priority (1=highest)")
-
-    # Delete todo
-    delete_parser = subparsers.add_parser("delete", help="Delete a todo")
-    delete_parser.add_argument("id", type=str, help="ID of the todo to delete")
-
-    # Init DB
-    subparsers.add_parser("init-db", help="Initialize the database")
-
-    args = parser.parse_args()
+# Print todos in --format as they are read, one page at a time; with --limit
+# print a single page and the cursor for the next one (on stderr unless the
+# format is text, so the output stays parseable)
+def print_todo_pages(parser, args, order="created", **filters):
+    from todo_app.output import buffered_stdout, write_rows, write_todos
+    with CommandStore(parser, args) as (store, tenant):
+        try:
+            if args.limit is None:
+                pages = store.iter_todo_rows(order=order, after=args.after, **filters, **tenant)
+                # Surface a bad cursor before anything is written
+                first = next(pages, None)
+                with buffered_stdout() as out:
+                    write_rows(out, args.format, _chain_page(first, pages))
+                return
+            todos, next_cursor = store.get_page(order=order, after=args.after, limit=args.limit, **filters, **tenant)
+        except ValueError as exc:
+            parser.error(str(exc))
+    write_todos(sys.stdout, args.format, todos)
+    if next_cursor:
+        print(f"Next page: --after {next_cursor}", file=sys.stdout if args.format == "text" else sys.stderr)
 
+def _chain_page(first, pages):
+    if first is not None:
+        yield first
+        yield from pages
+
+def print_todos(args, todos):
+    from todo_app.output import write_todos
+    write_todos(sys.stdout, args.format, todos)
+
+def import_todos(fmt, filepath, **kwargs):
+    from todo_app import storage
+    if fmt == "json":
+        return storage.import_todos_json(filepath, **kwargs)
+    elif fmt == "ndjson":
+        return storage.import_todos_ndjson(filepath, **kwargs)
+    return storage.import_todos_csv(filepath, **kwargs)
+
+def print_import_result(result, merge=False):
+    print(f"Inserted {result.inserted}, skipped {result.skipped} in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s).")
+    if merge:
+        print(f"Merged: updated {result.updated}, deleted {result.deleted}.")
+    elif result.updated:
+        print(f"Updated {result.updated} existing todos.")
+    if result.duplicates:
+        print(f"{result.duplicates} records duplicated the content of an existing todo (see --on-duplicate).")
+    if result.errors:
+        print(f"{result.errors} invalid records were not imported.")
+
+# Seconds of changes an export from a checkpoint file sends again. A write
+# picks its updated_at before it commits, so it can land just behind the
+# previous checkpoint; re-applying those rows with import --merge is a no-op.
+CHECKPOINT_OVERLAP_SECONDS = 60
+
+# The timestamp to export from with --checkpoint: the one saved in the
+# file, less the overlap. A missing or empty file means a full export.
+def read_checkpoint(path):
     import os
+    from datetime import datetime, timedelta
+    from todo_app import storage
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = f.read().strip()
+    if not checkpoint:
+        return None
+    since = datetime.fromisoformat(storage.normalize_timestamp(checkpoint)) - timedelta(seconds=CHECKPOINT_OVERLAP_SECONDS)
+    return since.isoformat()
+
+def export_changes(parser, args):
+    from todo_app import storage
+    if args.format == "csv":
+        parser.error("--since and --checkpoint need json or ndjson output")
+    if args.since and args.checkpoint:
+        parser.error("give either --since or --checkpoint")
+    try:
+        since = storage.normalize_timestamp(args.since) if args.since else read_checkpoint(args.checkpoint)
+    except ValueError as exc:
+        parser.error(str(exc))
+    rows, tombstones, checkpoint = storage.export_todos_changes(args.filepath, since, args.format)
+    if args.checkpoint and checkpoint:
+        with open(args.checkpoint, 'w', encoding='utf-8') as f:
+            f.write(checkpoint + "\n")
+    print(f"Exported {rows} changed and {tombstones} deleted todos to {args.filepath}.")
+    if checkpoint:
+        print(f"Checkpoint: {checkpoint}")
+
+def add_import_args(parser):
+    parser.add_argument("format", choices=["json", "ndjson", "csv"], help="Import format")
+    parser.add_argument("filepath", type=str, help="Input file path")
+    parser.add_argument("--workers", type=int, default=0, help="Parse the file in this many processes (ndjson and csv only)")
+    parser.add_argument("--errors", type=str, default=None, help="With --workers, write invalid records to this NDJSON file")
+    parser.add_argument("--on-duplicate", choices=["skip", "update", "keep"], default=None,
+                        help="Records with the same title, description and tags as an existing todo: "
+                             "skip them (default), update that todo, or keep both")
+
+def print_import_progress(result, done, total):
+    percent = 100 * done / total if total else 100
+    print(f"\r{percent:5.1f}%  {result.inserted} inserted, {result.skipped} skipped, {result.errors} invalid",
+          end="", file=sys.stderr, flush=True)
+
+# Run an import command, in parallel when --workers is given
+def run_import(parser, args, **kwargs):
+    if args.on_duplicate:
+        kwargs["on_duplicate"] = args.on_duplicate
+    if getattr(args, "sharded", None):
+        if args.workers:
+            parser.error("--workers is not supported with --sharded")
+        with CommandStore(parser, args) as (store, tenant):
+            return store.import_file(args.filepath, args.format, **kwargs, **tenant)
+    if not args.workers:
+        return import_todos(args.format, args.filepath, **kwargs)
+    if args.format == "json":
+        parser.error("--workers needs ndjson or csv input")
+    from todo_app.importer import import_file_parallel
+    result = import_file_parallel(args.filepath, args.format, args.workers, error_path=args.errors,
+                                  progress=print_import_progress, **kwargs)
+    print(file=sys.stderr)
+    return result
+
+
+# A subcommand: its help line, a function adding its arguments to its
+# subparser and the function running it with (parser, args)
+Command = namedtuple("Command", "help arguments run")
+
+# Registry of subcommands, in the order --help lists them
+COMMANDS = {}
 
-    if args.command == "add":
-        todo = storage.insert_todo(TodoCreate(args.title, args.description, args.tags, args.priority))
-        print("Added todo:")
+def command(name, help, arguments=None):
+    def register(run):
+        COMMANDS[name] = Command(help, arguments or (lambda parser: None), run)
+        return run
+    return register
+
+
+# Add todo
+def add_args(parser):
+    parser.add_argument("title", type=str, help="Title of the todo")
+    parser.add_argument("--description", type=str, help="Description", default=None)
+    parser.add_argument("--tags", nargs="*", help="Tags", default=None)
+    parser.add_argument("--priority", type=int, choices=priority_choices(), default=3, help="Priority (1=highest, 5=lowest)")
+    add_store_args(parser)
+
+@command("add", "Add a new todo", add_args)
+def cmd_add(parser, args):
+    from todo_app.models import TodoCreate
+    with CommandStore(parser, args) as (store, tenant):
+        todo = store.insert_todo(TodoCreate(args.title, args.description, args.tags, args.priority), **tenant)
+    print("Added todo:")
+    print_todo(todo)
+
+# Get all
+@command("list", "List all todos", add_paging_args)
+def cmd_list(parser, args):
+    print_todo_pages(parser, args)
+
+# Get by status
+def status_args(parser):
+    parser.add_argument("status", type=str, choices=status_choices(), help="Status")
+    add_paging_args(parser)
+
+@command("status", "List todos by status", status_args)
+def cmd_status(parser, args):
+    print_todo_pages(parser, args, status=args.status)
+
+# Search by title
+def search_title_args(parser):
+    parser.add_argument("substr", type=str, help="Substring to search in title")
+    add_paging_args(parser)
+
+@command("search-title", "Search todos by title substring", search_title_args)
+def cmd_search_title(parser, args):
+    print_todo_pages(parser, args, title=args.substr)
+
+# Full-text search
+def search_args(parser):
+    parser.add_argument("query", type=str, help='Words to search for; "quoted words" match a phrase, word* a prefix')
+    parser.add_argument("--limit", type=positive_int, default=50, help="Maximum number of results")
+    add_format_args(parser)
+
+@command("search", "Full-text search in titles and descriptions", search_args)
+def cmd_search(parser, args):
+    from todo_app import storage
+    print_todos(args, storage.search_text(args.query, args.limit))
+
+# Search by tag
+def search_tag_args(parser):
+    parser.add_argument("tag", type=str, help="Tag to search for")
+    add_format_args(parser)
+    add_store_args(parser)
+
+@command("search-tag", "Search todos by tag", search_tag_args)
+def cmd_search_tag(parser, args):
+    with CommandStore(parser, args) as (store, tenant):
+        todos = store.search_by_tag(args.tag, **tenant)
+    print_todos(args, todos)
+
+# Combined filters, compiled into one statement (storage.query)
+def find_args(parser):
+    parser.add_argument("--status", action="append", choices=status_choices(), default=None,
+                        help="Status to include (repeat for several)")
+    parser.add_argument("--priority", action="append", type=int, choices=priority_choices(), default=None,
+                        help="Priority to include (repeat for several)")
+    parser.add_argument("--priority-min", type=int, choices=priority_choices(), default=None,
+                        help="Lowest priority number to include")
+    parser.add_argument("--priority-max", type=int, choices=priority_choices(), default=None,
+                        help="Highest priority number to include")
+    parser.add_argument("--tag", action="append", default=None, help="Tag that must be present (repeat for several)")
+    parser.add_argument("--any-tag", action="append", default=None,
+                        help="At least one of these tags must be present (repeat for several)")
+    parser.add_argument("--title", type=str, default=None, help="Text the title contains")
+    parser.add_argument("--text", type=str, default=None, help="Full-text search in titles and descriptions")
+    for field in ("created", "updated"):
+        for side in ("after", "before"):
+            parser.add_argument(f"--{field}-{side}", type=str, default=None, metavar="TIME",
+                                help=f"{field.capitalize()} {side} TIME (ISO-8601, or an age such as 7d)")
+    parser.add_argument("--order", choices=["created", "priority"], default="created",
+                        help="created: newest first (default); priority: highest first")
+    parser.add_argument("--explain", action="store_true", help="Print the SQL and its query plan instead of the todos")
+    add_paging_args(parser)
+
+# An ISO-8601 timestamp, or an age ("7d") meaning that long ago
+def parse_time(value):
+    from todo_app import storage
+    if value[-1:] in AGE_UNITS and value[:-1].replace(".", "", 1).isdigit():
+        return parse_age(value)
+    return storage.normalize_timestamp(value)
+
+@command("find", "List todos matching any combination of filters", find_args)
+def cmd_find(parser, args):
+    from todo_app import storage
+    from todo_app.models import TodoFilter
+    try:
+        times = {f"{field}_{side}": parse_time(getattr(args, f"{field}_{side}"))
+                 for field in ("created", "updated") for side in ("after", "before")
+                 if getattr(args, f"{field}_{side}") is not None}
+    except ValueError as exc:
+        parser.error(str(exc))
+    where = TodoFilter(status=args.status, priority=args.priority, priority_min=args.priority_min,
+                       priority_max=args.priority_max, tags_all=args.tag, tags_any=args.any_tag,
+                       title=args.title, text=args.text, **times)
+    if not args.explain:
+        print_todo_pages(parser, args, order=args.order, where=where)
+        return
+    if args.sharded:
+        parser.error("--explain is not supported with --sharded")
+    try:
+        explained = storage.explain_query(order=args.order, limit=args.limit, after=args.after, where=where)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"SQL: {explained['sql']}")
+    print(f"Parameters: {explained['params']}")
+    print("Plan:")
+    for step in explained["plan"]:
+        print(f"  {step}")
+    print(f"Compiled: {'cached' if explained['cached'] else 'new'}")
+
+# Update todo
+def update_args(parser):
+    parser.add_argument("id", type=str, help="ID of the todo to update")
+    parser.add_argument("--title", type=str, help="New title", default=None)
+    parser.add_argument("--description", type=str, help="New description", default=None)
+    parser.add_argument("--tags", nargs="*", help="New tags", default=None)
+    parser.add_argument("--status", type=str, choices=status_choices(), help="New status", default=None)
+    parser.add_argument("--priority", type=int, choices=priority_choices(), help="New priority (1-5)", default=None)
+    add_store_args(parser)
+
+@command("update", "Update a todo", update_args)
+def cmd_update(parser, args):
+    from todo_app.models import TodoUpdate
+    update = TodoUpdate(
+        title=args.title,
+        description=args.description,
+        tags=args.tags,
+        status=args.status,
+        priority=args.priority
+    )
+    with CommandStore(parser, args) as (store, tenant):
+        todo = store.update_todo(args.id, update, **tenant)
+    if todo:
+        print("Updated todo:")
         print_todo(todo)
-    elif args.command == "list":
-        todos = storage.get_all()
-        for t in todos:
-            print_todo(t)
-    elif args.command == "status":
-        todos = storage.get_by_status(args.status)
-        for t in todos:
-            print_todo(t)
-    elif args.command == "search-title":
-        todos = storage.search_by_title(args.substr)
-        for t in todos:
-            print_todo(t)
-    elif args.command == "search-tag":
-        todos = storage.search_by_tag(args.tag)
-        for t in todos:
-            print_todo(t)
-    elif args.command == "update":
-        update = TodoUpdate(
-            title=args.title,
-            description=args.description,
-            tags=args.tags,
-            status=args.status,
-            priority=args.priority
-        )
-        todo = storage.update_todo(args.id, update)
-        if todo:
-            print("Updated todo:")
-            print_todo(todo)
-        else:
-            print("Todo not found.")
-    elif args.command == "export":
-        if args.format == "json":
-            storage.export_todos_json(args.filepath)
-        else:
-            storage.export_todos_csv(args.filepath)
-        print(f"Exported todos to {args.filepath}.")
-    elif args.command == "import":
-        if args.format == "json":
-            storage.import_todos_json(args.filepath)
-        else:
-            storage.import_todos_csv(args.filepath)
+    else:
+        print("Todo not found.")
+
+# Export/Import
+def export_args(parser):
+    parser.add_argument("format", choices=["json", "ndjson", "csv"], help="Export format")
+    parser.add_argument("filepath", type=str, help="Output file path")
+    parser.add_argument("--since", type=str, default=None, metavar="TIME",
+                        help="Only export changes since this ISO-8601 timestamp (json/ndjson)")
+    parser.add_argument("--checkpoint", type=str, default=None, metavar="FILE",
+                        help="Only export changes since the checkpoint saved in FILE (everything if it is "
+                             "missing), then save the new checkpoint there (json/ndjson)")
+    add_store_args(parser)
+
+@command("export", "Export todos to file", export_args)
+def cmd_export(parser, args):
+    from todo_app import storage
+    if args.sharded:
+        if args.since or args.checkpoint:
+            parser.error("--since and --checkpoint are not supported with --sharded")
+        with CommandStore(parser, args) as (store, tenant):
+            count = store.export_todos(args.filepath, args.format, **tenant)
+    elif args.since or args.checkpoint:
+        export_changes(parser, args)
+        return
+    elif args.format == "json":
+        count = storage.export_todos_json(args.filepath)
+    elif args.format == "ndjson":
+        count = storage.export_todos_ndjson(args.filepath)
+    else:
+        count = storage.export_todos_csv(args.filepath)
+    print(f"Exported {count} todos to {args.filepath}.")
+
+def import_args(parser):
+    add_import_args(parser)
+    parser.add_argument("--merge", action="store_true",
+                        help="Upsert by id, newest updated_at wins, and apply deletes (json/ndjson)")
+    add_store_args(parser)
+
+@command("import", "Import todos from file", import_args)
+def cmd_import(parser, args):
+    if args.merge:
+        if args.format == "csv" or args.workers or args.on_duplicate or args.sharded:
+            parser.error("--merge needs json or ndjson input and does not support --workers, --on-duplicate "
+                         "or --sharded")
+        result = import_todos(args.format, args.filepath, merge=True)
+        print(f"Merged todos from {args.filepath}.")
+    else:
+        result = run_import(parser, args)
         print(f"Imported todos from {args.filepath}.")
-    elif args.command == "import-new":
-        # Remove DB file if it exists
-        if os.path.exists(storage.DB_PATH):
-            os.remove(storage.DB_PATH)
-        storage.init_db()
-        if args.format == "json":
-            storage.import_todos_json(args.filepath)
-        else:
-            storage.import_todos_csv(args.filepath)
-        print(f"Created new DB and imported todos from {args.filepath}.")
-    elif args.command == "list-tags":
-        tags = storage.list_tags()
-        print("Tags:", tags)
-    elif args.command == "rename-tag":
-        count = storage.rename_tag(args.old_tag, args.new_tag)
-        print(f"Renamed tag in {count} todos.")
-    elif args.command == "delete-tag":
-        count = storage.delete_tag_from_all(args.tag)
-        print(f"Deleted tag from {count} todos.")
-    elif args.command == "bulk-update-status":
-        count = storage.bulk_update_status(args.ids, args.status)
-        print(f"Updated status for {count} todos.")
-    elif args.command == "bulk-delete":
-        count = storage.bulk_delete(args.ids)
-        print(f"Deleted {count} todos.")
-    elif args.command == "bulk-update-priority":
-        count = storage.bulk_update_priority(args.ids, args.priority)
-        print(f"Updated priority for {count} todos.")
-    elif args.command == "priority":
-        todos = storage.get_by_priority(args.priority)
-        for t in todos:
-            print_todo(t)
-    elif args.command == "list-sorted-priority":
-        todos = storage.get_all_sorted_by_priority()
-        for t in todos:
-            print_todo(t)
-    elif args.command == "delete":
-        ok = storage.delete_todo(args.id)
-        if ok:
-            print("Todo deleted.")
-        else:
-            print("Todo not found.")
-    elif args.command == "init-db":
-        storage.init_db()
-        print("Database initialized.")
+    print_import_result(result, merge=args.merge)
+
+# Import-new (create new DB and import)
+@command("import-new", "Create a new DB and import todos from file", add_import_args)
+def cmd_import_new(parser, args):
+    from todo_app import storage
+    # Remove DB file if it exists
+    storage.remove_db()
+    storage.init_db()
+    result = run_import(parser, args, fast=True)
+    print(f"Created new DB and imported todos from {args.filepath}.")
+    print_import_result(result)
+
+# Tag management
+@command("list-tags", "List all tags", add_store_args)
+def cmd_list_tags(parser, args):
+    with CommandStore(parser, args) as (store, tenant):
+        tags = store.list_tags(**tenant)
+    print("Tags:", tags)
+
+def rename_tag_args(parser):
+    parser.add_argument("old_tag", type=str, help="Old tag name")
+    parser.add_argument("new_tag", type=str, help="New tag name")
+
+@command("rename-tag", "Rename a tag", rename_tag_args)
+def cmd_rename_tag(parser, args):
+    from todo_app import storage
+    count = storage.rename_tag(args.old_tag, args.new_tag)
+    print(f"Renamed tag in {count} todos.")
+
+def delete_tag_args(parser):
+    parser.add_argument("tag", type=str, help="Tag to delete")
+
+@command("delete-tag", "Delete a tag from all todos", delete_tag_args)
+def cmd_delete_tag(parser, args):
+    from todo_app import storage
+    count = storage.delete_tag_from_all(args.tag)
+    print(f"Deleted tag from {count} todos.")
+
+# Bulk actions: on the given ids, ids read one per line from --ids-from (a
+# file or - for stdin, any number of them), or every todo matching the
+# --where-*/--older-than conditions, changed by a single statement
+def add_bulk_target_args(parser):
+    parser.add_argument("ids", nargs="*", help="IDs of the todos")
+    parser.add_argument("--ids-from", type=str, default=None, metavar="FILE",
+                        help="Read IDs one per line from FILE (- for stdin)")
+    parser.add_argument("--where-status", type=str, choices=status_choices(), default=None,
+                        help="Only todos with this status")
+    parser.add_argument("--where-priority", type=int, choices=priority_choices(), default=None,
+                        help="Only todos with this priority")
+    parser.add_argument("--where-tag", type=str, default=None, help="Only todos with this tag")
+    parser.add_argument("--where-title", type=str, default=None, help="Only todos whose title contains this")
+    parser.add_argument("--older-than", type=str, default=None, metavar="AGE",
+                        help="Only todos created more than AGE ago, e.g. 90m, 12h, 30d, 2w")
+
+AGE_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+# "30d" -> the ISO-8601 timestamp 30 days ago
+def parse_age(value):
+    from datetime import datetime, timedelta
+    unit = AGE_UNITS.get(value[-1:])
+    try:
+        amount = float(value[:-1])
+    except ValueError:
+        unit = None
+    if unit is None or amount < 0:
+        raise ValueError(f"Invalid age: {value} (expected a number and one of s, m, h, d, w)")
+    return (datetime.utcnow() - timedelta(**{unit: amount})).isoformat()
+
+def _read_ids(filepath):
+    with (open(filepath, 'r', encoding='utf-8') if filepath != "-" else sys.stdin) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+# Run op_ids(ids) or op_where(TodoFilter) for the targets chosen on the command line
+def run_bulk(parser, args, op_ids, op_where):
+    from todo_app.models import TodoFilter
+    try:
+        created_before = parse_age(args.older_than) if args.older_than is not None else None
+    except ValueError as exc:
+        parser.error(str(exc))
+    where = TodoFilter(status=args.where_status, priority=args.where_priority, tag=args.where_tag,
+                       title=args.where_title, created_before=created_before)
+    if args.ids and args.ids_from:
+        parser.error("give IDs either as arguments or with --ids-from")
+    has_ids = bool(args.ids or args.ids_from)
+    if has_ids and not where.is_empty():
+        parser.error("IDs cannot be combined with --where-*/--older-than conditions")
+    if not has_ids and where.is_empty():
+        parser.error("give IDs, --ids-from or at least one --where-*/--older-than condition")
+    if not has_ids:
+        return op_where(where)
+    return op_ids(_read_ids(args.ids_from) if args.ids_from else args.ids)
+
+def bulk_status_args(parser):
+    parser.add_argument("status", type=str, choices=status_choices(), help="New status")
+    add_bulk_target_args(parser)
+
+@command("bulk-update-status", "Bulk update status for todos", bulk_status_args)
+def cmd_bulk_update_status(parser, args):
+    from todo_app import storage
+    count = run_bulk(parser, args, lambda ids: storage.bulk_update_status(ids, args.status),
+                     lambda where: storage.bulk_update_status_where(where, args.status))
+    print(f"Updated status for {count} todos.")
+
+def bulk_delete_args(parser):
+    add_bulk_target_args(parser)
+
+@command("bulk-delete", "Bulk delete todos", bulk_delete_args)
+def cmd_bulk_delete(parser, args):
+    from todo_app import storage
+    count = run_bulk(parser, args, storage.bulk_delete, storage.bulk_delete_where)
+    print(f"Deleted {count} todos.")
+
+def bulk_priority_args(parser):
+    parser.add_argument("priority", type=int, choices=priority_choices(), help="New priority (1-5)")
+    add_bulk_target_args(parser)
+
+@command("bulk-update-priority", "Bulk update priority for todos", bulk_priority_args)
+def cmd_bulk_update_priority(parser, args):
+    from todo_app import storage
+    count = run_bulk(parser, args, lambda ids: storage.bulk_update_priority(ids, args.priority),
+                     lambda where: storage.bulk_update_priority_where(where, args.priority))
+    print(f"Updated priority for {count} todos.")
+
+# Priority filtering/sorting
+def priority_args(parser):
+    parser.add_argument("priority", type=int, choices=priority_choices(), help="Priority (1-5)")
+    add_paging_args(parser)
+
+@command("priority", "List todos by priority", priority_args)
+def cmd_priority(parser, args):
+    print_todo_pages(parser, args, priority=args.priority)
+
+@command("list-sorted-priority", "List all todos sorted by priority (1=highest)", add_paging_args)
+def cmd_list_sorted_priority(parser, args):
+    print_todo_pages(parser, args, order="priority")
+
+# Delete todo
+def delete_args(parser):
+    parser.add_argument("id", type=str, help="ID of the todo to delete")
+    add_store_args(parser)
+
+@command("delete", "Delete a todo", delete_args)
+def cmd_delete(parser, args):
+    with CommandStore(parser, args) as (store, tenant):
+        deleted = store.delete_todo(args.id, **tenant)
+    if deleted:
+        print("Todo deleted.")
     else:
+        print("Todo not found.")
+
+# Dashboard counts
+def stats_args(parser):
+    parser.add_argument("--recompute", action="store_true", help="Rebuild the counters from the todos first")
+    add_store_args(parser, tenant=False)
+
+@command("stats", "Show todo counts per status, priority and tag", stats_args)
+def cmd_stats(parser, args):
+    if args.recompute and args.sharded:
+        parser.error("--recompute is not supported with --sharded")
+    with CommandStore(parser, args) as (store, _):
+        counts = store.recompute_stats() if args.recompute else store.stats()
+    print(f"Total: {counts['total']}")
+    print("By status: " + ", ".join(f"{s}={counts['status'].get(s, 0)}" for s in status_choices()))
+    print("By priority: " + ", ".join(f"{p}={counts['priority'].get(p, 0)}" for p in priority_choices()))
+    tags = sorted(counts['tags'].items(), key=lambda kv: (-kv[1], kv[0]))
+    print("By tag: " + (", ".join(f"{tag}={n}" for tag, n in tags) or "(none)"))
+
+# Metrics of a `serve --metrics` server (e.g. `todo-client metrics`)
+def metrics_args(parser):
+    parser.add_argument("--format", choices=["prometheus", "json"], default="prometheus", help="Output format")
+
+@command("metrics", "Print storage metrics (Prometheus text or JSON)", metrics_args)
+def cmd_metrics(parser, args):
+    from todo_app import storage
+    if args.format == "json":
+        import json
+        print(json.dumps(storage.metrics(), indent=2))
+    else:
+        print(storage.metrics_prometheus(), end="")
+
+# Init DB
+@command("init-db", "Initialize the database")
+def cmd_init_db(parser, args):
+    from todo_app import storage
+    storage.init_db()
+    print("Database initialized.")
+
+# Warm server and batch mode
+def serve_args(parser):
+    parser.add_argument("--socket", type=str, default=None, help="Socket path (default: $TODO_APP_SOCKET or ./todos.sock)")
+    parser.add_argument("--metrics", action="store_true", help="Collect storage metrics, readable with the metrics command")
+    parser.add_argument("--slow-query-ms", type=float, default=None,
+                        help="With --metrics, log statements slower than this (default: 100)")
+    parser.add_argument("--memory", action="store_true",
+                        help="Keep the database in memory and write it back to the file periodically and on exit")
+    parser.add_argument("--flush-interval", type=float, default=None,
+                        help="With --memory, seconds between writes to the file (default: 5; 0: only on exit "
+                             "and --flush-rows)")
+    parser.add_argument("--flush-rows", type=int, default=None,
+                        help="With --memory, write to the file early after this many changed rows (default: 10000)")
+
+@command("serve", "Serve commands from todo-client over a Unix socket", serve_args)
+def cmd_serve(parser, args):
+    from todo_app import storage
+    from todo_app.server import serve
+    if args.metrics:
+        storage.enable_metrics(args.slow_query_ms)
+    if args.memory:
+        storage.configure(engine="memory", flush_interval=args.flush_interval, flush_rows=args.flush_rows)
+    serve(args.socket)
+
+# Sharded stores (see sharding.py)
+def rebalance_args(parser):
+    parser.add_argument("directory", type=str, help="Directory of the sharded store (created if missing)")
+    parser.add_argument("--shards", type=int, required=True, help="New number of shards")
+    parser.add_argument("--by", choices=["id", "tenant"], default="id",
+                        help="Routing of a new store: hash of the todo id or of its tenant (default: id)")
+
+@command("rebalance", "Create a sharded store or change its number of shards", rebalance_args)
+def cmd_rebalance(parser, args):
+    import os
+    from todo_app.sharding import MANIFEST, ShardedStore
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    new = not os.path.exists(os.path.join(args.directory, MANIFEST))
+    store = ShardedStore(args.directory, shards=args.shards if new else None, by=args.by)
+    try:
+        store.init_db()
+        before = store.shards
+        copied = store.rebalance(args.shards)
+        print(f"{args.directory}: {before} -> {store.shards} shards, {copied} todos moved.")
+        print("Todos per shard: " + ", ".join(str(n) for n in store.shard_counts()))
+    finally:
+        store.close()
+
+def batch_args(parser):
+    parser.add_argument("--keep-going", action="store_true", help="Roll back only the failing command and continue")
+    parser.add_argument("--output", choices=["text", "json"], default="text", help="json: one result object per command")
+
+@command("batch", "Run commands read from stdin in one process and transaction", batch_args)
+def cmd_batch(parser, args):
+    from todo_app.server import run_batch
+    # main() only built the batch subparser; the batch lines need them all
+    sys.exit(run_batch(build_parser(), sys.stdin, keep_going=args.keep_going, output=args.output))
+
+
+# Run one command with storage metrics on and print the breakdown to stderr
+def run_profiled(parser, args):
+    import logging
+    import time
+    from todo_app import storage
+    # Slow queries are part of the breakdown; don't also print the log lines
+    logging.getLogger("todo_app.storage").addHandler(logging.NullHandler())
+    storage.enable_metrics()
+    started = time.perf_counter()
+    try:
+        run_command(parser, args)
+    except BrokenPipeError:
+        exit_on_broken_pipe()
+    finally:
+        storage.close_pool()
+        print_profile(storage.metrics(), time.perf_counter() - started)
+        storage.disable_metrics()
+
+def print_profile(metrics, seconds):
+    err = sys.stderr
+    print(f"\nProfile: {seconds * 1000:.1f} ms total", file=err)
+    for title, key, width in (("Storage calls", "functions", 28), ("SQL statements", "queries", 60)):
+        stats = sorted(metrics[key].items(), key=lambda kv: -kv[1]["total_ms"])
+        if not stats:
+            continue
+        print(f"\n{title:<{width}} {'calls':>7} {'rows':>9} {'total ms':>10} {'p50':>8} {'p95':>8} {'p99':>8}", file=err)
+        for name, s in stats:
+            if len(name) > width:
+                name = name[:width - 3] + "..."
+            print(f"{name:<{width}} {s['calls']:>7} {s['rows']:>9} {s['total_ms']:>10.2f} "
+                  f"{s['p50_ms']:>8.3f} {s['p95_ms']:>8.3f} {s['p99_ms']:>8.3f}", file=err)
+    conns = metrics["connections"]
+    print(f"\nConnections: {conns['opened']} opened, {conns['closed']} closed", file=err)
+    for slow in metrics["slow_queries"]:
+        print(f"\nSlow query ({slow['ms']:.1f} ms, {slow['rows']} rows): {slow['sql']}", file=err)
+        for step in slow["plan"] or ():
+            print(f"    {step}", file=err)
+
+
+# Build the CLI parser with subparsers for `commands` (default: all).
+# arguments=False leaves the subparsers empty, which is enough for the
+# top-level --help and for rejecting unknown commands.
+def build_parser(commands=None, arguments=True):
+    parser = argparse.ArgumentParser(description="ToDo List CLI App")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print where the command spent its time in storage and SQL (on stderr)")
+    subparsers = parser.add_subparsers(dest="command")
+    for name in COMMANDS if commands is None else commands:
+        cmd = COMMANDS[name]
+        subparser = subparsers.add_parser(name, help=cmd.help)
+        if arguments:
+            cmd.arguments(subparser)
+    return parser
+
+# Run one parsed command
+def run_command(parser, args):
+    cmd = COMMANDS.get(args.command)
+    if cmd is None:
         parser.print_help()
+        return
+    cmd.run(parser, args)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    profile = argv[:1] == ["--profile"]
+    # The command name comes first; without a known one (e.g. plain -h) only
+    # the list of commands is needed
+    name = argv[1:2] if profile else argv[:1]
+    if name and name[0] in COMMANDS:
+        parser = build_parser(name)
+    else:
+        parser = build_parser(arguments=False)
+    args = parser.parse_args(argv)
+    if args.profile:
+        run_profiled(parser, args)
+        return
+    try:
+        run_command(parser, args)
+    except BrokenPipeError:
+        exit_on_broken_pipe()
+
+# The reader went away (e.g. `| head`): stop quietly. Pointing stdout at
+# /dev/null keeps the interpreter's final flush from failing again.
+def exit_on_broken_pipe():
+    import os
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
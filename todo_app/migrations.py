@@ -0,0 +1,403 @@
+# todo_app/migrations.py
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+from .encoding import encode_id, encode_time
+
+# A migration step is either a SQL statement or a callable taking the connection.
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+# Full-text index over title and description. It is an external-content FTS5
+# table (the text is not stored twice) keyed on todos.rowid and kept current by
+# triggers. SQLite builds without FTS5 skip it and storage.search_text falls
+# back to LIKE matching.
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts USING fts5(
+        title, description, content='todos', content_rowid='rowid'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN
+        INSERT INTO todos_fts (rowid, title, description) VALUES (NEW.rowid, NEW.title, NEW.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description)
+            VALUES ('delete', OLD.rowid, OLD.title, OLD.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description ON todos BEGIN
+        INSERT INTO todos_fts (todos_fts, rowid, title, description)
+            VALUES ('delete', OLD.rowid, OLD.title, OLD.description);
+        INSERT INTO todos_fts (rowid, title, description) VALUES (NEW.rowid, NEW.title, NEW.description);
+    END
+    """,
+    "INSERT INTO todos_fts (todos_fts) VALUES ('rebuild')",
+]
+
+
+# Rebuild todo_counters from the tables it summarizes
+COUNTERS_RECOMPUTE_SQL = [
+    "DELETE FROM todo_counters",
+    "INSERT INTO todo_counters (kind, key, count) SELECT 'total', '', COUNT(*) FROM todos",
+    "INSERT INTO todo_counters (kind, key, count) SELECT 'status', status, COUNT(*) FROM todos GROUP BY status",
+    """
+    INSERT INTO todo_counters (kind, key, count)
+        SELECT 'priority', CAST(priority AS TEXT), COUNT(*) FROM todos GROUP BY priority
+    """,
+    "INSERT INTO todo_counters (kind, key, count) SELECT 'tag', tag, COUNT(*) FROM todo_tags GROUP BY tag",
+]
+
+
+def _bump(kind: str, key: str, delta: str) -> str:
+    return (
+        f"INSERT INTO todo_counters (kind, key, count) VALUES ('{kind}', {key}, {delta}) "
+        f"ON CONFLICT (kind, key) DO UPDATE SET count = count + ({delta});"
+    )
+
+
+def has_fts5(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    conn.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+# Create (or rebuild) the full-text index when this SQLite build has FTS5
+def create_search_index(conn: sqlite3.Connection) -> bool:
+    if not has_fts5(conn):
+        return False
+    for stmt in FTS_SQL:
+        conn.execute(stmt)
+    return True
+
+
+def _add_fingerprint_column(conn: sqlite3.Connection):
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(todos)")}
+    if "fingerprint" not in columns:
+        conn.execute("ALTER TABLE todos ADD COLUMN fingerprint TEXT")
+
+
+# Compact encoding (see encoding.py): todos gets an INTEGER PRIMARY KEY that
+# todo_tags and the full-text index refer to, ids become 16-byte BLOBs under a
+# unique index and timestamps integer epoch microseconds. The tables are
+# rebuilt, which drops their indexes and triggers; these recreate them.
+COMPACT_SCHEMA_SQL = [
+    """
+    CREATE TABLE todos (
+        pk INTEGER PRIMARY KEY,
+        id BLOB NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        tags TEXT,
+        status TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 3,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        fingerprint TEXT
+    )
+    """,
+    # todo_id is todos.pk
+    """
+    CREATE TABLE todo_tags (
+        tag TEXT NOT NULL,
+        todo_id INTEGER NOT NULL,
+        PRIMARY KEY (tag, todo_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE todo_tombstones (
+        id BLOB PRIMARY KEY,
+        deleted_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+]
+
+COMPACT_INDEX_SQL = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_todos_id ON todos (id)",
+    "CREATE INDEX IF NOT EXISTS idx_todos_created_id ON todos (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_todos_status_created_id ON todos (status, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_todos_priority_created_id ON todos (priority, created_at DESC, id DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_todos_updated ON todos (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_todos_fingerprint ON todos (fingerprint)",
+    "CREATE INDEX IF NOT EXISTS idx_todo_tags_todo_id ON todo_tags (todo_id)",
+    "CREATE INDEX IF NOT EXISTS idx_tombstones_deleted ON todo_tombstones (deleted_at)",
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tags_ai AFTER INSERT ON todos BEGIN
+        INSERT OR IGNORE INTO todo_tags (tag, todo_id)
+            SELECT value, NEW.pk FROM json_each(NEW.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tags_au AFTER UPDATE OF tags ON todos BEGIN
+        DELETE FROM todo_tags WHERE todo_id = OLD.pk;
+        INSERT OR IGNORE INTO todo_tags (tag, todo_id)
+            SELECT value, NEW.pk FROM json_each(NEW.tags);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_tags_ad AFTER DELETE ON todos BEGIN
+        DELETE FROM todo_tags WHERE todo_id = OLD.pk;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_counters_ai AFTER INSERT ON todos BEGIN
+        {_bump('total', "''", '1')}
+        {_bump('status', 'NEW.status', '1')}
+        {_bump('priority', 'CAST(NEW.priority AS TEXT)', '1')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_counters_ad AFTER DELETE ON todos BEGIN
+        {_bump('total', "''", '-1')}
+        {_bump('status', 'OLD.status', '-1')}
+        {_bump('priority', 'CAST(OLD.priority AS TEXT)', '-1')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_counters_au AFTER UPDATE OF status, priority ON todos
+    WHEN OLD.status IS NOT NEW.status OR OLD.priority IS NOT NEW.priority BEGIN
+        {_bump('status', 'OLD.status', '-1')}
+        {_bump('status', 'NEW.status', '1')}
+        {_bump('priority', 'CAST(OLD.priority AS TEXT)', '-1')}
+        {_bump('priority', 'CAST(NEW.priority AS TEXT)', '1')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_tags_counters_ai AFTER INSERT ON todo_tags BEGIN
+        {_bump('tag', 'NEW.tag', '1')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_tags_counters_ad AFTER DELETE ON todo_tags BEGIN
+        {_bump('tag', 'OLD.tag', '-1')}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todos_fingerprint_au AFTER UPDATE OF title, description, tags ON todos
+    WHEN NEW.fingerprint IS NOT NULL BEGIN
+        UPDATE todos SET fingerprint = NULL WHERE pk = NEW.pk;
+    END
+    """,
+]
+
+
+# Copy every row into the compact tables, oldest first (so pk follows
+# creation order), and swap them in. The encoders run as SQL functions so the
+# copy is one INSERT ... SELECT per table.
+def _compact_encoding(conn: sqlite3.Connection):
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'todos_fts'").fetchone() is not None
+    conn.create_function("encode_id", 1, encode_id)
+    conn.create_function("encode_time", 1, encode_time)
+    if has_fts:
+        for trigger in ("todos_fts_ai", "todos_fts_ad", "todos_fts_au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE todos_fts")
+    for table in ("todos", "todo_tags", "todo_tombstones"):
+        conn.execute(f"ALTER TABLE {table} RENAME TO {table}_v8")
+    for stmt in COMPACT_SCHEMA_SQL:
+        conn.execute(stmt)
+    conn.execute(
+        """
+        INSERT INTO todos (id, title, description, tags, status, priority, created_at, updated_at, fingerprint)
+            SELECT encode_id(id), title, description, tags, status, priority,
+                   encode_time(created_at), encode_time(updated_at), fingerprint
+            FROM todos_v8 ORDER BY created_at, id
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO todo_tombstones (id, deleted_at)
+            SELECT encode_id(id), encode_time(deleted_at) FROM todo_tombstones_v8
+        """
+    )
+    for table in ("todos", "todo_tags", "todo_tombstones"):
+        conn.execute(f"DROP TABLE {table}_v8")
+    for stmt in COMPACT_INDEX_SQL:
+        conn.execute(stmt)
+    conn.execute("INSERT OR IGNORE INTO todo_tags (tag, todo_id) SELECT j.value, t.pk FROM todos t, json_each(t.tags) j")
+    for stmt in COUNTERS_RECOMPUTE_SQL:
+        conn.execute(stmt)
+    if has_fts:
+        create_search_index(conn)
+
+
+# Ordered schema migrations. The schema version is kept in PRAGMA user_version
+# and each entry upgrades the database from version - 1 to version. Steps are
+# written to be harmless on databases created before versioning existed.
+# Never edit a released migration; append a new one instead.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "create todos", [
+        """
+        CREATE TABLE IF NOT EXISTS todos (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            tags TEXT,
+            status TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 3,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """,
+    ]),
+    # todos.tags stays the JSON source of truth; todo_tags is an index over it
+    # that the triggers keep in sync on every insert, update and delete.
+    (2, "tag index table", [
+        """
+        CREATE TABLE IF NOT EXISTS todo_tags (
+            tag TEXT NOT NULL,
+            todo_id TEXT NOT NULL,
+            PRIMARY KEY (tag, todo_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_todo_tags_todo_id ON todo_tags (todo_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_tags_ai AFTER INSERT ON todos BEGIN
+            INSERT OR IGNORE INTO todo_tags (tag, todo_id)
+                SELECT value, NEW.id FROM json_each(NEW.tags);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_tags_au AFTER UPDATE OF tags ON todos BEGIN
+            DELETE FROM todo_tags WHERE todo_id = OLD.id;
+            INSERT OR IGNORE INTO todo_tags (tag, todo_id)
+                SELECT value, NEW.id FROM json_each(NEW.tags);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_tags_ad AFTER DELETE ON todos BEGIN
+            DELETE FROM todo_tags WHERE todo_id = OLD.id;
+        END
+        """,
+        """
+        INSERT OR IGNORE INTO todo_tags (tag, todo_id)
+            SELECT j.value, t.id FROM todos t, json_each(t.tags) j
+        """,
+    ]),
+    # Serve the status/priority filters and the created_at ordering without a
+    # full scan or a temp B-tree sort.
+    (3, "status, priority and created_at indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_todos_created ON todos (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_todos_status_created ON todos (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_todos_priority_created ON todos (priority, created_at DESC)",
+    ]),
+    # Add id as the tiebreaker so keyset pagination on (created_at, id) is an
+    # index range scan.
+    (4, "keyset pagination indexes", [
+        "DROP INDEX IF EXISTS idx_todos_created",
+        "DROP INDEX IF EXISTS idx_todos_status_created",
+        "DROP INDEX IF EXISTS idx_todos_priority_created",
+        "CREATE INDEX IF NOT EXISTS idx_todos_created_id ON todos (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_todos_status_created_id ON todos (status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_todos_priority_created_id ON todos (priority, created_at DESC, id DESC)",
+    ]),
+    (5, "full-text search index", [create_search_index]),
+    # Delta sync: rows changed since a checkpoint are found through
+    # updated_at, deleted ids through the tombstones that storage writes on
+    # every delete.
+    (6, "change tracking for delta export", [
+        "CREATE INDEX IF NOT EXISTS idx_todos_updated ON todos (updated_at)",
+        """
+        CREATE TABLE IF NOT EXISTS todo_tombstones (
+            id TEXT PRIMARY KEY,
+            deleted_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tombstones_deleted ON todo_tombstones (deleted_at)",
+    ]),
+    # Row counts per status, priority and tag for storage.stats(), kept
+    # current by triggers. Tag counts follow todo_tags, so every path that
+    # rewrites todos.tags (updates, rename/delete tag, imports) is covered.
+    (7, "aggregate counters", [
+        """
+        CREATE TABLE IF NOT EXISTS todo_counters (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS todos_counters_ai AFTER INSERT ON todos BEGIN
+            {_bump('total', "''", '1')}
+            {_bump('status', 'NEW.status', '1')}
+            {_bump('priority', 'CAST(NEW.priority AS TEXT)', '1')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS todos_counters_ad AFTER DELETE ON todos BEGIN
+            {_bump('total', "''", '-1')}
+            {_bump('status', 'OLD.status', '-1')}
+            {_bump('priority', 'CAST(OLD.priority AS TEXT)', '-1')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS todos_counters_au AFTER UPDATE OF status, priority ON todos
+        WHEN OLD.status IS NOT NEW.status OR OLD.priority IS NOT NEW.priority BEGIN
+            {_bump('status', 'OLD.status', '-1')}
+            {_bump('status', 'NEW.status', '1')}
+            {_bump('priority', 'CAST(OLD.priority AS TEXT)', '-1')}
+            {_bump('priority', 'CAST(NEW.priority AS TEXT)', '1')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS todo_tags_counters_ai AFTER INSERT ON todo_tags BEGIN
+            {_bump('tag', 'NEW.tag', '1')}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS todo_tags_counters_ad AFTER DELETE ON todo_tags BEGIN
+            {_bump('tag', 'OLD.tag', '-1')}
+        END
+        """,
+        *COUNTERS_RECOMPUTE_SQL,
+    ]),
+    # Content hash used by imports to find duplicates (see
+    # importer.fingerprint). Rows are hashed in Python, so a row inserted
+    # without one or whose content changes has it reset to NULL, and the
+    # importer fills the NULLs in before it looks anything up.
+    (8, "content fingerprints for import dedup", [
+        _add_fingerprint_column,
+        "CREATE INDEX IF NOT EXISTS idx_todos_fingerprint ON todos (fingerprint)",
+        """
+        CREATE TRIGGER IF NOT EXISTS todos_fingerprint_au AFTER UPDATE OF title, description, tags ON todos
+        WHEN NEW.fingerprint IS NOT NULL BEGIN
+            UPDATE todos SET fingerprint = NULL WHERE id = NEW.id;
+        END
+        """,
+    ]),
+    (9, "compact encoding", [_compact_encoding]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Apply every pending migration on `conn`. The caller owns the transaction,
+# so a failing step leaves the database at its previous version.
+def migrate(conn: sqlite3.Connection, target: int = LATEST_VERSION) -> int:
+    version = get_version(conn)
+    if version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this app supports ({LATEST_VERSION})."
+        )
+    for number, _name, steps in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        for step in steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+        conn.execute(f"PRAGMA user_version = {number}")
+        version = number
+    return version
@@ -1,8 +1,11 @@
 
+import json
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 
+from .encoding import decode_id, decode_time, encode_id, encode_time
+
 
 class TodoStatus(str, Enum):
     TODO = "TODO"
@@ -16,20 +19,117 @@ PRIORITY_MAX = 5
 
 
 class TodoItem:
+    # id, tags, created_at and updated_at may hold the raw stored values (a
+    # UUID blob, JSON text and epoch microseconds, or ISO-8601 text); they are
+    # decoded on first access, so callers that never read them never pay for
+    # the conversion.
+    __slots__ = ("_id", "title", "description", "status", "priority", "_tags", "_created_at", "_updated_at")
+
     def __init__(self, id: str, title: str, description: Optional[str], tags: List[str], status: str, priority: int, created_at: datetime, updated_at: datetime):
-        self.id = id
+        self._id = id
         self.title = title
         self.description = description
-        self.tags = tags
+        self._tags = tags
         self.status = status
         self.priority = int(priority)
-        self.created_at = created_at
-        self.updated_at = updated_at
+        self._created_at = created_at
+        self._updated_at = updated_at
+
+    # Build an item straight from a stored row (id, title, description,
+    # tags JSON, status, priority, created_at, updated_at; see encoding.py)
+    @classmethod
+    def from_row(cls, row) -> "TodoItem":
+        item = _new(cls)
+        item._id, item.title, item.description, item._tags, item.status, item.priority, item._created_at, item._updated_at = row
+        return item
+
+    @property
+    def id(self) -> str:
+        tid = self._id
+        if tid.__class__ is bytes:
+            tid = self._id = decode_id(tid)
+        return tid
+
+    @id.setter
+    def id(self, value: str):
+        self._id = value
+
+    @property
+    def tags(self) -> List[str]:
+        tags = self._tags
+        if tags is None or tags.__class__ is str:
+            tags = self._tags = json.loads(tags) if tags else []
+        return tags
+
+    @tags.setter
+    def tags(self, value: List[str]):
+        self._tags = value
+
+    @property
+    def created_at(self) -> datetime:
+        value = self._created_at
+        if value.__class__ is int:
+            value = self._created_at = decode_time(value)
+        elif value.__class__ is str:
+            value = self._created_at = datetime.fromisoformat(value)
+        return value
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        self._created_at = value
+
+    @property
+    def updated_at(self) -> datetime:
+        value = self._updated_at
+        if value.__class__ is int:
+            value = self._updated_at = decode_time(value)
+        elif value.__class__ is str:
+            value = self._updated_at = datetime.fromisoformat(value)
+        return value
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        self._updated_at = value
+
+    def copy(self) -> "TodoItem":
+        item = _new(TodoItem)
+        item._id, item.title, item.description, item.status, item.priority = self._id, self.title, self.description, self.status, self.priority
+        tags = self._tags
+        item._tags = list(tags) if tags.__class__ is list else tags
+        item._created_at, item._updated_at = self._created_at, self._updated_at
+        return item
+
+    # The stored row form of the item (the inverse of from_row); fields
+    # that were never decoded are passed through as they are
+    def to_row(self) -> tuple:
+        tags, created_at, updated_at = self._tags, self._created_at, self._updated_at
+        return (
+            self._id if self._id.__class__ is bytes else encode_id(self._id), self.title, self.description,
+            tags if tags.__class__ is str else json.dumps(tags or []),
+            self.status, self.priority,
+            created_at if created_at.__class__ is int else encode_time(created_at),
+            updated_at if updated_at.__class__ is int else encode_time(updated_at),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "tags": self.tags,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
 
     def __repr__(self):
         return f"<TodoItem {self.id} {self.title} {self.status}>"
 
 
+_new = object.__new__
+
+
 class TodoCreate:
     def __init__(self, title: str, description: Optional[str] = None, tags: Optional[List[str]] = None, priority: int = 3):
         self.title = title
@@ -44,4 +144,53 @@ class TodoUpdate:
         self.description = description
         self.tags = tags
         self.status = status
-        self.priority = int(priority) if priority is not None else None
\ No newline at end of file
+        self.priority = int(priority) if priority is not None else None
+
+# Selects todos for storage.query and the set-based bulk operations
+# (storage.bulk_*_where). Every given condition must hold:
+#   status, priority     one value or a list of accepted values
+#   priority_min/max     inclusive priority range
+#   tag, tags_all        carries this tag / every one of these tags
+#   tags_any             carries at least one of these tags
+#   title                title contains this text
+#   text                 full-text search in title and description
+#   created_*/updated_*  after/before an ISO-8601 timestamp (exclusive)
+class TodoFilter:
+    FIELDS = ("status", "priority", "priority_min", "priority_max", "tag", "tags_all", "tags_any", "title", "text",
+              "created_after", "created_before", "updated_after", "updated_before")
+
+    def __init__(self, status=None, priority=None, priority_min: Optional[int] = None,
+                 priority_max: Optional[int] = None, tag: Optional[str] = None, tags_all: Optional[List[str]] = None,
+                 tags_any: Optional[List[str]] = None, title: Optional[str] = None, text: Optional[str] = None,
+                 created_after: Optional[str] = None, created_before: Optional[str] = None,
+                 updated_after: Optional[str] = None, updated_before: Optional[str] = None):
+        self.status = _one_or_list(status, lambda s: s.value if isinstance(s, TodoStatus) else s)
+        self.priority = _one_or_list(priority, int)
+        self.priority_min = int(priority_min) if priority_min is not None else None
+        self.priority_max = int(priority_max) if priority_max is not None else None
+        self.tag = tag
+        self.tags_all = list(tags_all) if tags_all else None
+        self.tags_any = list(tags_any) if tags_any else None
+        self.title = title
+        self.text = text
+        self.created_after = created_after
+        self.created_before = created_before
+        self.updated_after = updated_after
+        self.updated_before = updated_before
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, name) is None for name in self.FIELDS)
+
+    def __repr__(self):
+        given = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS if getattr(self, name) is not None)
+        return f"TodoFilter({given})"
+
+# A single value stays a value; a list (or tuple, set) of one value collapses
+# to that value, so both compile to the same SQL
+def _one_or_list(value, convert):
+    if value is None or isinstance(value, (str, int)):
+        return convert(value) if value is not None else None
+    values = list(dict.fromkeys(convert(v) for v in value))
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
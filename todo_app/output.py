@@ -0,0 +1,111 @@
+# todo_app/output.py
+#
+# Rendering of todo listings for the CLI. Every format works on pages of
+# stored rows (tuples in storage.COLUMNS order, as from storage.iter_todo_rows)
+# and writes each page with one call, so listing a million todos costs a few
+# thousand writes instead of one print per todo; no format builds TodoItems
+# and only text decodes the tags.
+#
+#     with buffered_stdout() as out:
+#         write_rows(out, "ndjson", storage.iter_todo_rows())
+import contextlib
+import csv
+import json
+import sys
+from typing import Iterable, List, Tuple
+
+from . import storage
+from .encoding import decode_id, decode_row, decode_time
+
+FORMATS = ("text", "json", "ndjson", "csv", "tsv", "ids")
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+# Same layout print_todo has always used
+def _text_row(row) -> str:
+    tid, title, description, tags, status, priority, created_at, updated_at = row
+    return (
+        f"ID: {decode_id(tid)}\nTitle: {title}\nDescription: {description}\n"
+        f"Tags: {json.loads(tags) if tags else []}\nStatus: {status}\nPriority: {priority}\n"
+        f"Created: {decode_time(created_at)}\nUpdated: {decode_time(updated_at)}\n\n"
+    )
+
+def _write_text(out, pages):
+    count = 0
+    for rows in pages:
+        out.write("".join([_text_row(r) for r in rows]))
+        count += len(rows)
+    return count
+
+def _write_json(out, pages):
+    count = 0
+    out.write("[")
+    for rows in pages:
+        out.write(("," if count else "") + "\n" + ",\n".join([storage._export_row_json(r) for r in rows]))
+        count += len(rows)
+    out.write("\n]\n" if count else "]\n")
+    return count
+
+def _write_ndjson(out, pages):
+    count = 0
+    for rows in pages:
+        out.write("\n".join([storage._export_row_json(r) for r in rows]) + "\n")
+        count += len(rows)
+    return count
+
+def _writer_for(dialect):
+    def write(out, pages):
+        writer = csv.writer(out, dialect)
+        writer.writerow(storage.EXPORT_COLUMNS)
+        count = 0
+        for rows in pages:
+            writer.writerows(map(decode_row, rows))
+            count += len(rows)
+        return count
+    return write
+
+def _write_ids(out, pages):
+    count = 0
+    for rows in pages:
+        out.write("\n".join([decode_id(r[0]) for r in rows]) + "\n")
+        count += len(rows)
+    return count
+
+_WRITERS = {
+    "text": _write_text,
+    "json": _write_json,
+    "ndjson": _write_ndjson,
+    "csv": _writer_for("excel"),
+    "tsv": _writer_for("excel-tab"),
+    "ids": _write_ids,
+}
+
+# Write pages of stored rows to `out` in format `fmt`; returns the number of
+# rows. Empty pages are skipped, so no format writes anything for them.
+def write_rows(out, fmt: str, pages: Iterable[List[Tuple]]) -> int:
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    return _WRITERS[fmt](out, (rows for rows in pages if rows))
+
+# Same for TodoItems (e.g. search results)
+def write_todos(out, fmt: str, todos) -> int:
+    return write_rows(out, fmt, [[t.to_row() for t in todos]])
+
+# Yield a large-buffered text stream on stdout's file descriptor, flushed on
+# exit. An interactive terminal, or a stdout replaced by a non-file (the
+# serve/batch modes, tests), is yielded as it is.
+@contextlib.contextmanager
+def buffered_stdout():
+    stdout = sys.stdout
+    try:
+        fd = stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        fd = None
+    if fd is None or stdout.isatty():
+        yield stdout
+        return
+    stdout.flush()
+    with open(fd, "w", buffering=OUTPUT_BUFFER_SIZE, encoding=stdout.encoding,
+              errors=stdout.errors, closefd=False) as out:
+        yield out
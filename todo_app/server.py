@@ -0,0 +1,216 @@
+# todo_app/server.py
+#
+# Two ways to run many CLI commands without paying interpreter startup,
+# imports, parser construction and new connections for each one:
+#
+# - serve: a warm process answering todo_app.client over a Unix socket
+# - run_batch: commands read from a stream, run in one transaction
+import contextlib
+import io
+import json
+import os
+import shlex
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from typing import Iterable, List, Optional
+
+from todo_app import storage
+from todo_app.client import socket_path
+from todo_app.main import build_parser, run_command
+
+# Commands that cannot run inside serve or batch
+NOT_IN_SERVER = {"serve", "batch"}
+NOT_IN_BATCH = NOT_IN_SERVER | {"import-new"}
+
+OUTPUT_FRAME_SIZE = 1 << 16
+
+
+def _exit_status(exc: SystemExit, err) -> int:
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=err)
+    return 1
+
+# Parse and run one command line with its output sent to out/err; returns
+# the exit status. Errors other than SystemExit propagate.
+def run_argv(parser, argv: List[str], out, err, excluded=NOT_IN_SERVER) -> int:
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            args = parser.parse_args(argv)
+            if args.command in excluded:
+                parser.error(f"{args.command} cannot be run from here")
+            run_command(parser, args)
+        except SystemExit as exc:
+            return _exit_status(exc, err)
+    return 0
+
+
+class _FrameWriter(io.TextIOBase):
+    # File-like object sending what is written to the client as
+    # {"<stream>": text} frames, at most OUTPUT_FRAME_SIZE characters at a time
+    def __init__(self, wfile, stream: str):
+        self.wfile = wfile
+        self.stream = stream
+        self._parts: List[str] = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= OUTPUT_FRAME_SIZE:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            frame = json.dumps({self.stream: "".join(self._parts)})
+            self._parts, self._size = [], 0
+            self.wfile.write(frame.encode("utf-8") + b"\n")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            self._handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. its output went to `| head`)
+            pass
+
+    def _handle(self):
+        for line in self.rfile:
+            request = json.loads(line)
+            out = _FrameWriter(self.wfile, "out")
+            err = _FrameWriter(self.wfile, "err")
+            cwd = os.getcwd()
+            try:
+                # Relative paths in the command (export/import files) are the client's
+                os.chdir(request.get("cwd") or cwd)
+                status = run_argv(self.server.parser, request["argv"], out, err)
+            except Exception:
+                err.write(traceback.format_exc())
+                status = 1
+            finally:
+                os.chdir(cwd)
+            out.flush()
+            err.flush()
+            self.wfile.write(json.dumps({"exit": status}).encode("utf-8") + b"\n")
+
+
+class _Server(socketserver.UnixStreamServer):
+    # Requests are handled one at a time: commands print through the
+    # process-wide sys.stdout, and the storage layer serializes writes anyway
+    def __init__(self, path: str, parser):
+        self.parser = parser
+        super().__init__(path, _Handler)
+
+
+def _remove_stale_socket(path: str):
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+    else:
+        raise SystemExit(f"A todo-app server is already listening on {path}")
+    finally:
+        probe.close()
+
+def make_server(path: str) -> socketserver.UnixStreamServer:
+    # The database must not move when a request changes directory
+    storage.DB_PATH = os.path.abspath(storage.DB_PATH)
+    storage._pool()
+    _remove_stale_socket(path)
+    return _Server(path, build_parser())
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+# Serve commands on a Unix socket until interrupted (SIGINT or SIGTERM)
+def serve(path: Optional[str] = None):
+    path = path or socket_path()
+    server = make_server(path)
+    print(f"Serving {storage.DB_PATH} on {path} (Ctrl-C to stop).", file=sys.stderr)
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        storage.close_pool()
+
+
+class _CommandFailed(Exception):
+    pass
+
+# Commands are shell-style lines ("add 'Buy milk' --priority 1", # starts a
+# comment), JSON arrays of arguments or JSON objects with an "argv" array
+def parse_batch_line(line: str) -> Optional[List[str]]:
+    text = line.strip()
+    if text.startswith("["):
+        return [str(a) for a in json.loads(text)]
+    if text.startswith("{"):
+        return [str(a) for a in json.loads(text)["argv"]]
+    return shlex.split(text, comments=True) or None
+
+# Run every command in `lines` inside one transaction; returns the exit
+# status. By default the first failing command rolls back the whole batch;
+# with keep_going only that command is rolled back. With output="json" each
+# command's result is printed as one JSON object instead of its output.
+def run_batch(parser, lines: Iterable[str], keep_going: bool = False, output: str = "text",
+              out=None, err=None) -> int:
+    out = out or sys.stdout
+    err = err or sys.stderr
+    failed = 0
+    try:
+        with storage.transaction():
+            for number, line in enumerate(lines, 1):
+                try:
+                    argv = parse_batch_line(line)
+                except (ValueError, KeyError, TypeError) as exc:
+                    argv, error = None, f"line {number}: cannot parse command: {exc}"
+                else:
+                    error = None
+                if argv is None and error is None:
+                    continue
+                cmd_out = io.StringIO() if output == "json" else out
+                cmd_err = io.StringIO() if output == "json" else err
+                status = 1
+                try:
+                    with storage.transaction():
+                        if error is not None:
+                            print(error, file=cmd_err)
+                        else:
+                            status = run_argv(parser, argv, cmd_out, cmd_err, excluded=NOT_IN_BATCH)
+                        if status != 0:
+                            raise _CommandFailed()
+                except _CommandFailed:
+                    failed += 1
+                except Exception:
+                    print(traceback.format_exc(), end="", file=cmd_err)
+                    failed += 1
+                    status = 1
+                if output == "json":
+                    print(json.dumps({"line": number, "argv": argv, "exit": status,
+                                      "out": cmd_out.getvalue(), "err": cmd_err.getvalue()}), file=out)
+                if status != 0 and not keep_going:
+                    raise _CommandFailed()
+    except _CommandFailed:
+        print(f"Batch stopped at line {number}; no changes were saved.", file=err)
+        return 1
+    if failed:
+        print(f"{failed} commands failed and were rolled back; the others were saved.", file=err)
+        return 1
+    return 0
@@ -0,0 +1,542 @@
+# todo_app/sharding.py
+#
+# Todos spread over several SQLite files, each with its own connection pool
+# and therefore its own write lock, so writes to different shards run in
+# parallel:
+#
+#     from todo_app.sharding import ShardedStore
+#     store = ShardedStore("data", shards=8)
+#     store.init_db()
+#     todo = store.insert_todo(TodoCreate("Write report"))
+#     page, cursor = store.get_page(status="TODO", limit=20)
+#     store.export_todos("todos.ndjson", "ndjson")
+#     store.rebalance(16)
+#     store.close()
+#
+# A todo lives in the shard picked by a hash of its id (by="id"), or of the
+# tenant it was inserted for (by="tenant"). In tenant mode every write names
+# the tenant, and a read that names one only touches that tenant's shard and
+# rows. Other reads are sent to every shard at once on a thread pool, and the
+# sorted results are merged (a k-way merge on the sort key, so every shard
+# reads just the rows it contributes). Cursors are the same as storage's.
+#
+# The directory holds one shard-NNN-of-MMM.db file per shard and shards.json,
+# which records the shard count and the routing. insert_many() and imports
+# commit shard by shard, so they are not atomic across shards. The CLI reaches
+# a store with --sharded DIRECTORY (see main.py).
+import heapq
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import importer, storage
+from .connection import ConnectionPool, DEFAULT_READERS
+from .encoding import decode_id, encode_id
+from .importer import ImportResult
+from .migrations import migrate
+from .models import TodoCreate, TodoFilter, TodoItem, TodoUpdate
+from .output import write_rows
+
+DEFAULT_SHARDS = 4
+MANIFEST = "shards.json"
+ROUTES = ("id", "tenant")
+# Rows copied per statement by rebalance()
+REBALANCE_BATCH = 5000
+
+# Tenant mode: which tenant each todo belongs to
+TENANT_SQL = [
+    "CREATE TABLE IF NOT EXISTS todo_tenants (todo_id INTEGER PRIMARY KEY, tenant TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_todo_tenants_tenant ON todo_tenants (tenant, todo_id)",
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_tenants_ad AFTER DELETE ON todos BEGIN
+        DELETE FROM todo_tenants WHERE todo_id = OLD.pk;
+    END
+    """,
+]
+TENANT_CLAUSE = "pk IN (SELECT todo_id FROM todo_tenants WHERE tenant = ?)"
+
+COPY_SQL = (
+    f"INSERT INTO todos (pk, {storage.ITEM_SQL}, fingerprint) "
+    f"VALUES ({','.join('?' for _ in range(len(storage.COLUMNS) + 2))})"
+)
+
+# heapq.merge keys (used with reverse=True) matching storage.ORDERS. SQLite
+# sorts TEXT ids (legacy ones, see encoding.py) before BLOB ids.
+MERGE_KEYS = {
+    "created": lambda r: (r[6], r[0].__class__ is bytes, r[0]),
+    "priority": lambda r: (-r[5], r[6], r[0].__class__ is bytes, r[0]),
+}
+
+
+# A stable hash (unlike hash(), the same in every process)
+def shard_of(key: str, shards: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+class ShardedStore:
+    # shards and by are only used when the directory is new; after that the
+    # manifest decides, and rebalance() changes the shard count
+    def __init__(self, directory: str, shards: Optional[int] = None, by: str = "id",
+                 readers: int = DEFAULT_READERS, workers: Optional[int] = None):
+        self.directory = directory
+        self.readers = readers
+        self.workers = workers
+        manifest = self._read_manifest()
+        if manifest is None:
+            if by not in ROUTES:
+                raise ValueError(f"by must be one of {', '.join(ROUTES)}, not {by!r}")
+            manifest = {"shards": shards or DEFAULT_SHARDS, "by": by}
+            if manifest["shards"] < 1:
+                raise ValueError("A sharded store needs at least one shard")
+            os.makedirs(directory, exist_ok=True)
+            self._write_manifest(manifest)
+        elif shards is not None and shards != manifest["shards"]:
+            raise ValueError(f"{directory} has {manifest['shards']} shards, not {shards}; use rebalance() to change it")
+        self.shards = manifest["shards"]
+        self.by = manifest["by"]
+        self._pools = [self._open(i, self.shards) for i in range(self.shards)]
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _path(self, index: int, shards: int) -> str:
+        return os.path.join(self.directory, f"shard-{index:03d}-of-{shards:03d}.db")
+
+    def _open(self, index: int, shards: int) -> ConnectionPool:
+        return ConnectionPool(self._path(index, shards), readers=self.readers, pragmas=storage.PRAGMAS)
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # Written to a temporary file and renamed over the old one, so the
+    # manifest is always either the old or the new one
+    def _write_manifest(self, manifest: Dict):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    # Run fn(index) for every given shard on the thread pool; results in shard order
+    def _map(self, fn, indexes: List[int]) -> List:
+        if len(indexes) == 1:
+            return [fn(indexes[0])]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers or self.shards, thread_name_prefix="todo-shard")
+        return list(self._executor.map(fn, indexes))
+
+    def _check_tenant(self, tenant: Optional[str], write: bool = False):
+        if self.by == "id" and tenant is not None:
+            raise ValueError("This store is sharded by id; tenant is not used")
+        if self.by == "tenant" and write and tenant is None:
+            raise ValueError("This store is sharded by tenant; writes need a tenant")
+
+    # The shards a call has to look at
+    def _targets(self, tenant: Optional[str]) -> List[int]:
+        self._check_tenant(tenant)
+        if tenant is not None:
+            return [shard_of(tenant, self.shards)]
+        return list(range(self.shards))
+
+    def _extra(self, tenant: Optional[str]) -> Optional[Tuple[List[str], List]]:
+        return ([TENANT_CLAUSE], [tenant]) if tenant is not None else None
+
+    def init_db(self):
+        def init(i):
+            with self._pools[i].write() as conn:
+                migrate(conn)
+                if self.by == "tenant":
+                    for stmt in TENANT_SQL:
+                        conn.execute(stmt)
+        self._map(init, list(range(self.shards)))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        for pool in self._pools:
+            pool.close()
+
+    # Writes
+
+    def _insert(self, conn, sql: str, rows: List[Tuple], tenant: Optional[str]):
+        if tenant is None:
+            conn.executemany(sql, rows)
+            return
+        for row in rows:
+            pk = conn.execute(sql, row).lastrowid
+            conn.execute("INSERT INTO todo_tenants (todo_id, tenant) VALUES (?, ?)", (pk, tenant))
+
+    def _insert_rows(self, index: int, rows: List[Tuple], tenant: Optional[str]):
+        with self._pools[index].write() as conn:
+            self._insert(conn, storage.INSERT_SQL, rows, tenant)
+
+    def insert_todo(self, todo_create: TodoCreate, tenant: Optional[str] = None) -> TodoItem:
+        self._check_tenant(tenant, write=True)
+        row = storage._new_row(todo_create)
+        item = TodoItem.from_row(row)
+        self._insert_rows(shard_of(tenant if tenant is not None else item.id, self.shards), [row], tenant)
+        return item
+
+    # Rows for different shards are inserted in parallel, one transaction per shard
+    def insert_many(self, creates: Iterable[TodoCreate], tenant: Optional[str] = None) -> List[TodoItem]:
+        self._check_tenant(tenant, write=True)
+        rows = [storage._new_row(c) for c in creates]
+        items = storage._rows_to_items(rows)
+        groups: Dict[int, List[Tuple]] = {}
+        for row, item in zip(rows, items):
+            groups.setdefault(shard_of(tenant if tenant is not None else item.id, self.shards), []).append(row)
+        self._map(lambda i: self._insert_rows(i, groups[i], tenant), sorted(groups))
+        return items
+
+    # The shards that may hold `tid`
+    def _id_targets(self, tid: str, tenant: Optional[str]) -> List[int]:
+        if self.by == "id":
+            self._check_tenant(tenant)
+            return [shard_of(tid, self.shards)]
+        return self._targets(tenant)
+
+    # With a tenant, only that tenant's todo counts
+    def _owned(self, conn, tid: str, tenant: Optional[str]) -> bool:
+        if tenant is None:
+            return True
+        return conn.execute(
+            f"SELECT 1 FROM todos WHERE id = ? AND {TENANT_CLAUSE}", (encode_id(tid), tenant)
+        ).fetchone() is not None
+
+    def update_todo(self, tid: str, data: TodoUpdate, tenant: Optional[str] = None) -> Optional[TodoItem]:
+        def update(i):
+            with self._pools[i].write() as conn:
+                return storage._update_row(conn, tid, data) if self._owned(conn, tid, tenant) else None
+        rows = [row for row in self._map(update, self._id_targets(tid, tenant)) if row is not None]
+        return TodoItem.from_row(rows[0]) if rows else None
+
+    def delete_todo(self, tid: str, tenant: Optional[str] = None) -> bool:
+        def delete(i):
+            with self._pools[i].write() as conn:
+                if not self._owned(conn, tid, tenant):
+                    return False
+                key = encode_id(tid)
+                storage._record_deletes(conn, "id = ?", (key,))
+                return conn.execute("DELETE FROM todos WHERE id = ?", (key,)).rowcount > 0
+        return any(self._map(delete, self._id_targets(tid, tenant)))
+
+    # Reads
+
+    def get_by_id(self, tid: str, tenant: Optional[str] = None) -> Optional[TodoItem]:
+        extra = self._extra(tenant)
+        sql = f"SELECT {storage.ITEM_SQL} FROM todos WHERE id = ?" + (f" AND {TENANT_CLAUSE}" if extra else "")
+        params = (encode_id(tid), tenant) if extra else (encode_id(tid),)
+
+        def get(i):
+            with self._pools[i].read() as conn:
+                return storage._fetch(conn, sql, params).fetchone()
+        rows = [row for row in self._map(get, self._id_targets(tid, tenant)) if row is not None]
+        return TodoItem.from_row(rows[0]) if rows else None
+
+    def _rows(self, index: int, order: str, where: TodoFilter, after: Optional[Tuple], limit: Optional[int],
+              tenant: Optional[str]) -> List[Tuple]:
+        with self._pools[index].read() as conn:
+            sql, params = storage._select_page(conn, order, where, after, limit, self._extra(tenant))
+            return storage._fetch(conn, sql, params).fetchall()
+
+    # The first `limit` rows (all with None) of every target shard, merged
+    def _merged(self, order: str, where: TodoFilter, after: Optional[Tuple], limit: Optional[int],
+                tenant: Optional[str]) -> Iterator[Tuple]:
+        results = self._map(lambda i: self._rows(i, order, where, after, limit, tenant), self._targets(tenant))
+        return heapq.merge(*results, key=MERGE_KEYS[order], reverse=True)
+
+    # Keep reading pages of one shard after its first one, as the merge consumes them
+    def _shard_pages(self, index: int, order: str, where: TodoFilter, page_size: int, tenant: Optional[str],
+                     rows: List[Tuple]) -> Iterator[Tuple]:
+        key_columns = [storage.COLUMNS.index(c) for c in storage.ORDERS[order][0]]
+        while True:
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after = tuple(rows[-1][i] for i in key_columns)
+            rows = self._rows(index, order, where, after, page_size, tenant)
+
+    # Same arguments as storage.iter_todo_rows, plus tenant. The first page of
+    # every shard is read in parallel; later pages as the merge needs them.
+    def iter_todo_rows(self, status: Optional[str] = None, priority: Optional[int] = None,
+                       title: Optional[str] = None, order: str = "created", after: Optional[str] = None,
+                       limit: Optional[int] = None, page_size: int = storage.PAGE_SIZE,
+                       where: Optional[TodoFilter] = None, tenant: Optional[str] = None) -> Iterator[List[Tuple]]:
+        where = storage._page_filter(status, priority, title, where)
+        key = storage.decode_cursor(after, order) if after else None
+        targets = self._targets(tenant)
+        first = self._map(lambda i: self._rows(i, order, where, key, page_size, tenant), targets)
+        shards = [self._shard_pages(i, order, where, page_size, tenant, rows) for i, rows in zip(targets, first)]
+        rows = islice(heapq.merge(*shards, key=MERGE_KEYS[order], reverse=True), limit)
+        while True:
+            page = list(islice(rows, page_size))
+            if not page:
+                return
+            yield page
+
+    def iter_todos(self, status: Optional[str] = None, priority: Optional[int] = None, title: Optional[str] = None,
+                   order: str = "created", after: Optional[str] = None, limit: Optional[int] = None,
+                   page_size: int = storage.PAGE_SIZE, where: Optional[TodoFilter] = None,
+                   tenant: Optional[str] = None) -> Iterator[TodoItem]:
+        for rows in self.iter_todo_rows(status, priority, title, order, after, limit, page_size, where, tenant):
+            yield from storage._rows_to_items(rows)
+
+    def get_page(self, status: Optional[str] = None, priority: Optional[int] = None, title: Optional[str] = None,
+                 order: str = "created", after: Optional[str] = None, limit: int = storage.PAGE_SIZE,
+                 where: Optional[TodoFilter] = None,
+                 tenant: Optional[str] = None) -> Tuple[List[TodoItem], Optional[str]]:
+        if limit < 1:
+            raise ValueError(f"A page needs a limit of at least 1, not {limit}")
+        key = storage.decode_cursor(after, order) if after else None
+        where = storage._page_filter(status, priority, title, where)
+        rows = list(islice(self._merged(order, where, key, limit + 1, tenant), limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            key_columns = [storage.COLUMNS.index(c) for c in storage.ORDERS[order][0]]
+            next_cursor = storage.encode_cursor(tuple(rows[-1][i] for i in key_columns))
+        return storage._rows_to_items(rows), next_cursor
+
+    def query(self, order: str = "created", limit: Optional[int] = None, after: Optional[str] = None,
+              where: Optional[TodoFilter] = None, tenant: Optional[str] = None, **filters) -> List[TodoItem]:
+        where = where if where is not None else TodoFilter(**filters)
+        key = storage.decode_cursor(after, order) if after else None
+        return storage._rows_to_items(islice(self._merged(order, where, key, limit, tenant), limit))
+
+    def get_all(self, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(tenant=tenant)
+
+    def get_by_status(self, status: str, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(status=status, tenant=tenant)
+
+    def get_by_priority(self, priority: int, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(priority=priority, tenant=tenant)
+
+    def get_all_sorted_by_priority(self, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(order="priority", tenant=tenant)
+
+    def search_by_title(self, substr: str, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(title=substr, tenant=tenant)
+
+    def search_by_tag(self, tag: str, tenant: Optional[str] = None) -> List[TodoItem]:
+        return self.query(tag=tag, tenant=tenant)
+
+    def list_tags(self, tenant: Optional[str] = None) -> List[str]:
+        def tags(i):
+            with self._pools[i].read() as conn:
+                if tenant is None:
+                    return [r[0] for r in conn.execute("SELECT DISTINCT tag FROM todo_tags")]
+                return [r[0] for r in conn.execute(
+                    "SELECT DISTINCT g.tag FROM todo_tags g JOIN todo_tenants n ON n.todo_id = g.todo_id "
+                    "WHERE n.tenant = ?", (tenant,))]
+        return sorted(set().union(*self._map(tags, self._targets(tenant))))
+
+    # storage.stats() summed over the shards
+    def stats(self) -> Dict:
+        result: Dict = {"total": 0, "status": {}, "priority": {}, "tags": {}}
+
+        def counters(i):
+            with self._pools[i].read() as conn:
+                return storage._fetch(conn, "SELECT kind, key, count FROM todo_counters WHERE count > 0").fetchall()
+        for rows in self._map(counters, list(range(self.shards))):
+            for kind, key, count in rows:
+                if kind == "total":
+                    result["total"] += count
+                    continue
+                counts = result["tags" if kind == "tag" else kind]
+                key = int(key) if kind == "priority" else key
+                counts[key] = counts.get(key, 0) + count
+        return result
+
+    # Export and import
+
+    # Write every todo (or every todo of `tenant`) to `filepath` in the layout
+    # of storage's json, ndjson and csv exports; returns the number written.
+    # Each shard is read in its own snapshots, so the export is not one
+    # snapshot of the whole store.
+    def export_todos(self, filepath: str, fmt: str, tenant: Optional[str] = None,
+                     batch_size: int = storage.EXPORT_BATCH_SIZE) -> int:
+        if fmt not in ("json", "ndjson", "csv"):
+            raise ValueError(f"Export supports json, ndjson and csv, not {fmt}")
+        with open(filepath, 'w', encoding='utf-8', newline='' if fmt == "csv" else None) as f:
+            return write_rows(f, fmt, self.iter_todo_rows(page_size=batch_size, tenant=tenant))
+
+    def import_file(self, filepath: str, fmt: str, **kwargs) -> ImportResult:
+        with open(filepath, 'r', encoding='utf-8', newline='' if fmt == "csv" else None) as f:
+            return self.import_records(importer.READERS[fmt](f), **kwargs)
+
+    # importer.import_records for the store. Records whose id exists are
+    # skipped, and duplicates (see importer._write_batch) are looked for in
+    # every shard the store's reads would search. Every batch is checked
+    # against all of them in parallel and then commits shard by shard.
+    def import_records(self, records: Iterable[Dict], batch_size: int = importer.IMPORT_BATCH_SIZE,
+                       on_duplicate: str = "skip", tenant: Optional[str] = None) -> ImportResult:
+        importer._check_on_duplicate(on_duplicate)
+        self._check_tenant(tenant, write=True)
+        result = ImportResult()
+        started = time.perf_counter()
+        targets = self._targets(tenant)
+        for batch in importer._batches(records, batch_size):
+            rows = importer._import_rows(batch, result)
+            ids = [rid for rid, _, _ in rows if rid]
+            fingerprints = list({fp for _, _, fp in rows}) if on_duplicate != "keep" else []
+            found = self._map(lambda i: self._import_lookup(i, ids, fingerprints, tenant), targets)
+            existing = set().union(*(shard_ids for shard_ids, _ in found))
+            # fingerprint -> (shard, stored id) of the todo it duplicates
+            matches: Dict[str, Tuple[int, object]] = {}
+            for i, (_, shard_matches) in zip(targets, found):
+                for fp, tid in shard_matches:
+                    matches.setdefault(fp, (i, tid))
+            inserts: Dict[int, List[Tuple]] = {}
+            updates: Dict[int, List[Tuple]] = {}
+            for rid, params, fp in rows:
+                if rid and rid in existing:
+                    result.skipped += 1
+                    continue
+                match = matches.get(fp) if on_duplicate != "keep" else None
+                if match is None:
+                    i = shard_of(tenant if tenant is not None else decode_id(params[0]), self.shards)
+                    inserts.setdefault(i, []).append((*params, fp))
+                    matches[fp] = (i, params[0])
+                    result.inserted += 1
+                    continue
+                result.duplicates += 1
+                if on_duplicate == "update":
+                    updates.setdefault(match[0], []).append(
+                        (params[1], params[2], params[3], params[5], params[7], match[1]))
+                    result.updated += 1
+                else:
+                    result.skipped += 1
+            self._map(lambda i: self._import_write(i, inserts.get(i, []), updates.get(i, []), tenant),
+                      sorted(set(inserts) | set(updates)))
+        result.seconds = time.perf_counter() - started
+        return result
+
+    # (ids that exist, [(fingerprint, stored id)] of todos with one of
+    # `fingerprints`) in one shard, only counting `tenant`'s todos if given
+    def _import_lookup(self, index: int, ids: List[str], fingerprints: List[str],
+                       tenant: Optional[str]) -> Tuple[set, List[Tuple]]:
+        clause, extra = (f" AND {TENANT_CLAUSE}", [tenant]) if tenant is not None else ("", [])
+        found, matches = set(), []
+        with self._pools[index].write() as conn:
+            if ids:
+                qmarks = ','.join('?' for _ in ids)
+                found = {decode_id(r[0]) for r in storage._fetch(
+                    conn, f"SELECT id FROM todos WHERE id IN ({qmarks}){clause}",
+                    [encode_id(tid) for tid in ids] + extra)}
+            if fingerprints:
+                importer._fill_fingerprints(conn)
+                qmarks = ','.join('?' for _ in fingerprints)
+                matches = storage._fetch(
+                    conn, f"SELECT fingerprint, id FROM todos WHERE fingerprint IN ({qmarks}){clause}",
+                    fingerprints + extra).fetchall()
+        return found, matches
+
+    # Inserts first, so a duplicate within the batch updates the row just added
+    def _import_write(self, index: int, inserts: List[Tuple], updates: List[Tuple], tenant: Optional[str]):
+        with self._pools[index].write() as conn:
+            self._insert(conn, importer.IMPORT_INSERT_SQL, inserts, tenant)
+            conn.executemany(importer.DUPLICATE_UPDATE_SQL, updates)
+
+    # Todos per shard, in shard order
+    def shard_counts(self) -> List[int]:
+        def count(i):
+            with self._pools[i].read() as conn:
+                row = conn.execute("SELECT count FROM todo_counters WHERE kind = 'total'").fetchone()
+                return row[0] if row else 0
+        return self._map(count, list(range(self.shards)))
+
+    # Rebalancing
+
+    # Move every todo (and tombstone) into `shards` new shard files and
+    # return the number of todos copied. The old shards stay locked for
+    # writing until the new ones are complete and the manifest names them, and
+    # a failure before that leaves the store as it was. Other processes and
+    # threads must not use the store meanwhile: they would still route by the
+    # old shard count.
+    def rebalance(self, shards: int) -> int:
+        if shards < 1:
+            raise ValueError("A sharded store needs at least one shard")
+        if shards == self.shards:
+            return 0
+        self._remove_files(keep=self.shards)
+        new = [ConnectionPool(self._path(i, shards), readers=self.readers, pragmas=storage.PRAGMAS)
+               for i in range(shards)]
+        copied = 0
+        try:
+            with ExitStack() as locks:
+                sources = [locks.enter_context(pool.write()) for pool in self._pools]
+                with ExitStack() as writes:
+                    targets = [writes.enter_context(pool.write()) for pool in new]
+                    for conn in targets:
+                        migrate(conn)
+                        if self.by == "tenant":
+                            for stmt in TENANT_SQL:
+                                conn.execute(stmt)
+                    next_pk = [1] * shards
+                    for conn in sources:
+                        copied += self._copy_shard(conn, targets, next_pk)
+                self._write_manifest({"shards": shards, "by": self.by})
+        except BaseException:
+            for pool in new:
+                pool.close()
+            self._remove_files(keep=self.shards)
+            raise
+        old, self._pools, self.shards = self._pools, new, shards
+        for pool in old:
+            pool.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._remove_files(keep=shards)
+        return copied
+
+    def _copy_shard(self, source, targets: List, next_pk: List[int]) -> int:
+        shards = len(targets)
+        tenant_sql = "n.tenant" if self.by == "tenant" else "NULL"
+        tenant_join = "LEFT JOIN todo_tenants n ON n.todo_id = t.pk" if self.by == "tenant" else ""
+        sql = (f"SELECT t.pk, {storage.T_ITEM_SQL}, t.fingerprint, {tenant_sql} FROM todos t {tenant_join} "
+               f"WHERE t.pk > ? ORDER BY t.pk LIMIT ?")
+        copied, last = 0, 0
+        while True:
+            rows = storage._fetch(source, sql, (last, REBALANCE_BATCH)).fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            groups: Dict[int, List[Tuple]] = {}
+            tenants: Dict[int, List[Tuple]] = {}
+            for row in rows:
+                tenant = row[-1]
+                i = shard_of(tenant if tenant is not None else decode_id(row[1]), shards)
+                pk = next_pk[i]
+                next_pk[i] = pk + 1
+                groups.setdefault(i, []).append((pk, *row[1:-1]))
+                if tenant is not None:
+                    tenants.setdefault(i, []).append((pk, tenant))
+            for i, group in groups.items():
+                targets[i].executemany(COPY_SQL, group)
+            for i, group in tenants.items():
+                targets[i].executemany("INSERT INTO todo_tenants (todo_id, tenant) VALUES (?, ?)", group)
+            copied += len(rows)
+        # Tombstones go by id in both modes; they only matter to delta exports
+        for tid, deleted_at in storage._fetch(source, "SELECT id, deleted_at FROM todo_tombstones"):
+            targets[shard_of(decode_id(tid), shards)].execute(
+                "INSERT OR REPLACE INTO todo_tombstones (id, deleted_at) VALUES (?, ?)", (tid, deleted_at))
+        return copied
+
+    # Delete shard files (and their WAL side files) of every shard count but `keep`
+    def _remove_files(self, keep: int):
+        suffix = f"-of-{keep:03d}.db"
+        for name in os.listdir(self.directory):
+            base = name[:-4] if name.endswith(("-wal", "-shm")) else name
+            if base.startswith("shard-") and base.endswith(".db") and not base.endswith(suffix):
+                os.remove(os.path.join(self.directory, name))
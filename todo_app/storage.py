@@ -1,289 +1,989 @@
-from typing import List, Optional, Dict
-from todo_app.models import TodoItem, TodoCreate, TodoUpdate, TodoStatus
-# Get todos by priority
+# todo_app/storage.py
+import base64
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-def get_by_id(tid: str) -> Optional[TodoItem]:
-    conn = _conn()
-    row = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    conn.close()
-    if row:
-        return _row_to_item(row)
-    return None
+from .cache import LRUCache
+from .connection import ConnectionPool, DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_ROWS, DEFAULT_READERS, MemoryPool
+from .encoding import decode_id, decode_row, encode_id, encode_time, now as _now, time_text
+from .migrations import COUNTERS_RECOMPUTE_SQL, LATEST_VERSION, create_search_index, get_version, migrate
+from .models import TodoItem, TodoCreate, TodoFilter, TodoUpdate, TodoStatus
 
-def get_by_priority(priority: int) -> List[TodoItem]:
-    conn = _conn()
-    rows = conn.execute("SELECT * FROM todos WHERE priority = ? ORDER BY created_at DESC", (priority,)).fetchall()
-    conn.close()
-    return [_row_to_item(r) for r in rows]
+DB_PATH = "todos.db"
 
-# Get all todos sorted by priority (HIGH > MEDIUM > LOW)
-def get_all_sorted_by_priority() -> List[TodoItem]:
-    conn = _conn()
-    rows = conn.execute(
-        "SELECT * FROM todos ORDER BY priority ASC, created_at DESC"
-    ).fetchall()
-    conn.close()
-    return [_row_to_item(r) for r in rows]
-# Bulk update status for multiple todos
-def bulk_update_status(ids: List[str], status: str) -> int:
-    conn = _conn()
-    updated_at = datetime.utcnow().isoformat()
-    qmarks = ','.join('?' for _ in ids)
-    sql = f"UPDATE todos SET status=?, updated_at=? WHERE id IN ({qmarks})"
-    cur = conn.execute(sql, (status, updated_at, *ids))
-    conn.commit()
-    count = cur.rowcount
-    conn.close()
-    return count
+# Connection pool settings; change them through configure().
+POOL_READERS = DEFAULT_READERS
+PRAGMAS: Dict[str, object] = {}
+# "disk" works on DB_PATH directly; "memory" works on an in-memory copy that
+# is written back to DB_PATH every FLUSH_INTERVAL seconds, after FLUSH_ROWS
+# changed rows and on close (see connection.MemoryPool)
+ENGINES = ("disk", "memory")
+ENGINE = "disk"
+FLUSH_INTERVAL: Optional[float] = DEFAULT_FLUSH_INTERVAL
+FLUSH_ROWS: Optional[int] = DEFAULT_FLUSH_ROWS
 
-# Bulk delete todos by IDs
-def bulk_delete(ids: List[str]) -> int:
-    conn = _conn()
-    qmarks = ','.join('?' for _ in ids)
-    sql = f"DELETE FROM todos WHERE id IN ({qmarks})"
-    cur = conn.execute(sql, (*ids,))
-    conn.commit()
-    count = cur.rowcount
-    conn.close()
-    return count
+# Class of the pool's connections; enable_metrics() swaps in an instrumented one
+CONNECTION_FACTORY = sqlite3.Connection
 
-# Bulk update priority for multiple todos
-def bulk_update_priority(ids: List[str], priority: int) -> int:
-    conn = _conn()
-    updated_at = datetime.utcnow().isoformat()
-    qmarks = ','.join('?' for _ in ids)
-    sql = f"UPDATE todos SET priority=?, updated_at=? WHERE id IN ({qmarks})"
-    cur = conn.execute(sql, (priority, updated_at, *ids))
-    conn.commit()
-    count = cur.rowcount
-    conn.close()
-    return count
-from typing import List, Optional, Dict
-from todo_app.models import TodoItem, TodoCreate, TodoUpdate, TodoStatus
+# get_by_id read-through cache; change it through configure_cache(). In safe
+# mode every lookup first checks PRAGMA data_version and drops the whole cache
+# when another process has written to the database.
+CACHE_SIZE = 10000
+CACHE_TTL: Optional[float] = None
+CACHE_SAFE = True
 
-def get_by_id(tid: str) -> Optional[TodoItem]:
-    conn = _conn()
-    row = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    conn.close()
-    if row:
-        return _row_to_item(row)
-    return None
-# List all unique tags
-def list_tags() -> List[str]:
-    conn = _conn()
-    rows = conn.execute("SELECT tags FROM todos").fetchall()
-    conn.close()
-    tag_set = set()
-    for r in rows:
-        tags = json.loads(r["tags"] or "[]")
-        tag_set.update(tags)
-    return sorted(tag_set)
+_item_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+_cache_data_version: Optional[int] = None
 
-# Rename a tag in all todos
-def rename_tag(old_tag: str, new_tag: str) -> int:
-    conn = _conn()
-    rows = conn.execute("SELECT id, tags FROM todos").fetchall()
-    count = 0
-    for r in rows:
-        tags = json.loads(r["tags"] or "[]")
-        if old_tag in tags:
-            tags = [new_tag if t == old_tag else t for t in tags]
-            conn.execute("UPDATE todos SET tags=? WHERE id=?", (json.dumps(tags), r["id"]))
-            count += 1
-    conn.commit()
-    conn.close()
-    return count
+_pool_instance: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
 
-# Delete a tag from all todos
-def delete_tag_from_all(tag: str) -> int:
-    conn = _conn()
-    rows = conn.execute("SELECT id, tags FROM todos").fetchall()
-    count = 0
-    for r in rows:
-        tags = json.loads(r["tags"] or "[]")
-        if tag in tags:
-            tags = [t for t in tags if t != tag]
-            conn.execute("UPDATE todos SET tags=? WHERE id=?", (json.dumps(tags), r["id"]))
-            count += 1
-    conn.commit()
-    conn.close()
-    return count
-import csv
-# Export todos to JSON file
-def export_todos_json(filepath: str):
-    todos = get_all()
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump([todo.__dict__ for todo in todos], f, default=str, indent=2)
 
-# Import todos from JSON file
-def import_todos_json(filepath: str):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    for item in data:
-        # Avoid duplicate IDs
-        if 'id' in item:
-            existing = get_by_id(item['id']) if 'get_by_id' in globals() else None
-            if existing:
-                continue
-        todo = TodoCreate(
-            title=item['title'],
-            description=item.get('description'),
-            tags=item.get('tags', []),
-            priority=int(item.get('priority', 3))
-        )
-        insert_todo(todo)
+# Bring a database up to date the first time it is opened, so one created by
+# an older version works without running init-db first. Costs one PRAGMA
+# when it is already current.
+def _migrate_on_open(pool: ConnectionPool):
+    with pool.read() as conn:
+        version = get_version(conn)
+    if version != LATEST_VERSION:
+        with pool.write() as conn:
+            migrate(conn)
 
-# Export todos to CSV file
-def export_todos_csv(filepath: str):
-    todos = get_all()
-    with open(filepath, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['id', 'title', 'description', 'tags', 'status', 'priority', 'created_at', 'updated_at'])
-        for t in todos:
-            writer.writerow([
-                t.id, t.title, t.description, json.dumps(t.tags), t.status, t.priority, t.created_at, t.updated_at
-            ])
+# Return the shared pool for the current DB_PATH, replacing it if DB_PATH changed
+def _pool() -> ConnectionPool:
+    global _pool_instance
+    pool = _pool_instance
+    if pool is None or pool.path != DB_PATH:
+        with _pool_lock:
+            pool = _pool_instance
+            if pool is None or pool.path != DB_PATH:
+                if pool is not None:
+                    pool.close()
+                _item_cache.clear()
+                if ENGINE == "memory":
+                    pool = MemoryPool(DB_PATH, flush_interval=FLUSH_INTERVAL, flush_rows=FLUSH_ROWS,
+                                      pragmas=PRAGMAS, factory=CONNECTION_FACTORY)
+                else:
+                    pool = ConnectionPool(DB_PATH, readers=POOL_READERS, pragmas=PRAGMAS, factory=CONNECTION_FACTORY)
+                _pool_instance = None
+                try:
+                    _migrate_on_open(pool)
+                except BaseException:
+                    pool.close()
+                    raise
+                _pool_instance = pool
+    return pool
 
-# Import todos from CSV file
-def import_todos_csv(filepath: str):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            todo = TodoCreate(
-                title=row['title'],
-                description=row.get('description'),
-                tags=json.loads(row['tags']) if row.get('tags') else [],
-                priority=int(row.get('priority', 3))
-            )
-            insert_todo(todo)
+def _read():
+    return _pool().read()
 
-# todo_app/storage.py
-import sqlite3
-from typing import Optional, List, Dict
-import json
-from datetime import datetime
-from .models import TodoItem, TodoCreate, TodoUpdate, TodoStatus
-import uuid
+# Group several storage calls into one transaction; nested calls become savepoints
+def transaction():
+    return _pool().write()
 
-DB_PATH = "todos.db"
+# flush_interval and flush_rows only apply to the memory engine; pass
+# flush_interval=0 to flush on the row threshold and on close only
+def configure(readers: Optional[int] = None, pragmas: Optional[Dict[str, object]] = None,
+              engine: Optional[str] = None, flush_interval: Optional[float] = None,
+              flush_rows: Optional[int] = None):
+    global POOL_READERS, PRAGMAS, ENGINE, FLUSH_INTERVAL, FLUSH_ROWS
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}, not {engine!r}")
+    close_pool()
+    if readers is not None:
+        POOL_READERS = readers
+    if pragmas is not None:
+        PRAGMAS = dict(pragmas)
+    if engine is not None:
+        ENGINE = engine
+    if flush_interval is not None:
+        FLUSH_INTERVAL = flush_interval or None
+    if flush_rows is not None:
+        FLUSH_ROWS = flush_rows
+
+# Memory engine: write the database to DB_PATH now instead of at the next
+# scheduled flush. Returns False if there was nothing to write (and always
+# with the disk engine, where every commit is already on disk).
+def flush() -> bool:
+    pool = _pool()
+    return pool.flush() if isinstance(pool, MemoryPool) else False
+
+def close_pool():
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is not None:
+            _pool_instance.close()
+            _pool_instance = None
+        _item_cache.clear()
+
+# maxsize=0 disables the cache; ttl=None keeps entries until evicted
+def configure_cache(maxsize: Optional[int] = None, ttl: Optional[float] = -1, safe: Optional[bool] = None):
+    global CACHE_SIZE, CACHE_TTL, CACHE_SAFE, _item_cache
+    if maxsize is not None:
+        CACHE_SIZE = maxsize
+    if ttl != -1:
+        CACHE_TTL = ttl
+    if safe is not None:
+        CACHE_SAFE = safe
+    _item_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+
+def cache_stats() -> Dict[str, int]:
+    return _item_cache.stats()
+
+# Opt-in instrumentation (see instrument.py): call counts, latency
+# percentiles and rows for every public function and SQL statement,
+# connection counts, and statements slower than slow_query_ms logged with
+# their query plan. Turning it on or off reopens the pool's connections, so
+# do it outside a transaction.
+def enable_metrics(slow_query_ms: Optional[float] = None):
+    from . import instrument
+    instrument.enable(sys.modules[__name__], slow_query_ms)
+
+def disable_metrics():
+    from . import instrument
+    instrument.disable(sys.modules[__name__])
 
-CREATE_SQL = """
-CREATE TABLE IF NOT EXISTS todos (
-    id TEXT PRIMARY KEY,
-    title TEXT NOT NULL,
-    description TEXT,
-    tags TEXT,
-    status TEXT NOT NULL,
-    priority INTEGER NOT NULL DEFAULT 3,
-    created_at TEXT NOT NULL,
-    updated_at TEXT NOT NULL
-);
-"""
-
-def _conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def reset_metrics():
+    from . import instrument
+    instrument.reset()
 
+# {"enabled", "functions": {name: stats}, "queries": {sql: stats},
+#  "connections", "slow_queries", "slow_queries_total"}, where stats has
+# calls, errors, rows, total_ms, p50_ms, p95_ms, p99_ms and max_ms
+def metrics() -> Dict:
+    from . import instrument
+    return instrument.snapshot()
+
+# The same metrics in the Prometheus text format
+def metrics_prometheus() -> str:
+    from . import instrument
+    return instrument.prometheus()
+
+# Drop cached items once the current transaction commits; ids=None drops all
+def _invalidate(ids: Optional[List[str]] = None):
+    cache = _item_cache
+    if ids is None or len(ids) > cache.maxsize:
+        _pool().call_after_commit(cache.clear)
+    else:
+        _pool().call_after_commit(lambda: cache.invalidate(ids))
+
+# Temporarily override PRAGMAs on the writer connection, e.g. synchronous=OFF
+# for a bulk load
+@contextmanager
+def pragma_override(**pragmas):
+    pool = _pool()
+    previous = {name: pool.set_pragma(name, value) for name, value in pragmas.items()}
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            pool.set_pragma(name, value)
+
+# Delete the database file along with its WAL side files
+def remove_db():
+    close_pool()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+
+# Create the database if needed and bring its schema up to date
 def init_db():
-    conn = _conn()
-    conn.execute(CREATE_SQL)
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        migrate(conn)
 
+# Columns in the order TodoItem.from_row expects. Ids, created_at and
+# updated_at are stored encoded (see encoding.py); rows read with ITEM_SQL
+# hold the stored values.
+COLUMNS = ['id', 'title', 'description', 'tags', 'status', 'priority', 'created_at', 'updated_at']
+ITEM_SQL = ", ".join(COLUMNS)
+T_ITEM_SQL = ", ".join(f"t.{c}" for c in COLUMNS)
+
+# Run a query on a cursor that yields plain tuples instead of sqlite3.Row
+def _fetch(conn, sql: str, params=()):
+    cur = conn.cursor()
+    cur.row_factory = None
+    return cur.execute(sql, params)
+
+# Rows are decoded lazily by TodoItem (see models.py)
 def _row_to_item(row) -> TodoItem:
-    return TodoItem(
-        id=row["id"],
-        title=row["title"],
-        description=row["description"],
-        tags=json.loads(row["tags"]) if row["tags"] else [],
-        status=row["status"],
-        priority=int(row["priority"]) if "priority" in row.keys() else 3,
-        created_at=datetime.fromisoformat(row["created_at"]),
-        updated_at=datetime.fromisoformat(row["updated_at"])
+    return TodoItem.from_row(row)
+
+def _rows_to_items(rows) -> List[TodoItem]:
+    return list(map(TodoItem.from_row, rows))
+
+INSERT_SQL = f"INSERT INTO todos ({ITEM_SQL}) VALUES ({','.join('?' for _ in COLUMNS)})"
+
+# UPDATE ... RETURNING needs SQLite 3.35+
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# INSERT parameters for a new todo; they double as the row of the returned item
+def _new_row(todo_create: TodoCreate) -> Tuple:
+    now = _now()
+    return (
+        uuid.uuid4().bytes, todo_create.title, todo_create.description, json.dumps(todo_create.tags or []),
+        TodoStatus.TODO.value, int(todo_create.priority), now, now
     )
 
 def insert_todo(todo_create: TodoCreate) -> TodoItem:
-    conn = _conn()
-    now = datetime.utcnow().isoformat()
-    tid = str(uuid.uuid4())
-    tags_json = json.dumps(todo_create.tags or [])
-    conn.execute(
-        "INSERT INTO todos (id,title,description,tags,status,priority,created_at,updated_at) VALUES (?,?,?,?,?,?,?,?)",
-        (tid, todo_create.title, todo_create.description, tags_json, TodoStatus.TODO, int(todo_create.priority), now, now)
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    conn.close()
+    row = _new_row(todo_create)
+    with transaction() as conn:
+        conn.execute(INSERT_SQL, row)
     return _row_to_item(row)
 
+# Insert many todos in one transaction
+def insert_many(creates: Iterable[TodoCreate]) -> List[TodoItem]:
+    rows = [_new_row(c) for c in creates]
+    with transaction() as conn:
+        conn.executemany(INSERT_SQL, rows)
+    return _rows_to_items(rows)
 
 def get_all() -> List[TodoItem]:
-    conn = _conn()
-    rows = conn.execute("SELECT * FROM todos ORDER BY created_at DESC").fetchall()
-    conn.close()
-    return [_row_to_item(r) for r in rows]
+    with _read() as conn:
+        rows = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos ORDER BY created_at DESC, id DESC").fetchall()
+    return _rows_to_items(rows)
 
-def get_by_id(tid: str) -> Optional[TodoItem]:
-    conn = _conn()
-    row = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    conn.close()
+def _load_by_id(tid: str) -> Optional[TodoItem]:
+    with _read() as conn:
+        row = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos WHERE id = ?", (encode_id(tid),)).fetchone()
     if row:
         return _row_to_item(row)
     return None
 
+def get_by_id(tid: str) -> Optional[TodoItem]:
+    global _cache_data_version
+    pool = _pool()
+    cache = _item_cache
+    # Inside a transaction the thread may see uncommitted rows, which must
+    # not end up in the cache
+    if cache.maxsize <= 0 or pool.in_transaction():
+        return _load_by_id(tid)
+    if CACHE_SAFE:
+        version = pool.data_version()
+        if version is None:
+            return _load_by_id(tid)
+        if version != _cache_data_version:
+            cache.clear()
+            _cache_data_version = version
+    item = cache.get(tid)
+    if item is None:
+        epoch = cache.epoch
+        item = _load_by_id(tid)
+        if item is None:
+            return None
+        cache.put(tid, item, epoch)
+    return item.copy()
+
 def get_by_status(status: str):
-    conn = _conn()
-    rows = conn.execute("SELECT * FROM todos WHERE status = ? ORDER BY created_at DESC", (status,)).fetchall()
-    conn.close()
-    return [_row_to_item(r) for r in rows]
+    with _read() as conn:
+        rows = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos WHERE status = ? ORDER BY created_at DESC, id DESC", (status,)).fetchall()
+    return _rows_to_items(rows)
+
+# Get todos by priority
+def get_by_priority(priority: int) -> List[TodoItem]:
+    with _read() as conn:
+        rows = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos WHERE priority = ? ORDER BY created_at DESC, id DESC", (priority,)).fetchall()
+    return _rows_to_items(rows)
+
+# Get all todos sorted by priority (1 = highest first)
+def get_all_sorted_by_priority() -> List[TodoItem]:
+    with _read() as conn:
+        rows = _fetch(
+            conn, f"SELECT {ITEM_SQL} FROM todos ORDER BY priority ASC, created_at DESC, id DESC"
+        ).fetchall()
+    return _rows_to_items(rows)
 
 def search_by_title(substr: str):
-    conn = _conn()
     like = f"%{substr}%"
-    rows = conn.execute("SELECT * FROM todos WHERE title LIKE ? ORDER BY created_at DESC", (like,)).fetchall()
-    conn.close()
-    return [_row_to_item(r) for r in rows]
+    with _read() as conn:
+        rows = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos WHERE title LIKE ? ORDER BY created_at DESC, id DESC", (like,)).fetchall()
+    return _rows_to_items(rows)
 
 def search_by_tag(tag: str):
-    conn = _conn()
-    rows = conn.execute("SELECT * FROM todos").fetchall()
-    conn.close()
-    result = []
-    for r in rows:
-        tags = json.loads(r["tags"] or "[]")
-        if tag in tags:
-            result.append(_row_to_item(r))
-    return result
+    with _read() as conn:
+        rows = _fetch(
+            conn,
+            f"SELECT {T_ITEM_SQL} FROM todo_tags g JOIN todos t ON t.pk = g.todo_id WHERE g.tag = ? ORDER BY t.created_at DESC, t.id DESC",
+            (tag,)
+        ).fetchall()
+    return _rows_to_items(rows)
 
-def update_todo(tid: str, data: TodoUpdate) -> Optional[TodoItem]:
-    conn = _conn()
-    row = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    if not row:
-        conn.close()
+_SEARCH_TOKEN = re.compile(r'"[^"]*"|\S+')
+
+# Turn free text into a safe FTS5 query: each word must match, "quoted words"
+# match as a phrase, word* matches as a prefix and OR between words is kept
+def _fts_query(text: str) -> str:
+    parts = []
+    for token in _SEARCH_TOKEN.findall(text):
+        if token == "OR":
+            parts.append(token)
+            continue
+        prefix = token.endswith("*")
+        word = token.rstrip("*").replace('"', "")
+        if word:
+            parts.append(f'"{word}"' + ("*" if prefix else ""))
+    if parts and parts[0] == "OR":
+        parts.pop(0)
+    if parts and parts[-1] == "OR":
+        parts.pop()
+    return " ".join(parts)
+
+def _has_search_index(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'todos_fts'").fetchone() is not None
+
+# Full-text search over title and description, best matches (BM25, title
+# weighted above description) first. Without FTS5 every word has to appear
+# in the title or description and results come back newest first.
+def search_text(query: str, limit: int = 50) -> List[TodoItem]:
+    match = _fts_query(query)
+    if not match:
+        return []
+    with _read() as conn:
+        if _has_search_index(conn):
+            rows = _fetch(
+                conn,
+                f"""
+                SELECT {T_ITEM_SQL} FROM todos_fts f JOIN todos t ON t.rowid = f.rowid
+                WHERE todos_fts MATCH ? ORDER BY bm25(todos_fts, 10.0, 1.0) LIMIT ?
+                """,
+                (match, limit)
+            ).fetchall()
+        else:
+            words = [w.replace('"', "").rstrip("*") for w in _SEARCH_TOKEN.findall(query) if w != "OR"]
+            words = [w for w in words if w]
+            clauses = " AND ".join("(title LIKE ? OR description LIKE ?)" for _ in words)
+            params = [p for w in words for p in (f"%{w}%", f"%{w}%")]
+            rows = _fetch(
+                conn,
+                f"SELECT {ITEM_SQL} FROM todos WHERE {clauses} ORDER BY created_at DESC, id DESC LIMIT ?",
+                (*params, limit)
+            ).fetchall()
+    return _rows_to_items(rows)
+
+# Recreate the full-text index from the todos table (e.g. after a VACUUM,
+# which may renumber rowids)
+def rebuild_search_index() -> bool:
+    with transaction() as conn:
+        return create_search_index(conn)
+
+# Keyset pagination. A cursor is the sort key of the last row of a page, so
+# the next page is an index range scan starting right after it, whatever the
+# page number. Orders: "created" (newest first) and "priority" (1 first, then
+# newest first); id breaks ties so the order is total.
+PAGE_SIZE = 500
+
+ORDERS = {
+    "created": (
+        ("created_at", "id"),
+        "ORDER BY created_at DESC, id DESC",
+        "(created_at, id) < (?, ?)",
+    ),
+    "priority": (
+        ("priority", "created_at", "id"),
+        "ORDER BY priority ASC, created_at DESC, id DESC",
+        "(priority > ? OR (priority = ? AND (created_at, id) < (?, ?)))",
+    ),
+}
+
+# A cursor is the stored sort key (integers, then the id) as JSON, with the
+# id in its public form
+def encode_cursor(key: Tuple) -> str:
+    key = [*key[:-1], decode_id(key[-1])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str, order: str = "created") -> Tuple:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+    if (not isinstance(key, list) or len(key) != len(ORDERS[order][0])
+            or not all(isinstance(v, int) for v in key[:-1]) or not isinstance(key[-1], str)):
+        raise ValueError(f"Invalid cursor for order {order!r}: {cursor!r}")
+    return (*key[:-1], encode_id(key[-1]))
+
+def _keyset_params(order: str, key: Tuple) -> Tuple:
+    if order == "priority":
+        return (key[0], key[0], key[1], key[2])
+    return key
+
+# Compiling a TodoFilter. The SQL text depends only on which conditions are
+# given, never on their values: lists of statuses, priorities or tags are bound
+# as one JSON array and expanded with json_each. Queries of the same shape are
+# therefore the same statement, which SQLite prepares and plans once per
+# connection (see STATEMENT_CACHE_SIZE in connection.py).
+_IN_JSON = "IN (SELECT value FROM json_each(?))"
+
+def _list_param(values) -> str:
+    return json.dumps(list(values))
+
+# A tag condition on todos can run two ways. Driven from todo_tags, SQLite
+# reads every todo with the tag and sorts them: right for rare tags. As a probe
+# of todo_tags per todo while walking the index of the sort order, it stops
+# after `limit` matches, having read about limit * total / matching todos:
+# right for common tags. The tag counters (see stats()) tell which is cheaper.
+def _tag_clauses(conn, tags: List[str], match_all: bool, limit: Optional[int]) -> Tuple[List[str], List]:
+    counts = dict(_fetch(
+        conn, f"SELECT key, count FROM todo_counters WHERE (kind = 'tag' AND key {_IN_JSON}) OR kind = 'total'",
+        (_list_param(tags),)
+    ).fetchall())
+    total = counts.pop("", 0)
+    if match_all or len(tags) == 1:
+        # Rarest first; matches estimated taking the tags as independent
+        tags = sorted(tags, key=lambda t: counts.get(t, 0))
+        matching = total
+        for tag in tags:
+            matching *= counts.get(tag, 0) / total if total else 0
+    else:
+        matching = sum(counts.values())
+    probe = limit is not None and matching * matching > limit * total
+    if not match_all and len(tags) > 1:
+        if probe:
+            return [f"EXISTS (SELECT 1 FROM todo_tags WHERE todo_id = todos.pk AND tag {_IN_JSON})"], [_list_param(tags)]
+        return [f"pk IN (SELECT todo_id FROM todo_tags WHERE tag {_IN_JSON})"], [_list_param(tags)]
+    clauses, params = [], []
+    if not probe:
+        clauses.append("pk IN (SELECT todo_id FROM todo_tags WHERE tag = ?)")
+        params.append(tags[0])
+        tags = tags[1:]
+    if len(tags) == 1:
+        clauses.append("EXISTS (SELECT 1 FROM todo_tags WHERE tag = ? AND todo_id = todos.pk)")
+        params.append(tags[0])
+    elif tags:
+        clauses.append(f"(SELECT COUNT(*) FROM todo_tags WHERE todo_id = todos.pk AND tag {_IN_JSON}) = ?")
+        params.extend((_list_param(tags), len(tags)))
+    return clauses, params
+
+# Full-text condition: the FTS5 index when there is one, otherwise every word
+# in the title or description. Text without any words matches nothing.
+def _text_clauses(conn, text: str) -> Tuple[List[str], List]:
+    match = _fts_query(text)
+    if not match:
+        return ["0"], []
+    if _has_search_index(conn):
+        return ["rowid IN (SELECT rowid FROM todos_fts WHERE todos_fts MATCH ?)"], [match]
+    words = [w.replace('"', "").rstrip("*") for w in _SEARCH_TOKEN.findall(text) if w != "OR"]
+    words = [w for w in words if w]
+    return (["(title LIKE ? OR description LIKE ?)" for _ in words],
+            [p for w in words for p in (f"%{w}%", f"%{w}%")])
+
+# Accept any ISO-8601 timestamp and return it in the stored format (naive UTC)
+def normalize_timestamp(value: str) -> str:
+    try:
+        ts = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}") from None
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.isoformat()
+
+# A timestamp argument (any ISO-8601 text) as stored
+def _timestamp_param(value: str) -> int:
+    return encode_time(normalize_timestamp(value))
+
+_RANGES = (
+    ("priority_min", "priority >= ?", int),
+    ("priority_max", "priority <= ?", int),
+    ("created_after", "created_at > ?", _timestamp_param),
+    ("created_before", "created_at < ?", _timestamp_param),
+    ("updated_after", "updated_at > ?", _timestamp_param),
+    ("updated_before", "updated_at < ?", _timestamp_param),
+)
+
+# SQL conditions on todos (and their parameters) for a TodoFilter; `limit`
+# is the number of rows wanted, if the statement has a LIMIT
+def _filter_clauses(conn, where: TodoFilter, limit: Optional[int] = None) -> Tuple[List[str], List]:
+    clauses, params = [], []
+    for column, value in (("status", where.status), ("priority", where.priority)):
+        if isinstance(value, list):
+            clauses.append(f"{column} {_IN_JSON}")
+            params.append(_list_param(value))
+        elif value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    for name, sql, convert in _RANGES:
+        value = getattr(where, name)
+        if value is not None:
+            clauses.append(sql)
+            params.append(convert(value))
+    if where.title is not None:
+        clauses.append("title LIKE ?")
+        params.append(f"%{where.title}%")
+    tags_all = list(dict.fromkeys(([where.tag] if where.tag is not None else []) + (where.tags_all or [])))
+    for tags, match_all in ((tags_all, True), (list(dict.fromkeys(where.tags_any or [])), False)):
+        if tags:
+            tag_clauses, tag_params = _tag_clauses(conn, tags, match_all, limit)
+            clauses.extend(tag_clauses)
+            params.extend(tag_params)
+    if where.text is not None:
+        text_clauses, text_params = _text_clauses(conn, where.text)
+        clauses.extend(text_clauses)
+        params.extend(text_params)
+    return clauses, params
+
+# Compiled SELECTs by shape (conditions, order, continuing after a cursor)
+QUERY_CACHE_SIZE = 256
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _compile_select(clauses: Tuple[str, ...], order: str, keyset: bool) -> str:
+    _, order_sql, keyset_sql = ORDERS[order]
+    if keyset:
+        clauses += (keyset_sql,)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    return f"SELECT {ITEM_SQL} FROM todos {where}{order_sql} LIMIT ?"
+
+# The SELECT for one page; limit=None reads every matching row. `extra` is a
+# further condition (SQL clauses and their parameters) the rows must meet.
+def _select_page(conn, order: str, where: TodoFilter, after: Optional[Tuple], limit: Optional[int],
+                 extra: Optional[Tuple[List[str], List]] = None) -> Tuple[str, List]:
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order: {order!r} (expected one of {', '.join(ORDERS)})")
+    clauses, params = _filter_clauses(conn, where, limit)
+    if extra is not None:
+        clauses.extend(extra[0])
+        params.extend(extra[1])
+    if after is not None:
+        params.extend(_keyset_params(order, after))
+    return _compile_select(tuple(clauses), order, after is not None), params + [-1 if limit is None else limit]
+
+# Fetch one page of raw rows matching `where`, starting after `after`
+def _fetch_page(order: str, where: TodoFilter, after: Optional[Tuple], limit: int):
+    with _read() as conn:
+        sql, params = _select_page(conn, order, where, after, limit)
+        rows = _fetch(conn, sql, params).fetchall()
+    return rows, [COLUMNS.index(c) for c in ORDERS[order][0]]
+
+def _page_filter(status, priority, title, where: Optional[TodoFilter]) -> TodoFilter:
+    return where if where is not None else TodoFilter(status=status, priority=priority, title=title)
+
+# Lazily iterate pages of raw rows (plain tuples in COLUMNS order), for
+# callers that serialize rows without building TodoItems; same arguments as
+# iter_todos. Nothing is held open between pages.
+def iter_todo_rows(status: Optional[str] = None, priority: Optional[int] = None, title: Optional[str] = None,
+                   order: str = "created", after: Optional[str] = None, limit: Optional[int] = None,
+                   page_size: int = PAGE_SIZE, where: Optional[TodoFilter] = None) -> Iterator[List[Tuple]]:
+    where = _page_filter(status, priority, title, where)
+    key = decode_cursor(after, order) if after else None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        rows, key_columns = _fetch_page(order, where, key, size)
+        if rows:
+            yield rows
+        if len(rows) < size:
+            return
+        key = tuple(rows[-1][i] for i in key_columns)
+        if remaining is not None:
+            remaining -= len(rows)
+
+# Lazily iterate todos page by page; nothing is held open between pages.
+# `where` (a TodoFilter) takes the place of status, priority and title.
+def iter_todos(status: Optional[str] = None, priority: Optional[int] = None, title: Optional[str] = None,
+               order: str = "created", after: Optional[str] = None, limit: Optional[int] = None,
+               page_size: int = PAGE_SIZE, where: Optional[TodoFilter] = None) -> Iterator[TodoItem]:
+    for rows in iter_todo_rows(status, priority, title, order, after, limit, page_size, where):
+        yield from _rows_to_items(rows)
+
+# Return one page of todos and the cursor for the next page (None on the last page)
+def get_page(status: Optional[str] = None, priority: Optional[int] = None, title: Optional[str] = None,
+             order: str = "created", after: Optional[str] = None,
+             limit: int = PAGE_SIZE, where: Optional[TodoFilter] = None) -> Tuple[List[TodoItem], Optional[str]]:
+    if limit < 1:
+        raise ValueError(f"A page needs a limit of at least 1, not {limit}")
+    key = decode_cursor(after, order) if after else None
+    rows, key_columns = _fetch_page(order, _page_filter(status, priority, title, where), key, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(tuple(rows[-1][i] for i in key_columns))
+    return _rows_to_items(rows), next_cursor
+
+# Todos matching every given condition (the keyword arguments of TodoFilter,
+# or a TodoFilter as `where`), in `order`, at most `limit` of them; one SQL
+# statement per page, so only the rows returned are ever read:
+#     query(status=["TODO", "IN_PROGRESS"], priority_max=2, tags_any=["work", "home"],
+#           created_after="2024-01-01", limit=20)
+def query(order: str = "created", limit: Optional[int] = None, after: Optional[str] = None,
+          where: Optional[TodoFilter] = None, **filters) -> List[TodoItem]:
+    where = where if where is not None else TodoFilter(**filters)
+    return list(iter_todos(order=order, after=after, limit=limit, where=where))
+
+# The statement query() runs for the same arguments (its first page), its
+# parameters and SQLite's plan for it; "cached" tells whether the statement
+# had been compiled before
+def explain_query(order: str = "created", limit: Optional[int] = None, after: Optional[str] = None,
+                  where: Optional[TodoFilter] = None, **filters) -> Dict:
+    where = where if where is not None else TodoFilter(**filters)
+    key = decode_cursor(after, order) if after else None
+    hits = _compile_select.cache_info().hits
+    with _read() as conn:
+        sql, params = _select_page(conn, order, where, key, min(limit, PAGE_SIZE) if limit is not None else PAGE_SIZE)
+        plan = [row[-1] for row in _fetch(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+    return {"sql": sql, "params": params, "plan": plan, "cached": _compile_select.cache_info().hits > hits}
+
+# Columns set by a partial update: only the fields given in `data`
+def _update_assignments(data: TodoUpdate) -> Tuple[List[str], List]:
+    columns, params = [], []
+    if data.title is not None:
+        columns.append("title")
+        params.append(data.title)
+    if data.description is not None:
+        columns.append("description")
+        params.append(data.description)
+    if data.tags is not None:
+        columns.append("tags")
+        params.append(json.dumps(data.tags))
+    if data.status is not None:
+        columns.append("status")
+        params.append(data.status.value if isinstance(data.status, TodoStatus) else data.status)
+    if data.priority is not None:
+        columns.append("priority")
+        params.append(int(data.priority))
+    columns.append("updated_at")
+    params.append(_now())
+    return columns, params
+
+# One UPDATE of the changed columns; the new row comes back through RETURNING
+# (or a SELECT in the same transaction on older SQLite)
+def _update_row(conn, tid: str, data: TodoUpdate) -> Optional[Tuple]:
+    columns, params = _update_assignments(data)
+    sql = f"UPDATE todos SET {', '.join(c + '=?' for c in columns)} WHERE id=?"
+    key = encode_id(tid)
+    if HAS_RETURNING:
+        rows = _fetch(conn, f"{sql} RETURNING {ITEM_SQL}", (*params, key)).fetchall()
+    else:
+        if conn.execute(sql, (*params, key)).rowcount == 0:
+            return None
+        rows = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos WHERE id = ?", (key,)).fetchall()
+    return rows[0] if rows else None
+
+def _update_one(conn, tid: str, data: TodoUpdate) -> Optional[TodoItem]:
+    row = _update_row(conn, tid, data)
+    if row is None:
         return None
-    current = _row_to_item(row)
-    # Merge updates
-    title = data.title if data.title is not None else current.title
-    description = data.description if data.description is not None else current.description
-    tags = data.tags if data.tags is not None else current.tags
-    status = data.status if data.status is not None else current.status
-    priority = int(data.priority) if data.priority is not None else current.priority
-    updated_at = datetime.utcnow().isoformat()
+    _invalidate([tid])
+    return _row_to_item(row)
+
+def update_todo(tid: str, data: TodoUpdate) -> Optional[TodoItem]:
+    with transaction() as conn:
+        return _update_one(conn, tid, data)
+
+# Apply many (id, TodoUpdate) pairs in one transaction; missing ids give None
+def update_many(updates: Iterable[Tuple[str, TodoUpdate]]) -> List[Optional[TodoItem]]:
+    with transaction() as conn:
+        return [_update_one(conn, tid, data) for tid, data in updates]
+
+# Leave a tombstone for each todo matching `condition` (SQL on todos), so
+# delta exports can report the delete; call right before deleting the rows
+def _record_deletes(conn, condition: str, params=()):
     conn.execute(
-        "UPDATE todos SET title=?, description=?, tags=?, status=?, priority=?, updated_at=? WHERE id=?",
-        (title, description, json.dumps(tags), status, int(priority), updated_at, tid)
+        f"INSERT OR REPLACE INTO todo_tombstones (id, deleted_at) SELECT id, ? FROM todos WHERE {condition}",
+        (_now(), *params)
     )
-    conn.commit()
-    row2 = conn.execute("SELECT * FROM todos WHERE id = ?", (tid,)).fetchone()
-    conn.close()
-    return _row_to_item(row2)
 
 def delete_todo(tid: str) -> bool:
-    conn = _conn()
-    cur = conn.execute("DELETE FROM todos WHERE id = ?", (tid,))
-    conn.commit()
-    deleted = cur.rowcount > 0
-    conn.close()
-    return deleted
+    key = encode_id(tid)
+    with transaction() as conn:
+        _record_deletes(conn, "id = ?", (key,))
+        cur = conn.execute("DELETE FROM todos WHERE id = ?", (key,))
+        _invalidate([tid])
+    return cur.rowcount > 0
+
+# Id lists up to this long are sent as one IN (?, ...) list; longer ones
+# (SQLite caps the number of parameters per statement) go through a temp table
+BULK_IN_LIMIT = 500
+
+# Restrict a statement to `ids`, which may be any iterable, e.g. a generator
+# reading IDs from a file. Yields (SQL condition on todos, its parameters,
+# ids to invalidate or None for the whole cache). Long lists are streamed
+# into temp.bulk_ids, so any number of ids fits in one set-based statement.
+@contextmanager
+def _id_condition(conn, ids: Iterable[str]):
+    ids = iter(ids)
+    head = list(islice(ids, BULK_IN_LIMIT + 1))
+    if len(head) <= BULK_IN_LIMIT:
+        yield f"id IN ({','.join('?' for _ in head)})", [encode_id(tid) for tid in head], head
+        return
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id BLOB PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("DELETE FROM temp.bulk_ids")
+    conn.executemany("INSERT OR IGNORE INTO temp.bulk_ids (id) VALUES (?)",
+                     ((encode_id(tid),) for tid in chain(head, ids)))
+    try:
+        yield "id IN (SELECT id FROM temp.bulk_ids)", (), None
+    finally:
+        conn.execute("DELETE FROM temp.bulk_ids")
+
+# Bulk update status for multiple todos
+def bulk_update_status(ids: Iterable[str], status: str) -> int:
+    updated_at = _now()
+    with transaction() as conn, _id_condition(conn, ids) as (condition, params, touched):
+        cur = conn.execute(f"UPDATE todos SET status=?, updated_at=? WHERE {condition}", (status, updated_at, *params))
+        _invalidate(touched)
+    return cur.rowcount
+
+# Bulk delete todos by IDs
+def bulk_delete(ids: Iterable[str]) -> int:
+    with transaction() as conn, _id_condition(conn, ids) as (condition, params, touched):
+        _record_deletes(conn, condition, params)
+        cur = conn.execute(f"DELETE FROM todos WHERE {condition}", params)
+        _invalidate(touched)
+    return cur.rowcount
+
+# Bulk update priority for multiple todos
+def bulk_update_priority(ids: Iterable[str], priority: int) -> int:
+    updated_at = _now()
+    with transaction() as conn, _id_condition(conn, ids) as (condition, params, touched):
+        cur = conn.execute(f"UPDATE todos SET priority=?, updated_at=? WHERE {condition}",
+                           (priority, updated_at, *params))
+        _invalidate(touched)
+    return cur.rowcount
+
+# Set-based versions of the bulk operations: one statement changes every todo
+# matching `where` (a TodoFilter), without reading any ids. Todos that already
+# have the new value are left alone. An empty filter is refused rather than
+# taken to mean every todo.
+def _filter_condition(conn, where: TodoFilter) -> Tuple[str, List]:
+    if where.is_empty():
+        raise ValueError("A bulk operation needs at least one condition")
+    clauses, params = _filter_clauses(conn, where)
+    return " AND ".join(clauses), params
+
+def bulk_update_status_where(where: TodoFilter, status: str) -> int:
+    status = status.value if isinstance(status, TodoStatus) else status
+    with transaction() as conn:
+        condition, params = _filter_condition(conn, where)
+        cur = conn.execute(f"UPDATE todos SET status=?, updated_at=? WHERE {condition} AND status != ?",
+                           (status, _now(), *params, status))
+        _invalidate()
+    return cur.rowcount
+
+def bulk_update_priority_where(where: TodoFilter, priority: int) -> int:
+    with transaction() as conn:
+        condition, params = _filter_condition(conn, where)
+        cur = conn.execute(f"UPDATE todos SET priority=?, updated_at=? WHERE {condition} AND priority != ?",
+                           (int(priority), _now(), *params, int(priority)))
+        _invalidate()
+    return cur.rowcount
+
+def bulk_delete_where(where: TodoFilter) -> int:
+    with transaction() as conn:
+        condition, params = _filter_condition(conn, where)
+        _record_deletes(conn, condition, params)
+        cur = conn.execute(f"DELETE FROM todos WHERE {condition}", params)
+        _invalidate()
+    return cur.rowcount
+
+# List all unique tags
+def list_tags() -> List[str]:
+    with _read() as conn:
+        rows = conn.execute("SELECT DISTINCT tag FROM todo_tags ORDER BY tag").fetchall()
+    return [r["tag"] for r in rows]
+
+# Counts per status, priority and tag, read from the trigger-maintained
+# todo_counters table instead of scanning todos:
+# {"total": n, "status": {...}, "priority": {1: n, ...}, "tags": {...}}
+def stats() -> Dict:
+    result: Dict = {"total": 0, "status": {}, "priority": {}, "tags": {}}
+    with _read() as conn:
+        rows = _fetch(conn, "SELECT kind, key, count FROM todo_counters WHERE count > 0 ORDER BY kind, key").fetchall()
+    for kind, key, count in rows:
+        if kind == "total":
+            result["total"] = count
+        elif kind == "priority":
+            result["priority"][int(key)] = count
+        elif kind == "tag":
+            result["tags"][key] = count
+        else:
+            result[kind][key] = count
+    return result
+
+# Rebuild the counters from scratch, e.g. after editing the database by hand
+def recompute_stats() -> Dict:
+    with transaction() as conn:
+        for stmt in COUNTERS_RECOMPUTE_SQL:
+            conn.execute(stmt)
+    return stats()
+
+def _ids_with_tag(conn, tag: str) -> List[str]:
+    return [decode_id(r[0]) for r in conn.execute(
+        "SELECT t.id FROM todo_tags g JOIN todos t ON t.pk = g.todo_id WHERE g.tag = ?", (tag,)
+    )]
 
+# Rename a tag in all todos
+def rename_tag(old_tag: str, new_tag: str) -> int:
+    with transaction() as conn:
+        _invalidate(_ids_with_tag(conn, old_tag))
+        cur = conn.execute(
+            """
+            UPDATE todos SET tags = (
+                SELECT json_group_array(CASE WHEN value = ? THEN ? ELSE value END)
+                FROM (SELECT value FROM json_each(todos.tags) ORDER BY key)
+            ), updated_at = ?
+            WHERE pk IN (SELECT todo_id FROM todo_tags WHERE tag = ?)
+            """,
+            (old_tag, new_tag, _now(), old_tag)
+        )
+    return cur.rowcount
+
+# Delete a tag from all todos
+def delete_tag_from_all(tag: str) -> int:
+    with transaction() as conn:
+        _invalidate(_ids_with_tag(conn, tag))
+        cur = conn.execute(
+            """
+            UPDATE todos SET tags = (
+                SELECT json_group_array(value)
+                FROM (SELECT value FROM json_each(todos.tags) WHERE value != ? ORDER BY key)
+            ), updated_at = ?
+            WHERE pk IN (SELECT todo_id FROM todo_tags WHERE tag = ?)
+            """,
+            (tag, _now(), tag)
+        )
+    return cur.rowcount
+
+EXPORT_COLUMNS = COLUMNS
+EXPORT_BATCH_SIZE = 1000
+
+# Stream raw export rows (plain tuples in EXPORT_COLUMNS order) in fetchmany
+# batches; the single SELECT gives the whole export one consistent snapshot.
+def _iter_export_batches(batch_size: int):
+    with _read() as conn:
+        cur = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos ORDER BY created_at DESC, id DESC")
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+# Serialize one stored row as an export JSON object. tags is already JSON
+# text, so it is spliced in as-is instead of being decoded and re-encoded.
+# Strings are quoted with the encoder json.dumps itself uses, minus its
+# per-call overhead; ISO-8601 timestamps need no escaping.
+_quote = json.encoder.encode_basestring_ascii
+
+def _export_row_json(row) -> str:
+    tid, title, description, tags, status, priority, created_at, updated_at = row
+    q = _quote
+    return (
+        f'{{"id": {q(decode_id(tid))}, "title": {q(title)}, '
+        f'"description": {"null" if description is None else q(description)}, '
+        f'"tags": {tags or "[]"}, "status": {q(status)}, "priority": {int(priority)}, '
+        f'"created_at": "{time_text(created_at)}", "updated_at": "{time_text(updated_at)}"}}'
+    )
+
+# Export todos to a JSON array file, one object per line
+def export_todos_json(filepath: str, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    count = 0
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for rows in _iter_export_batches(batch_size):
+            f.write(("," if count else "") + "\n" + ",\n".join(_export_row_json(r) for r in rows))
+            count += len(rows)
+        f.write("\n]\n")
+    return count
+
+# Export todos to newline-delimited JSON (one object per line)
+def export_todos_ndjson(filepath: str, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    count = 0
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for rows in _iter_export_batches(batch_size):
+            f.write("\n".join(_export_row_json(r) for r in rows))
+            f.write("\n")
+            count += len(rows)
+    return count
+
+# Delta export. Only rows whose updated_at is after `since`, plus a
+# {"id", "deleted_at"} tombstone for every todo deleted after it, are written
+# (as NDJSON or a JSON array); since=None exports everything. Returns
+# (rows, tombstones, checkpoint), where checkpoint is the newest timestamp
+# written (or `since` when nothing changed) and is the `since` to pass next time.
+def export_todos_changes(filepath: str, since: Optional[str] = None, fmt: str = "ndjson",
+                         batch_size: int = EXPORT_BATCH_SIZE) -> Tuple[int, int, Optional[str]]:
+    if fmt not in ("json", "ndjson"):
+        raise ValueError(f"Delta export supports json and ndjson, not {fmt}")
+    if since is not None:
+        since = normalize_timestamp(since)
+    where, params = ("WHERE updated_at > ?", (encode_time(since),)) if since else ("", ())
+    tomb_where = "WHERE deleted_at > ?" if since else ""
+    rows = tombstones = 0
+    newest = None
+    with _read() as conn, open(filepath, 'w', encoding='utf-8') as f:
+        # One read transaction, so rows and tombstones come from the same snapshot
+        own_snapshot = not conn.in_transaction
+        if own_snapshot:
+            conn.execute("BEGIN")
+        try:
+            if fmt == "json":
+                f.write("[")
+
+            def write(chunk):
+                if fmt == "json":
+                    f.write(("," if rows + tombstones else "") + "\n" + ",\n".join(chunk))
+                else:
+                    f.write("".join(line + "\n" for line in chunk))
+
+            cur = _fetch(conn, f"SELECT {ITEM_SQL} FROM todos {where} ORDER BY updated_at, id", params)
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                write([_export_row_json(r) for r in batch])
+                rows += len(batch)
+                newest = max(newest or 0, batch[-1][7])
+            cur = _fetch(conn, f"SELECT id, deleted_at FROM todo_tombstones {tomb_where} ORDER BY deleted_at, id", params)
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                write([json.dumps({"id": decode_id(tid), "deleted_at": time_text(deleted_at)})
+                       for tid, deleted_at in batch])
+                tombstones += len(batch)
+                newest = max(newest or 0, batch[-1][1])
+            if fmt == "json":
+                f.write("\n]\n")
+        finally:
+            if own_snapshot:
+                conn.execute("COMMIT")
+    checkpoint = time_text(newest) if newest is not None else since
+    return rows, tombstones, checkpoint
+
+# Forget tombstones older than `before`; returns how many were removed. A
+# peer that has not synced since then will not learn about those deletes.
+def purge_tombstones(before: str) -> int:
+    with transaction() as conn:
+        return conn.execute("DELETE FROM todo_tombstones WHERE deleted_at < ?", (_timestamp_param(before),)).rowcount
+
+# Import todos from JSON file
+def import_todos_json(filepath: str, **kwargs):
+    from .importer import import_file
+    return import_file(filepath, "json", **kwargs)
+
+# Import todos from newline-delimited JSON file
+def import_todos_ndjson(filepath: str, **kwargs):
+    from .importer import import_file
+    return import_file(filepath, "ndjson", **kwargs)
+
+# Export todos to CSV file
+def export_todos_csv(filepath: str, batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    count = 0
+    with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in _iter_export_batches(batch_size):
+            writer.writerows(map(decode_row, rows))
+            count += len(rows)
+    return count
+
+# Import todos from CSV file
+def import_todos_csv(filepath: str, **kwargs):
+    from .importer import import_file
+    return import_file(filepath, "csv", **kwargs)